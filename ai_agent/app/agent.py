@@ -1,11 +1,43 @@
-from datetime import datetime
-from langchain.agents import initialize_agent, Tool
-from langchain_groq import ChatGroq
+from datetime import datetime, timedelta
+from langchain_core.tools import Tool
 from dotenv import load_dotenv
 import os
 import json
+import logging
+import threading
+from typing import List, Optional, Tuple
 from .database import db
-from .config import GROQ_API_KEY, GROQ_MODEL
+from .idempotency import run_idempotent, IdempotencyError
+from .config import (
+    GROQ_MODEL, require_groq_api_key, AGENT_VERBOSE,
+    LLM_CACHE_ENABLED, LLM_CACHE_PATH, LLM_CACHE_TTL, LLM_CACHE_MAX_ENTRIES, LLM_CACHE_MAX_BYTES,
+    REBUILD_WORKERS, NAME_MATCH_MIN_SCORE,
+)
+from .llm_cache import SQLiteLLMCache, tools_fingerprint
+from .metrics import instrument_tools
+from .rebuild import run_rebuild, format_rebuild_stats
+from .rebuild_sharded import run_sharded_rebuild
+from .cache import cached, invalidate_skus, SEARCH_TAG, TASKS_TAG
+from .text import search_key
+from .pagination import (
+    page_transactions, page_inventories, page_inventory_search, fields_projection, TRANSACTION_FIELDS, TASK_FIELDS,
+)
+from .task_query import page_tasks
+from .dispatcher import claim_task, claim_pick_batch, complete_task, release_task, heartbeat, LeaseError
+from .search_index import product_index, search_products_scored
+from .stock import (
+    apply_stock_delta, get_balance, reserve_stock, release_stock, InsufficientStockError,
+)
+from .rollups import apply_rollups, movement_series, movement_totals, parse_period
+from .forecast import run_forecast
+from .reconcile import reconcile_inventory, verify_sample, format_reconcile_stats, format_verify_result
+from .models.transation import Transaction
+from .models.inventory import Inventory
+from .models.task import Task
+from .formatters import (
+    format_stock, format_history, format_transactions, format_inventories,
+    format_open_tasks, format_task_search, format_claimed, format_movements, format_forecast,
+)
 import re
 from bson.objectid import ObjectId
 
@@ -14,6 +46,8 @@ from bson.objectid import ObjectId
 # ============================================================
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 # ============================================================
 # MongoDB Collections
 # ============================================================
@@ -22,66 +56,62 @@ tasks = db["tasks"]
 inventories = db["inventories"]
 
 # ============================================================
-# Tool 1: Tính tồn kho hiện tại theo SKU (và update inventories)
+# Tool 1: Tồn kho hiện tại theo SKU (inventories / stock_balances)
 # ============================================================
 
-def get_stock_by_sku(sku: str) -> str:
+@cached(tags=lambda sku, *a, **k: [sku])
+def get_stock_by_sku(sku: str, wh: str = None) -> Optional[Inventory]:
+    if wh:
+        bal = get_balance(sku, wh)
+        return Inventory.from_doc({"sku": sku, "qty": bal["qty"], "wh": wh}) if bal else None
     inv = inventories.find_one({"sku": sku}, {"_id": 0, "sku": 1, "qty": 1})
-    if inv:
-        return f"📦 Tồn kho SKU {sku}: {inv['qty']} sản phẩm."
-    else:
-        return f"❌ Không tìm thấy tồn kho cho SKU {sku}."
+    return Inventory.from_doc(inv) if inv else None
 
 # ============================================================
-# Tool 1b: Tính tồn kho theo tên (và update inventories)
+# Tool 1b: Tồn kho theo tên (tìm SKU rồi đọc như Tool 1, không ghi)
 # ============================================================
 def get_stock_by_name(name: str) -> str:
-    item = inventories.find_one({"name": name})
+    projection = {"_id": 0, "sku": 1, "name": 1, "uom": 1}
+    item = inventories.find_one({"name_lc": search_key(name)}, projection)
+    label = name
+    if not item:
+        # Không khớp chính xác → chỉ dùng kết quả gần đúng khi đủ chắc và không có ứng viên ngang điểm,
+        # ngược lại đưa danh sách gợi ý
+        ranked = search_products_scored(name, limit=5)
+        if (ranked and ranked[0][1] >= NAME_MATCH_MIN_SCORE
+                and (len(ranked) == 1 or ranked[1][1] < ranked[0][1])):
+            item = inventories.find_one({"sku": ranked[0][0]}, projection)
+        elif ranked:
+            names = {d["sku"]: d.get("name") or d["sku"]
+                     for d in inventories.find({"sku": {"$in": [sku for sku, _ in ranked]}}, projection)}
+            options = "\n".join(f"- {names.get(sku, sku)} (SKU: {sku})" for sku, _ in ranked)
+            return f"❓ Không tìm thấy chính xác sản phẩm '{name}'. Có phải bạn muốn hỏi:\n{options}"
+        # Khớp gần đúng → báo tên thật của sản phẩm, không phải chuỗi người dùng gõ
+        label = (item or {}).get("name") or (item or {}).get("sku")
     if not item:
         return f"❌ Không tìm thấy sản phẩm '{name}' trong kho."
     sku = item["sku"]
 
-    pipeline = [
-        {"$match": {"sku": sku}},
-        {"$group": {
-            "_id": "$sku",
-            "inbound": {"$sum": {"$cond": [{"$eq": ["$type", "inbound"]}, "$qty", 0]}},
-            "outbound": {"$sum": {"$cond": [{"$eq": ["$type", "outbound"]}, "$qty", 0]}}
-        }},
-        {"$project": {
-            "sku": "$_id",
-            "stock": {"$subtract": ["$inbound", "$outbound"]}
-        }}
-    ]
-    result = list(transactions.aggregate(pipeline))
-    if result:
-        new_qty = result[0]["stock"]
-        inventories.update_one(
-            {"sku": sku},
-            {"$set": {"qty": new_qty, "updatedAt": datetime.utcnow()}}
-        )
-        return f"📦 Sản phẩm '{name}' (SKU: {sku}) hiện còn {new_qty} {item['uom']} trong kho."
-    else:
-        return f"❌ Không tìm thấy transaction log cho sản phẩm '{name}' (SKU: {sku})."
+    # inventories là bộ đếm do các write path giữ (apply_stock_delta/reserve_stock) → chỉ đọc, đi qua cache
+    stock = get_stock_by_sku(sku)
+    if stock is None:
+        return f"❌ Không tìm thấy tồn kho cho sản phẩm '{label}' (SKU: {sku})."
+    return f"📦 Sản phẩm '{label}' (SKU: {sku}) hiện còn {stock.qty} {item.get('uom') or 'EA'} trong kho."
 
 # ============================================================
 # Tool 2: Lấy lịch sử giao dịch gần nhất
 # ============================================================
-def get_transaction_history(sku: str, limit: int = 5) -> str:
-    cursor = transactions.find({"sku": sku}).sort("at", -1).limit(limit)
-    logs = []
-    for t in cursor:
-        logs.append(
-            f"{t['at'].strftime('%Y-%m-%d %H:%M:%S')} - {t['type']} {t['qty']} "
-            f"(by {t['by']}, wh: {t['wh']}, note: {t.get('note','')})"
-        )
-    return "\n".join(logs) if logs else f"❌ Không có giao dịch nào cho {sku}."
+@cached(tags=lambda sku, *a, **k: [sku])
+def get_transaction_history(sku: str, limit: int = 5) -> List[Transaction]:
+    cursor = transactions.find({"sku": sku}, fields_projection(TRANSACTION_FIELDS)).sort("at", -1).limit(limit)
+    return [Transaction.from_doc(t) for t in cursor]
 
 
 # ============================================================
 # Tool 3: Ghi nhận inbound (cập nhật inventories ngay)
 # ============================================================
-def add_inbound_transaction(sku: str, qty: int, wh: str, by: str, note: str = "") -> str:
+def add_inbound_transaction(sku: str, qty: int, wh: str, by: str, note: str = "",
+                            idempotency_key: str = None) -> str:
     doc = {
         "sku": sku,
         "type": "inbound",
@@ -89,27 +119,30 @@ def add_inbound_transaction(sku: str, qty: int, wh: str, by: str, note: str = ""
         "wh": wh,
         "at": datetime.utcnow(),
         "by": by,
+        "by_lc": search_key(by),
         "note": note
     }
-    transactions.insert_one(doc)
-
-    # Cập nhật trực tiếp inventory (cộng thêm qty)
-    inventories.update_one(
-        {"sku": sku},
-        {
-            "$inc": {"qty": int(qty)},
-            "$set": {"updatedAt": datetime.utcnow()}
-        },
-        upsert=True  # nếu chưa có thì tạo mới
-    )
 
-    return f"✅ Đã ghi nhận nhập {qty} sản phẩm (SKU {sku}) vào kho {wh} bởi {by}."
+    # Ghi transaction + cập nhật tồn tổng và tồn theo kho trong cùng 1 Mongo transaction
+    def apply(session):
+        transactions.insert_one(doc, session=session)
+        apply_stock_delta(sku, wh, int(qty), doc["at"], session=session)
+        apply_rollups([doc], session=session)
+        return f"✅ Đã ghi nhận nhập {qty} sản phẩm (SKU {sku}) vào kho {wh} bởi {by}."
+
+    # Có idempotency_key → request gửi lại nhận kết quả cũ, không ghi lần hai
+    result = run_idempotent(apply, idempotency_key, "inbound", [sku, int(qty), wh, by, note])
+    invalidate_skus([sku])
+    product_index.mark_stale()
+
+    return result
 
 
 # ============================================================
 # Tool 4: Ghi nhận outbound (cập nhật inventories ngay)
 # ============================================================
-def add_outbound_transaction(sku: str, qty: int, wh: str, by: str, note: str = "") -> str:
+def add_outbound_transaction(sku: str, qty: int, wh: str, by: str, note: str = "",
+                             idempotency_key: str = None) -> str:
     doc = {
         "sku": sku,
         "type": "outbound",
@@ -117,37 +150,54 @@ def add_outbound_transaction(sku: str, qty: int, wh: str, by: str, note: str = "
         "wh": wh,
         "at": datetime.utcnow(),
         "by": by,
+        "by_lc": search_key(by),
         "note": note
     }
-    transactions.insert_one(doc)
-
-    # Cập nhật trực tiếp inventory (trừ qty)
-    inventories.update_one(
-        {"sku": sku},
-        {
-            "$inc": {"qty": -int(qty)},
-            "$set": {"updatedAt": datetime.utcnow()}
-        },
-        upsert=True
-    )
 
-    return f"✅ Đã ghi nhận xuất {qty} sản phẩm (SKU {sku}) từ kho {wh} bởi {by}."
+    # Trừ tồn có điều kiện (qty >= n) rồi mới ghi transaction, trong cùng 1 Mongo transaction:
+    # không đủ hàng → abort, không có transaction log nào được ghi
+    def apply(session):
+        reserve_stock(sku, wh, int(qty), doc["at"], session=session)
+        try:
+            transactions.insert_one(doc, session=session)
+            apply_rollups([doc], session=session)
+        except Exception:
+            if session is None:
+                # mongod standalone: không có rollback → hoàn lại phần đã trừ
+                release_stock(sku, wh, int(qty), doc["at"])
+            raise
+        return f"✅ Đã ghi nhận xuất {qty} sản phẩm (SKU {sku}) từ kho {wh} bởi {by}."
+
+    try:
+        result = run_idempotent(apply, idempotency_key, "outbound", [sku, int(qty), wh, by, note])
+    except InsufficientStockError as e:
+        return f"❌ {e}"
+    invalidate_skus([sku])
+    product_index.mark_stale()
+
+    return result
 
 # ============================================================
 # Tool 5 & 6: Wrapper inbound / outbound
 # ============================================================
-def inbound_tool_wrapper(args: str) -> str:
+# Câu tiếng Việt: "Nhập kho 10 cái SKU LT001 vào kho WH01 bởi An, ghi chú ..."
+INBOUND_PATTERN = re.compile(
+    r"Nhập kho\s+(\d+)\s+(?:cái|đơn vị|sản phẩm)?\s*SKU\s+(\w+)\s+(?:vào|tại)\s+kho\s+(\w+)\s+bởi\s+(\w+)(?:,\s*ghi chú\s*(.*))?",
+    re.IGNORECASE,
+)
+OUTBOUND_PATTERN = re.compile(
+    r"Xuất kho\s+(\d+)\s+(?:cái|đơn vị|sản phẩm)?\s*SKU\s+(\w+)\s+(?:ra|từ|tại)\s+kho\s+(\w+)\s+bởi\s+(?:nhân viên\s+)?(\w+)(?:,\s*ghi chú\s*(.*))?",
+    re.IGNORECASE,
+)
+
+def inbound_tool_wrapper(args: str, idempotency_key: str = None) -> str:
     try:
         # Nếu là JSON string
         if args.strip().startswith("{"):
             data = json.loads(args)
         else:
             # Nếu là tiếng Việt tự nhiên → regex parse (ưu tiên trước)
-            match = re.search(
-                r"Nhập kho\s+(\d+)\s+(?:cái|đơn vị|sản phẩm)?\s*SKU\s+(\w+)\s+(?:vào|tại)\s+kho\s+(\w+)\s+bởi\s+(\w+)(?:,\s*ghi chú\s*(.*))?",
-                args,
-                re.IGNORECASE,
-            )
+            match = INBOUND_PATTERN.search(args)
             if match:
                 qty, sku, wh, by, note = match.groups()
                 data = {
@@ -173,25 +223,24 @@ def inbound_tool_wrapper(args: str) -> str:
 
         # Chuẩn hóa và lưu
         return add_inbound_transaction(
-            data["sku"], int(data["quantity"]), data["warehouse"], data["by"], data.get("note", "")
+            data["sku"], int(data["quantity"]), data["warehouse"], data["by"], data.get("note", ""),
+            idempotency_key=idempotency_key or data.get("idempotency_key")
         )
 
+    except IdempotencyError:
+        raise   # endpoint trả 409/422
     except Exception as e:
         return f"❌ Lỗi xử lý inbound: {e}"
 
 
-def outbound_tool_wrapper(args: str) -> str:
+def outbound_tool_wrapper(args: str, idempotency_key: str = None) -> str:
     try:
         # Nếu là JSON string
         if args.strip().startswith("{"):
             data = json.loads(args)
         else:
             # Nếu là tiếng Việt tự nhiên → regex parse (ưu tiên trước)
-            match = re.search(
-                r"Xuất kho\s+(\d+)\s+(?:cái|đơn vị|sản phẩm)?\s*SKU\s+(\w+)\s+(?:ra|từ|tại)\s+kho\s+(\w+)\s+bởi\s+(?:nhân viên\s+)?(\w+)(?:,\s*ghi chú\s*(.*))?",
-                args,
-                re.IGNORECASE,
-            )
+            match = OUTBOUND_PATTERN.search(args)
             if match:
                 qty, sku, wh, by, note = match.groups()
                 data = {
@@ -217,9 +266,12 @@ def outbound_tool_wrapper(args: str) -> str:
 
         # Chuẩn hóa và lưu
         return add_outbound_transaction(
-            data["sku"], int(data["quantity"]), data["warehouse"], data["by"], data.get("note", "")
+            data["sku"], int(data["quantity"]), data["warehouse"], data["by"], data.get("note", ""),
+            idempotency_key=idempotency_key or data.get("idempotency_key")
         )
 
+    except IdempotencyError:
+        raise   # endpoint trả 409/422
     except Exception as e:
         return f"❌ Lỗi xử lý outbound: {e}"
 
@@ -227,52 +279,27 @@ def outbound_tool_wrapper(args: str) -> str:
 # Tool 7: Tìm kiếm transactions
 # ============================================================
 
-def search_transactions(user: str = None, wh: str = None, sku: str = None, limit: int = 10):
-    q = {}
-    if user:
-        q["by"] = {"$regex": f"^{user}$", "$options": "i"}  # so khớp không phân biệt hoa/thường
-    if wh:
-        q["wh"] = wh
-    if sku:
-        q["sku"] = sku
-
-    cursor = transactions.find(q).sort("at", -1).limit(limit)
-    results = []
-    for tx in cursor:
-        results.append(
-            f"{tx['at'].strftime('%Y-%m-%d %H:%M:%S')} | {tx['type']} {tx['qty']} "
-            f"(SKU {tx['sku']}, Kho: {tx['wh']}, By: {tx['by']}, Note: {tx.get('note','')})"
-        )
-
-    return "\n".join(results) if results else "❌ Không tìm thấy giao dịch phù hợp."
+def search_transactions(user: str = None, wh: str = None, sku: str = None, limit: int = 10,
+                        cursor: str = None, projection: dict = None) -> Tuple[List[Transaction], Optional[str]]:
+    # user so khớp chính xác trên by_lc; phân trang keyset theo (at, _id) với cursor token
+    docs, next_cursor = page_transactions(user=user, wh=wh, sku=sku, limit=limit, cursor=cursor,
+                                          projection=projection)
+    return [Transaction.from_doc(tx) for tx in docs], next_cursor
 
 # ============================================================
 # Tool 10: Tìm kiếm sản phẩm trong inventories (có hình ảnh)
 # ============================================================
-def search_inventories(query: str = "", wh: str = None, sku: str = None, limit: int = 20) -> str:
-    q = {}
-    if wh:
-        q["wh"] = wh
-    if sku:
-        q["sku"] = sku
+@cached(tags=lambda *a, **k: [SEARCH_TAG])
+def search_inventories(query: str = "", wh: str = None, sku: str = None, limit: int = 20,
+                       cursor: str = None) -> Tuple[List[Inventory], Optional[str]]:
     if query:
-        # Tìm kiếm theo tên gần đúng (case-insensitive)
-        q["name"] = {"$regex": query, "$options": "i"}
-
-    cursor = inventories.find(q).limit(limit)
-    results = []
-    for item in cursor:
-        line = (
-            f"📦 {item.get('name','(no name)')} (SKU: {item.get('sku')})\n"
-            f"   ➡ Số lượng: {item.get('qty',0)} {item.get('uom','EA')}\n"
-            f"   ➡ Kho: {item.get('wh','?')} - Vị trí: {item.get('location','?')}\n"
-        )
-        # Nếu có imageUrl thì hiển thị
-        if item.get("imageUrl"):
-            line += f"   🖼 Ảnh: {item['imageUrl']}\n"
-        results.append(line)
+        # Tìm theo tên qua chỉ mục trong bộ nhớ (không dấu, gần đúng, có xếp hạng); có kho → số lượng theo kho
+        items, next_cursor = page_inventory_search(query, wh=wh, sku=sku, limit=limit, cursor=cursor)
+    else:
+        # Liệt kê theo SKU/kho: phân trang keyset (sku, _id); có kho → số lượng theo kho
+        items, next_cursor = page_inventories(wh=wh, sku=sku, limit=limit, cursor=cursor)
 
-    return "\n".join(results) if results else "❌ Không tìm thấy sản phẩm phù hợp."
+    return [Inventory.from_doc(item) for item in items], next_cursor
 # ============================================================
 # Tool 11: Lấy danh sách task đang mở
 # ============================================================
@@ -294,74 +321,40 @@ def search_tasks(sku: str = None, warehouse: str = None, assignee: str = None):
 # ============================================================
 # Tool 8: Rebuild inventory toàn bộ (update inventories)
 # ============================================================
-def rebuild_inventory() -> str:
-    skus = transactions.distinct("sku")
-    updated = 0
-    for sku in skus:
-        pipeline = [
-            {"$match": {"sku": sku}},
-            {"$group": {"_id": "$sku",
-                        "inbound": {"$sum": {"$cond": [{"$eq": ["$type", "inbound"]}, "$qty", 0]}},
-                        "outbound": {"$sum": {"$cond": [{"$eq": ["$type", "outbound"]}, "$qty", 0]}}
-                        }},
-            {"$project": {"sku": "$_id", "stock": {"$subtract": ["$inbound", "$outbound"]}}}
-        ]
-        result = list(transactions.aggregate(pipeline))
-        if result:
-            stock = result[0]["stock"]
-            item = inventories.find_one({"sku": sku})
-            if item:
-                inventories.update_one({"sku": sku}, {"$set": {"qty": stock, "updatedAt": datetime.utcnow()}})
-            else:
-                inventories.insert_one({"sku": sku, "name": sku, "qty": stock, "uom": "EA",
-                                        "wh": "UNKNOWN", "location": "UNKNOWN", "exp": None,
-                                        "imageUrl": "", "updatedAt": datetime.utcnow()})
-            updated += 1
-    return f"✅ Đã cập nhật tồn kho cho {updated} SKU dựa trên transaction log."
+def _rebuild(batch_size: int = None, workers: int = None) -> dict:
+    # workers > 1 → chia dải SKU cho nhiều tiến trình (app/rebuild_sharded.py)
+    workers = workers or REBUILD_WORKERS
+    if workers > 1:
+        return run_sharded_rebuild(workers, batch_size=batch_size, balances=True)
+    return run_rebuild(batch_size=batch_size, balances=True)
+
+def rebuild_inventory(batch_size: int = None, workers: int = None) -> str:
+    stats = _rebuild(batch_size, workers)
+    return f"✅ Đã cập nhật tồn kho cho {format_rebuild_stats(stats)} dựa trên transaction log."
 
 # ============================================================
 # Tool 9: Rebuild & Sync nâng cao (toàn bộ inventories)
 # ============================================================
-def rebuild_and_sync_inventory() -> str:
-    skus = transactions.distinct("sku")
-    updated = 0
-    for sku in skus:
-        pipeline = [
-            {"$match": {"sku": sku}},
-            {"$group": {"_id": "$sku",
-                        "inbound": {"$sum": {"$cond": [{"$eq": ["$type", "inbound"]}, "$qty", 0]}},
-                        "outbound": {"$sum": {"$cond": [{"$eq": ["$type", "outbound"]}, "$qty", 0]}}
-                        }},
-            {"$project": {"sku": "$_id", "stock": {"$subtract": ["$inbound", "$outbound"]}}}
-        ]
-        result = list(transactions.aggregate(pipeline))
-        if not result: 
-            continue
-        stock = result[0]["stock"]
-        item = inventories.find_one({"sku": sku})
-        if item:
-            inventories.update_one({"sku": sku}, {"$set": {"qty": stock, "updatedAt": datetime.utcnow()}})
-        else:
-            inventories.insert_one({"sku": sku, "name": sku, "qty": stock, "uom": "EA",
-                                    "wh": "UNKNOWN", "location": "UNKNOWN", "exp": None,
-                                    "imageUrl": "", "updatedAt": datetime.utcnow()})
-        updated += 1
-    return f"✅ Đã đồng bộ và cập nhật tồn kho cho {updated} SKU."
+def rebuild_and_sync_inventory(batch_size: int = None, workers: int = None) -> str:
+    stats = _rebuild(batch_size, workers)
+    return f"✅ Đã đồng bộ và cập nhật tồn kho cho {format_rebuild_stats(stats)}."
 
 # ============================================================
 # Wrapper cho các Tool
 # ============================================================
 def stock_tool(args: str) -> str:
-    sku = args.strip()
-    if not sku:
+    # Hỗ trợ "LT001", "LT001,WH02" hoặc "LT001 kho WH02"
+    parts = [p for p in re.split(r"[,\s]+|\bkho\b", args.strip(), flags=re.IGNORECASE) if p]
+    if not parts:
         return " Bạn muốn kiểm tra tồn kho của sản phẩm nào? Vui lòng cung cấp mã SKU."
-    return get_stock_by_sku(sku)
+    sku, wh = parts[0], parts[1] if len(parts) > 1 else None
+    return format_stock(get_stock_by_sku(sku, wh), sku, wh)
 
 def transaction_history_tool(args: str) -> str:
     sku = args.strip()
     if not sku:
         return " Bạn muốn xem lịch sử giao dịch của sản phẩm nào? Vui lòng cung cấp mã SKU."
-    return get_transaction_history(sku)
+    return format_history(get_transaction_history(sku), sku)
 
 def search_transactions_tool(args: str) -> str:
     try:
@@ -375,30 +368,38 @@ def search_transactions_tool(args: str) -> str:
             match = re.search(r"(?i)giao dịch.*user\s+(\w+)", args)
         if match:
             user = match.group(1).strip()
-            return search_transactions(user=user)
+            return format_transactions(*search_transactions(user=user))
 
         # 2. Tìm giao dịch theo kho + SKU
         match = re.search(r"(?i)giao dịch.*kho\s+(\w+).*sku\s+(\w+)", args)
         if match:
             wh = match.group(1).strip()
             sku = match.group(2).strip()
-            return search_transactions(wh=wh, sku=sku)
+            return format_transactions(*search_transactions(wh=wh, sku=sku))
 
         return "❌ Không hiểu yêu cầu tìm giao dịch."
 
     except Exception as e:
         return f"❌ Lỗi xử lý tìm kiếm giao dịch: {e}"
-def rebuild_inventory_wrapper(args: str = "") -> str:
+def rebuild_inventory_wrapper(args: str = "", batch_size: int = None, workers: int = None) -> str:
     confirm = args.strip().lower()
     if confirm not in ["yes", "y", "ok", "đồng ý", "xác nhận"]:
         return "⚠️ Bạn có chắc muốn rebuild tồn kho toàn bộ từ transaction log không? Trả lời 'yes' để tiếp tục."
-    return rebuild_inventory()
+    return rebuild_inventory(batch_size, workers)
 
-def rebuild_and_sync_inventory_wrapper(args: str = "") -> str:
+def rebuild_and_sync_inventory_wrapper(args: str = "", batch_size: int = None, workers: int = None) -> str:
     confirm = args.strip().lower()
     if confirm not in ["yes", "y", "ok", "đồng ý", "xác nhận"]:
         return "⚠️ Bạn có chắc muốn đồng bộ inventory toàn bộ từ transaction log không? Trả lời 'yes' để tiếp tục."
-    return rebuild_and_sync_inventory()
+    return rebuild_and_sync_inventory(batch_size, workers)
+
+def reconcile_inventory_wrapper(args: str = "") -> str:
+    """Đối soát tăng dần; 'kiểm tra N' → kiểm tra thêm N SKU ngẫu nhiên."""
+    result = format_reconcile_stats(reconcile_inventory())
+    match = re.search(r"(?i)(?:kiểm tra|verify)\s*(\d+)", args or "")
+    if match:
+        result += "\n" + format_verify_result(verify_sample(int(match.group(1))))
+    return result
 def search_inventories_tool(args: str) -> str:
     try:
         args = args.strip()
@@ -408,12 +409,13 @@ def search_inventories_tool(args: str) -> str:
         # Nếu input là JSON thì parse bình thường
         if args.startswith("{"):
             params = json.loads(args)
-            return search_inventories(
+            return format_inventories(*search_inventories(
                 query=params.get("query"),
                 wh=params.get("wh"),
                 sku=params.get("sku"),
-                limit=int(params.get("limit", 20))
-            )
+                limit=int(params.get("limit", 20)),
+                cursor=params.get("cursor")
+            ))
 
         # ================================
         # Regex tiếng Việt
@@ -423,25 +425,25 @@ def search_inventories_tool(args: str) -> str:
         match = re.search(r"(?i)(liệt kê|danh sách).*kho\s+(\w+)", args)
         if match:
             wh = match.group(2)
-            return search_inventories(wh=wh)
+            return format_inventories(*search_inventories(wh=wh))
 
         # 2. Tìm theo tên sản phẩm chứa ...
         match = re.search(r"(?i)(có sản phẩm nào.*|tìm sản phẩm).*['\"]?([\w\s]+)['\"]?", args)
         if match:
             query = match.group(2).strip()
-            return search_inventories(query=query)
+            return format_inventories(*search_inventories(query=query))
 
         # 3. Tìm theo SKU (form: "mã MS001", "SKU SP123")
         match = re.search(r"(?i)(mã|sku|sản phẩm)\s*([A-Za-z0-9\-]+)", args)
         if match:
             sku = match.group(2).strip()
-            return search_inventories(sku=sku, limit=1)
+            return format_inventories(*search_inventories(sku=sku, limit=1))
 
         # 4. Tìm theo tên đầy đủ (form: "thông tin sản phẩm <tên>")
         match = re.search(r"(?i)(thông tin|chi tiết|cho tôi biết).*(sản phẩm)\s+([\w\s]+)", args)
         if match:
             query = match.group(3).strip()
-            return search_inventories(query=query, limit=5)
+            return format_inventories(*search_inventories(query=query, limit=5))
 
         return "❌ Không hiểu yêu cầu tìm kiếm sản phẩm."
 
@@ -453,93 +455,192 @@ def search_transactions_tool(args: str) -> str:
         if not args:
             return "❓ Bạn muốn tìm giao dịch theo user hay theo kho+SKU?"
 
+        # JSON filter: {"by":"...","wh":"...","sku":"...","limit":5,"cursor":"..."}
+        if args.startswith("{"):
+            params = json.loads(args)
+            return format_transactions(*search_transactions(
+                user=params.get("by") or params.get("user"),
+                wh=params.get("wh"),
+                sku=params.get("sku"),
+                limit=int(params.get("limit", 10)),
+                cursor=params.get("cursor")
+            ))
+
         # 1. Tìm giao dịch theo user
         match = re.search(r"(?i)(giao dịch).*user\s+(\w+)", args)
         if match:
             user = match.group(2).strip()
-            return search_transactions(user=user)
+            return format_transactions(*search_transactions(user=user))
 
         # 2. Tìm giao dịch theo kho + SKU
         match = re.search(r"(?i)(giao dịch).*kho\s+(\w+).*sku\s+(\w+)", args)
         if match:
             wh = match.group(2).strip()
             sku = match.group(3).strip()
-            return search_transactions(wh=wh, sku=sku)
+            return format_transactions(*search_transactions(wh=wh, sku=sku))
 
         return "❌ Không hiểu yêu cầu tìm giao dịch."
 
     except Exception as e:
         return f"❌ Lỗi xử lý tìm kiếm giao dịch: {e}"
-def get_open_tasks(recent: bool = False):
-    try:
-        query = {"status": "open"}
-        cursor = tasks.find(query)
-
-        if recent:
-            cursor = cursor.sort("created_at", -1).limit(5)
-
-        docs = list(cursor)
-        if not docs:
-            return "✅ Không có task nào đang mở."
-
-        result = "📋 Danh sách task đang mở:\n"
-        for t in docs:
-            due = t.get("due_at")
-            if isinstance(due, datetime):
-                due_str = due.strftime("%d-%m-%Y %H:%M")
-            elif isinstance(due, str):
-                try:
-                    due_str = datetime.fromisoformat(due).strftime("%d-%m-%Y %H:%M")
-                except:
-                    due_str = due
-            else:
-                due_str = "N/A"
-
-            result += f"- {t.get('_id')}: {t.get('title','(no title)')} (Hạn: {due_str})\n"
+@cached(tags=lambda *a, **k: [TASKS_TAG])
+def get_open_tasks(recent: bool = False, limit: int = 20, cursor: str = None) -> Tuple[List[Task], Optional[str]]:
+    """Task đang mở: ưu tiên cao → hạn sớm (phân trang keyset); recent=True → 5 task tạo gần nhất."""
+    if recent:
+        found = tasks.find({"status": "open"}, fields_projection(TASK_FIELDS)).sort("created_at", -1).limit(5)
+        return [Task.from_doc(t) for t in found], None
+    docs, next_cursor = page_tasks(limit=limit, cursor=cursor, status="open")
+    return [Task.from_doc(t) for t in docs], next_cursor
+
+@cached(tags=lambda *a, **k: [TASKS_TAG])
+def search_tasks(sku: str = None, wh: str = None, assignee: str = None, status: str = None,
+                 type: str = None, priority: str = None, due_after: datetime = None,
+                 due_before: datetime = None, limit: int = 20,
+                 cursor: str = None) -> Tuple[List[Task], Optional[str]]:
+    """Task khớp mọi filter được chỉ định (payload.sku, payload.wh, ...), cùng thứ tự với get_open_tasks."""
+    docs, next_cursor = page_tasks(
+        limit=limit, cursor=cursor, sku=sku, wh=wh, assignee=assignee, status=status,
+        type=type, priority=priority, due_after=due_after, due_before=due_before,
+    )
+    return [Task.from_doc(t) for t in docs], next_cursor
 
-        return result
+# ============================================================
+# Wrapper cho tools task (record → chuỗi chat)
+# ============================================================
+def open_tasks_tool(args: str = "") -> str:
+    try:
+        args = args or ""
+        recent = bool(re.search(r"(?i)gần đây|mới nhất|recent", args))
+        cursor = extract_cursor(args)
+        return format_open_tasks(*get_open_tasks(recent=recent, cursor=cursor))
     except Exception as e:
         return f"❌ Lỗi khi lấy task: {e}"
 
-def search_tasks(sku: str = None, wh: str = None, assignee: str = None):
+def search_tasks_tool(args: str = "") -> str:
+    """JSON {"sku","wh","assignee","status","type","priority","due_before","due_after","cursor"} hoặc câu tiếng Việt."""
     try:
-        query = {}
-        if sku:
-            query["sku"] = sku
-        if wh:
-            query["warehouse"] = wh  # chắc chắn key trùng với Mongo
-        if assignee:
-            query["assignee"] = assignee
-
-        print("👉 Query Mongo:", query)   # log query
-        docs = list(tasks.find(query))
-        print("👉 Docs found:", docs)     # log kết quả
-
-        if not docs:
-            return "🔎 Không tìm thấy task nào phù hợp."
-
-        result = "🔎 Kết quả tìm kiếm task:\n"
-        for t in docs:
-            result += f"- {t.get('_id')}: {t.get('title','(no title)')} | Trạng thái: {t.get('status','N/A')}\n"
-
-        return result
+        args = (args or "").strip()
+        if args.startswith("{"):
+            # list → tuple để làm khóa cache được
+            filters = {k: tuple(v) if isinstance(v, list) else v for k, v in json.loads(args).items()}
+            for key in ("due_before", "due_after"):
+                if filters.get(key):
+                    filters[key] = datetime.fromisoformat(filters[key])
+        else:
+            filters = extract_task_filters(args)
+        return format_task_search(*search_tasks(**filters))
     except Exception as e:
         return f"❌ Lỗi khi tìm task: {e}"
 
 def get_task_by_id(task_id: str):
-    task = tasks.find_one({"_id": ObjectId(task_id)})
+    task = tasks.find_one({"_id": ObjectId(task_id.strip())}, {
+        "_id": 0, "title": 1, "type": 1, "assignee": 1, "payload": 1, "status": 1, "priority": 1,
+        "due_at": 1, "created_at": 1})
     if not task:
         return f"❌ Không tìm thấy task với id {task_id}"
 
+    payload = task.get("payload") or {}
     return (
         f"📝 Task ID: {task_id}\n"
         f"📌 Tiêu đề: {task.get('title', 'Không có')}\n"
-        f"👤 Người phụ trách: {task.get('assignee', 'Không có')}\n"
-        f"🏷️ SKU: {task.get('sku', 'Không có')}\n"
-        f"📦 Warehouse: {task.get('warehouse', 'Không có')}\n"
+        f"🔧 Loại: {task.get('type', 'Không rõ')} - Ưu tiên: {task.get('priority', 'normal')}\n"
+        f"👤 Người phụ trách: {task.get('assignee') or 'Không có'}\n"
+        f"🏷️ SKU: {payload.get('sku', 'Không có')}\n"
+        f"📦 Warehouse: {payload.get('wh', 'Không có')}\n"
         f"⚡ Trạng thái: {task.get('status', 'Không rõ')}\n"
+        f"⏳ Hạn: {task.get('due_at') or 'Không có'}\n"
         f"⏰ Ngày tạo: {task.get('created_at', 'Không có')}\n"
     )
+# ============================================================
+# Tool 12b: Dispatcher – nhận / hoàn thành / trả task
+# ============================================================
+CLAIM_PATTERN = re.compile(r"nhận\s+(?:task|việc|lô)", re.IGNORECASE)
+TASK_ACTION_PATTERN = re.compile(
+    r"(hoàn thành|xong|trả lại|trả|gia hạn)\s+task\s+([0-9a-fA-F]{24})", re.IGNORECASE)
+
+def claim_task_tool(args: str) -> str:
+    """JSON {"worker","wh","types","batch","max_tasks"} hoặc 'Nhân viên An nhận task ở kho WH01' / 'nhận lô pick'."""
+    try:
+        args = (args or "").strip()
+        if args.startswith("{"):
+            params = json.loads(args)
+            worker, wh = params.get("worker"), params.get("wh")
+            batch, types, max_tasks = params.get("batch", False), params.get("types"), params.get("max_tasks")
+        else:
+            worker, wh = extract_assignee(args), extract_wh(args)
+            batch = bool(re.search(r"(?i)\blô\b|batch", args))
+            types = next((t for t, p in TASK_TYPE_WORDS.items() if re.search(p, args, re.IGNORECASE)), None)
+            max_tasks = None
+        if not worker or not wh:
+            return "❓ Cần tên nhân viên và mã kho để nhận task (vd: 'Nhân viên An nhận task ở kho WH01')."
+        if batch:
+            docs = claim_pick_batch(worker, wh, max_tasks)
+        else:
+            doc = claim_task(worker, wh, types)
+            docs = [doc] if doc else []
+        return format_claimed([Task.from_doc(d) for d in docs], worker, wh)
+    except Exception as e:
+        return f"❌ Lỗi khi nhận task: {e}"
+
+def task_action_tool(args: str) -> str:
+    """'Nhân viên An hoàn thành task <id>' / 'trả task <id>' / 'gia hạn task <id>'."""
+    try:
+        match = TASK_ACTION_PATTERN.search(args or "")
+        worker = extract_assignee(args or "")
+        if not match or not worker:
+            return "❓ Cần hành động (hoàn thành/trả/gia hạn), id task và tên nhân viên."
+        action, task_id = match.group(1).lower(), match.group(2)
+        if action in ("hoàn thành", "xong"):
+            complete_task(task_id, worker)
+            return f"✅ Task {task_id} đã hoàn thành bởi {worker}."
+        if action.startswith("trả"):
+            release_task(task_id, worker)
+            return f"↩️ Task {task_id} đã được trả lại hàng đợi."
+        doc = heartbeat(task_id, worker)
+        return f"⏳ Task {task_id} được giữ tới {doc['lease_until']:%H:%M:%S}."
+    except LeaseError as e:
+        return f"❌ {e}"
+    except Exception as e:
+        return f"❌ Lỗi xử lý task: {e}"
+
+# ============================================================
+# Tool 13: Nhập/xuất theo thời gian (đọc từ rollup giờ/ngày)
+# ============================================================
+def movement_rollup_tool(args: str) -> str:
+    """JSON {"sku","wh","from","to","granularity"} hoặc câu tiếng Việt: 'xuất SKU LT001 theo ngày 30 ngày qua'."""
+    try:
+        args = (args or "").strip()
+        if args.startswith("{"):
+            params = json.loads(args)
+            start, end = parse_period(params.get("period", ""))
+            if params.get("from"):
+                start = datetime.fromisoformat(params["from"])
+            if params.get("to"):
+                end = datetime.fromisoformat(params["to"])
+            sku, wh, granularity = params.get("sku"), params.get("wh"), params.get("granularity", "day")
+        else:
+            start, end = parse_period(args)
+            sku, wh = extract_sku(args), extract_wh(args)
+            granularity = "hour" if re.search(r"(?i)theo giờ|giờ qua|hôm nay", args) else "day"
+        series = movement_series(start, end, sku=sku, wh=wh, granularity=granularity)
+        return format_movements(series, movement_totals(series), granularity, sku, wh)
+    except Exception as e:
+        return f"❌ Lỗi khi thống kê nhập/xuất: {e}"
+
+# ============================================================
+# Tool 14: Dự báo hết hàng + đề xuất bổ sung
+# ============================================================
+def forecast_tool(args: str = "") -> str:
+    """'Sản phẩm nào sắp hết hàng tuần này?'; thêm 'tạo task' để ghi task đề xuất vào tasks."""
+    try:
+        args = args or ""
+        match = re.search(r"(\d+)\s*ngày", args)
+        horizon = int(match.group(1)) if match else (30 if re.search(r"(?i)tháng", args) else 7)
+        create = bool(re.search(r"(?i)tạo\s+(task|đề xuất)", args))
+        return format_forecast(run_forecast(horizon_days=horizon, create_tasks=create))
+    except Exception as e:
+        return f"❌ Lỗi khi dự báo: {e}"
+
 def out_of_scope_tool(query: str) -> str:
     """Dùng khi câu hỏi không liên quan tới hệ thống quản lý kho"""
     return "⚠️ Vui lòng đưa ra câu hỏi liên quan tới hệ thống."
@@ -550,15 +651,16 @@ def out_of_scope_tool(query: str) -> str:
 # ============================================================
 # Khởi tạo danh sách Tools
 # ============================================================
+# Mô tả tool được chèn thẳng vào PromptTemplate của ReAct agent → không dùng dấu { } trong description
 tools = [
     #Tinh tồn kho
-    Tool(name="MongoDBStockChecker", func=get_stock_by_sku,
-         description="Tính tồn kho theo SKU."),
+    Tool(name="MongoDBStockChecker", func=stock_tool,
+         description="Tính tồn kho theo SKU, có thể kèm kho. Ví dụ: 'LT001' hoặc 'LT001,WH02'."),
     #Tính tồn kho theo tên sản phẩm
     Tool(name="MongoDBStockByName", func=get_stock_by_name,
          description="Tính tồn kho theo tên sản phẩm."),
     #Lịch sử giao dịch
-    Tool(name="MongoDBTransactionHistory", func=get_transaction_history,
+    Tool(name="MongoDBTransactionHistory", func=transaction_history_tool,
          description="Xem lịch sử giao dịch theo SKU."),
     #Nhập kho
     Tool(
@@ -574,10 +676,13 @@ tools = [
     ),
     Tool(name="MongoDBTransactionSearcher", func=search_transactions_tool,
          description="Tìm kiếm transaction theo filter JSON."),
-    Tool(name="MongoDBRebuildInventory", func=rebuild_inventory,
+    Tool(name="MongoDBRebuildInventory", func=lambda _="": rebuild_inventory(),
          description="Rebuild tồn kho từ transaction log."),
-    Tool(name="MongoDBRebuildAndSyncInventory", func=rebuild_and_sync_inventory,
+    Tool(name="MongoDBRebuildAndSyncInventory", func=lambda _="": rebuild_and_sync_inventory(),
          description="Đồng bộ tồn kho toàn bộ."),
+    Tool(name="MongoDBReconcileInventory", func=reconcile_inventory_wrapper,
+         description="Đối soát tồn kho tăng dần từ các giao dịch mới. "
+                     "Ví dụ: 'Đối soát tồn kho' hoặc 'Đối soát tồn kho, kiểm tra 20 SKU'."),
     # Wrapper Tools để hỏi lại khi user thiếu input
     Tool(name="MongoDBStockCheckerWrapper", func=stock_tool,
          description="Kiểm tra tồn kho. Nếu thiếu SKU thì hỏi lại."),
@@ -614,21 +719,57 @@ tools = [
     ),
     Tool(
         name="GetOpenTasksTool",
-        func=get_open_tasks,
+        func=open_tasks_tool,
         description=(
-            "Trả về danh sách các task đang mở hoặc task mở gần đây. "
+            "Trả về danh sách các task đang mở (ưu tiên cao → hạn sớm) hoặc task mở gần đây. "
             "Ví dụ: 'Có những task nào đang mở?' hoặc "
             "'Danh sách task open gần đây.'"
         )
     ),
     Tool(
         name="SearchTasksTool",
-        func=lambda query: search_tasks(
-            sku=extract_sku(query),
-            wh=extract_wh(query),
-            assignee=extract_assignee(query)
-        ),
-        description="Tìm task theo SKU, warehouse hoặc assignee."
+        func=search_tasks_tool,
+        description=(
+            "Tìm task theo SKU, kho, nhân viên, loại, độ ưu tiên, trạng thái hoặc hạn; "
+            "kết quả xếp ưu tiên cao → hạn sớm. Ví dụ: 'Task ưu tiên cao ở kho WH01', "
+            "'Task kiểm kê quá hạn của nhân viên An' hoặc JSON với các khóa sku, wh, assignee, status, "
+            "type, priority, due_before, due_after, cursor."
+        )
+    ),
+    Tool(
+        name="ClaimTaskTool",
+        func=claim_task_tool,
+        description=(
+            "Giao cho nhân viên task tiếp theo (ưu tiên cao, hạn sớm nhất) trong kho của họ, "
+            "hoặc một lô task pick cùng khu. Ví dụ: 'Nhân viên An nhận task ở kho WH01' hoặc "
+            "'Nhân viên An nhận lô pick kho WH01'."
+        )
+    ),
+    Tool(
+        name="TaskActionTool",
+        func=task_action_tool,
+        description=(
+            "Hoàn thành, trả lại hoặc gia hạn task đang giữ. Ví dụ: "
+            "'Nhân viên An hoàn thành task 64f0c2...' hoặc 'Nhân viên An trả task 64f0c2...'."
+        )
+    ),
+    Tool(
+        name="MovementRollupTool",
+        func=movement_rollup_tool,
+        description=(
+            "Thống kê nhập/xuất/ròng theo ngày hoặc theo giờ trong một khoảng thời gian, "
+            "theo SKU và/hoặc kho. Ví dụ: 'Xuất ròng SKU LT001 theo ngày quý này' hoặc "
+            "'Throughput kho WH01 tuần này' hoặc JSON với các khóa sku, wh, from, to (ISO), granularity (day/hour)."
+        )
+    ),
+    Tool(
+        name="ForecastReorderTool",
+        func=forecast_tool,
+        description=(
+            "Dự báo nhu cầu, tồn an toàn và điểm đặt hàng lại; liệt kê SKU sắp hết hàng. "
+            "Ví dụ: 'Sản phẩm nào sẽ hết hàng tuần này?' hoặc "
+            "'Dự báo hết hàng 14 ngày tới và tạo task bổ sung'."
+        )
     ),
     Tool(
         name="GetTaskByIdTool",
@@ -643,6 +784,9 @@ tools = [
 
 ]
 
+# Đo thời gian từng tool (histogram /metrics + trace của request)
+instrument_tools(tools)
+
 # ============================================================
 # Helper functions to extract sku, warehouse, assignee from query string
 # ============================================================
@@ -652,10 +796,14 @@ def extract_sku(query: str):
         return match.group(2).strip()
     return None
 
+# Mã kho: chữ cái rồi có chữ số (WH01, HN-02...). "nhập kho"/"xuất kho" chỉ có nghĩa nhập/xuất
+# nên "Nhập kho tuần này", "Xuất kho SKU LT001", "Nhập kho 10 cái" không được coi là mã kho.
+WH_CODE_PATTERN = re.compile(r"\bkho\s+([A-Za-z]{1,6}-?\d[\w\-]*)", re.IGNORECASE)
+
 def extract_wh(query: str):
-    match = re.search(r"(kho)\s*([A-Za-z0-9\-]+)", query, re.IGNORECASE)
+    match = WH_CODE_PATTERN.search(query)
     if match:
-        return match.group(2).strip()
+        return match.group(1).strip()
     return None
 
 def extract_assignee(query: str):
@@ -664,22 +812,103 @@ def extract_assignee(query: str):
         return match.group(2).strip()
     return None
 
+def extract_cursor(query: str):
+    match = re.search(r"cursor[:=\s]+([A-Za-z0-9_\-=]+)", query, re.IGNORECASE)
+    if match:
+        return match.group(1)
+    return None
 
-
-# ============================================================
-# Khởi tạo LLM & Agent
-# ============================================================
-llm = ChatGroq(model=GROQ_MODEL, groq_api_key=GROQ_API_KEY, temperature=0)
-
-agent = initialize_agent(
-    tools,
-    llm,
-    agent="zero-shot-react-description",
-    verbose=True,
-    handle_parsing_errors=True,   # tránh crash
-    return_intermediate_steps=False
-   
-)
-
-
-print("✅ Agent đã khởi tạo thành công"),
+TASK_TYPE_WORDS = {
+    "putaway": r"putaway|cất hàng|bổ sung",
+    "cycle_count": r"cycle[_ ]count|kiểm kê",
+    "pick": r"\bpick\b|lấy hàng|soạn hàng",
+}
+TASK_PRIORITY_WORDS = {
+    "high": r"ưu tiên cao|gấp|khẩn|\bhigh\b",
+    "low": r"ưu tiên thấp|\blow\b",
+    "normal": r"ưu tiên (trung bình|bình thường)|\bnormal\b",
+}
+
+def extract_task_filters(query: str, now: datetime = None) -> dict:
+    """'task kiểm kê ưu tiên cao ở kho WH01 quá hạn' → filter cho search_tasks."""
+    now = now or datetime.utcnow()
+    filters = {"sku": extract_sku(query), "wh": extract_wh(query), "assignee": extract_assignee(query),
+               "cursor": extract_cursor(query)}
+    filters["type"] = next((t for t, p in TASK_TYPE_WORDS.items() if re.search(p, query, re.IGNORECASE)), None)
+    filters["priority"] = next((p for p, w in TASK_PRIORITY_WORDS.items() if re.search(w, query, re.IGNORECASE)), None)
+    if re.search(r"(?i)đã xong|hoàn thành|\bdone\b", query):
+        filters["status"] = "done"
+    elif re.search(r"(?i)đang mở|chưa xong|\bopen\b|quá hạn|overdue|đến hạn", query):
+        filters["status"] = "open"
+    if re.search(r"(?i)quá hạn|overdue", query):
+        filters["due_before"] = now
+    else:
+        match = re.search(r"(?i)(?:đến hạn|hạn).*?(\d+)\s*ngày", query)
+        if match:
+            filters["due_before"] = now + timedelta(days=int(match.group(1)))
+        elif re.search(r"(?i)(đến hạn|hạn) hôm nay", query):
+            filters["due_before"] = now.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
+    return {k: v for k, v in filters.items() if v is not None}
+
+
+
+# ============================================================
+# Khởi tạo LLM & Agent (lazy)
+# ============================================================
+# ChatGroq + initialize_agent chỉ được tạo khi cần lần đầu (hoặc warm-up trong lifespan),
+# nên import module này không cần GROQ_API_KEY và không tốn thời gian khởi tạo agent.
+_llm_cache = None
+_llm = None
+_agent = None
+_init_lock = threading.Lock()
+
+
+def get_llm_cache():
+    global _llm_cache
+    if _llm_cache is None and LLM_CACHE_ENABLED:
+        with _init_lock:
+            if _llm_cache is None:
+                _llm_cache = SQLiteLLMCache(
+                    LLM_CACHE_PATH,
+                    tools_hash=tools_fingerprint(tools),
+                    ttl=LLM_CACHE_TTL,
+                    max_entries=LLM_CACHE_MAX_ENTRIES,
+                    max_bytes=LLM_CACHE_MAX_BYTES,
+                )
+    return _llm_cache
+
+
+def get_llm():
+    global _llm
+    if _llm is None:
+        from langchain_groq import ChatGroq
+
+        cache = get_llm_cache()
+        with _init_lock:
+            if _llm is None:
+                _llm = ChatGroq(model=GROQ_MODEL, groq_api_key=require_groq_api_key(),
+                                temperature=0, cache=cache)
+    return _llm
+
+
+def get_agent():
+    global _agent
+    if _agent is None:
+        from langchain.agents import initialize_agent
+
+        llm = get_llm()
+        with _init_lock:
+            if _agent is None:
+                _agent = initialize_agent(
+                    tools,
+                    llm,
+                    agent="zero-shot-react-description",
+                    verbose=AGENT_VERBOSE,         # log từng bước ra stdout chỉ khi debug
+                    handle_parsing_errors=True,   # tránh crash
+                    return_intermediate_steps=False
+                )
+    return _agent
+
+
+def llm_cache_stats():
+    return _llm_cache.stats() if _llm_cache else None
@@ -0,0 +1,60 @@
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from .config import AGENT_MAX_CONCURRENCY, AGENT_QUEUE_MAX, AGENT_QUEUE_TIMEOUT
+
+# ============================================================
+# Chạy LangChain agent ngoài event loop, giới hạn số lượt chạy đồng thời
+# ============================================================
+# Mỗi lượt /ask là một vòng ReAct nhiều bước gọi Groq (vài giây). Agent chạy trên
+# executor riêng (không dùng chung thread pool với truy vấn Mongo), tối đa
+# AGENT_MAX_CONCURRENCY lượt cùng lúc; các request còn lại xếp hàng tối đa
+# AGENT_QUEUE_TIMEOUT giây. Hàng đợi đầy → 429, chờ quá hạn → 503.
+
+
+class AgentBusyError(Exception):
+    def __init__(self, status_code: int, message: str):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class AgentRunner:
+    def __init__(self, max_concurrency: int = AGENT_MAX_CONCURRENCY,
+                 max_queue: int = AGENT_QUEUE_MAX, queue_timeout: float = AGENT_QUEUE_TIMEOUT):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._slots = asyncio.Semaphore(max_concurrency)
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="agent")
+        self.waiting = 0
+        self.running = 0
+
+    async def run(self, func, *args, **kwargs):
+        if self._slots.locked() and self.waiting >= self.max_queue:
+            raise AgentBusyError(429, "🚦 Hệ thống đang bận, vui lòng thử lại sau.")
+
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._slots.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            raise AgentBusyError(503, "⏳ Hết thời gian chờ xử lý, vui lòng thử lại sau.")
+        finally:
+            self.waiting -= 1
+
+        self.running += 1
+        try:
+            loop = asyncio.get_running_loop()
+            # run_in_executor không mang contextvar sang thread → chạy trong bản sao context (trace request)
+            context = contextvars.copy_context()
+            return await loop.run_in_executor(self._executor, partial(context.run, func, *args, **kwargs))
+        finally:
+            self.running -= 1
+            self._slots.release()
+
+    def stats(self) -> dict:
+        return {"running": self.running, "waiting": self.waiting,
+                "max_concurrency": self.max_concurrency, "max_queue": self.max_queue}
+
+
+agent_runner = AgentRunner()
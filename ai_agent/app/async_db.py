@@ -0,0 +1,72 @@
+from functools import partial
+import anyio
+from . import agent
+from .config import DB_THREADS
+from .ingest import add_transactions_batch as _add_transactions_batch
+from .reconcile import reconcile_inventory as _reconcile_inventory, verify_sample as _verify_sample
+
+# ============================================================
+# Lớp truy cập dữ liệu async cho FastAPI
+# ============================================================
+# Các hàm trong agent.py dùng pymongo đồng bộ (vẫn giữ nguyên cho LangChain tools).
+# Ở đây mỗi thao tác được chạy trên thread pool riêng, giới hạn bởi DB_THREADS, nên
+# event loop không bị chặn và các request đồng thời dùng song song connection pool của
+# MongoClient thay vì phải chờ nhau.
+_limiter = None
+
+
+def _get_limiter() -> anyio.CapacityLimiter:
+    # CapacityLimiter phải được tạo bên trong event loop
+    global _limiter
+    if _limiter is None:
+        _limiter = anyio.CapacityLimiter(DB_THREADS)
+    return _limiter
+
+
+async def run_db(func, *args, **kwargs):
+    """Chạy một hàm Mongo đồng bộ trên thread pool và await kết quả."""
+    return await anyio.to_thread.run_sync(partial(func, *args, **kwargs), limiter=_get_limiter())
+
+
+async def get_stock(args: str) -> str:
+    return await run_db(agent.stock_tool, args)
+
+
+async def get_transaction_history(args: str) -> str:
+    return await run_db(agent.transaction_history_tool, args)
+
+
+async def search_transactions(args: str) -> str:
+    return await run_db(agent.search_transactions_tool, args)
+
+
+async def search_inventories(args: str) -> str:
+    return await run_db(agent.search_inventories_tool, args)
+
+
+async def add_inbound(args: str, idempotency_key: str = None) -> str:
+    return await run_db(agent.inbound_tool_wrapper, args, idempotency_key)
+
+
+async def add_outbound(args: str, idempotency_key: str = None) -> str:
+    return await run_db(agent.outbound_tool_wrapper, args, idempotency_key)
+
+
+async def add_transactions_batch(lines: list, default_type: str = "inbound", idempotency_key: str = None) -> dict:
+    return await run_db(_add_transactions_batch, lines, default_type, idempotency_key)
+
+
+async def rebuild_inventory(confirm: str, batch_size: int = None, workers: int = None) -> str:
+    return await run_db(agent.rebuild_inventory_wrapper, confirm, batch_size, workers)
+
+
+async def rebuild_and_sync_inventory(confirm: str, batch_size: int = None, workers: int = None) -> str:
+    return await run_db(agent.rebuild_and_sync_inventory_wrapper, confirm, batch_size, workers)
+
+
+async def reconcile_inventory(batch_size: int = None, fix: bool = False) -> dict:
+    return await run_db(_reconcile_inventory, batch_size, fix=fix)
+
+
+async def verify_sample(size: int = 50, fix: bool = False) -> dict:
+    return await run_db(_verify_sample, size, fix)
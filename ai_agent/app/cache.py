@@ -0,0 +1,149 @@
+import sys
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from .config import CACHE_TTL, CACHE_MAX_ENTRIES, CACHE_MAX_BYTES
+
+# ============================================================
+# Cache kết quả cho các tool chỉ đọc (TTL + LRU, giới hạn bộ nhớ)
+# ============================================================
+# Mỗi entry được gắn tag (SKU, "search", "tasks"...). Các write path gọi
+# invalidate_skus() sau khi ghi để câu trả lời tồn kho không bao giờ cũ hơn
+# thao tác ghi vừa thực hiện trong process này.
+
+SEARCH_TAG = "search"   # kết quả tìm kiếm có thể chứa bất kỳ SKU nào
+TASKS_TAG = "tasks"
+
+
+def estimate_size(value) -> int:
+    """Ước lượng bộ nhớ của giá trị cache (đệ quy qua list/tuple/dict và record pydantic)."""
+    size = sys.getsizeof(value)
+    if isinstance(value, (list, tuple)):
+        size += sum(estimate_size(v) for v in value)
+    elif isinstance(value, dict):
+        size += sum(estimate_size(k) + estimate_size(v) for k, v in value.items())
+    elif hasattr(value, "__dict__"):
+        size += estimate_size(vars(value))
+    return size
+
+
+class TTLCache:
+    def __init__(self, ttl: float = CACHE_TTL, max_entries: int = CACHE_MAX_ENTRIES,
+                 max_bytes: int = CACHE_MAX_BYTES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._data = OrderedDict()   # key -> (expires_at, value, size, tags)
+        self._tags = {}              # tag -> set(key)
+        self._gens = {}              # tag -> số lần invalidate (phát hiện ghi xen giữa lúc tính giá trị)
+        self._epoch = 0              # tăng mỗi lần clear()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return None, False
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1], True
+
+    def generation(self, tags=()) -> tuple:
+        """Ảnh chụp thế hệ của các tag; truyền lại cho set() để bỏ giá trị tính trước một lần invalidate."""
+        with self._lock:
+            return (self._epoch,) + tuple(self._gens.get(tag, 0) for tag in tags)
+
+    def set(self, key, value, tags=(), generation=None):
+        size = estimate_size(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if generation is not None and generation != (self._epoch,) + tuple(self._gens.get(t, 0) for t in tags):
+                return   # có thao tác ghi invalidate tag trong lúc đang tính → giá trị có thể đã cũ
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = (time.monotonic() + self.ttl, value, size, tuple(tags))
+            self._bytes += size
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while len(self._data) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._data)))
+                self.evictions += 1
+
+    def invalidate(self, *tags):
+        with self._lock:
+            for tag in tags:
+                self._gens[tag] = self._gens.get(tag, 0) + 1
+                for key in list(self._tags.get(tag, ())):
+                    self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._tags.clear()
+            self._bytes = 0
+            self._epoch += 1
+
+    def _remove(self, key):
+        _, _, size, tags = self._data.pop(key)
+        self._bytes -= size
+        for tag in tags:
+            keys = self._tags.get(tag)
+            if keys:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._data),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+tool_cache = TTLCache()
+
+
+def cached(tags):
+    """
+    Decorator cache kết quả theo (tên hàm, tham số).
+    `tags(*args, **kwargs)` trả về danh sách tag dùng để invalidate.
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            key = (func.__name__, args, tuple(sorted(kwargs.items())))
+            value, found = tool_cache.get(key)
+            if found:
+                return value
+            entry_tags = [t for t in tags(*args, **kwargs) if t]
+            # Chụp thế hệ trước khi đọc DB: write chạy invalidate_skus() giữa chừng thì không ghi cache
+            generation = tool_cache.generation(entry_tags)
+            value = func(*args, **kwargs)
+            tool_cache.set(key, value, entry_tags, generation)
+            return value
+        return wrapper
+    return decorator
+
+
+def invalidate_skus(skus):
+    """Xóa cache của các SKU vừa thay đổi tồn kho (và mọi kết quả tìm kiếm)."""
+    tool_cache.invalidate(SEARCH_TAG, *skus)
+
+
+def invalidate_tasks():
+    tool_cache.invalidate(TASKS_TAG)
@@ -1,8 +1,73 @@
+import threading
 from pymongo import MongoClient
+from pymongo.errors import OperationFailure
 from .config import MONGO_URI, MONGO_DB
+from .metrics import MongoCommandMetrics
 
-client = MongoClient(MONGO_URI)
-db = client[MONGO_DB]
+# ============================================================
+# Kết nối MongoDB khởi tạo lười (lazy)
+# ============================================================
+# MongoClient (đặc biệt với mongodb+srv) phân giải DNS và mở thread nền ngay khi tạo,
+# nên chỉ tạo ở lần truy cập đầu tiên thay vì lúc import module.
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> MongoClient:
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                # Listener đếm round trip + thời gian từng lệnh cho /metrics và trace request
+                _client = MongoClient(MONGO_URI, event_listeners=[MongoCommandMetrics()])
+    return _client
+
+
+def get_db():
+    return get_client()[MONGO_DB]
+
+
+class LazyCollection:
+    """Proxy tới collection, chỉ kết nối khi được dùng lần đầu."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._collection = None
+        self._client = self._db_name = None
+
+    def __getattr__(self, attr):
+        # Gắn lại khi client/database bị thay (fixture test, tiến trình con của rebuild song song)
+        if self._collection is None or self._client is not _client or self._db_name != MONGO_DB:
+            self._collection = get_db()[self.name]
+            self._client, self._db_name = _client, MONGO_DB
+        return getattr(self._collection, attr)
+
+
+class LazyDatabase:
+    """Cho phép các module giữ cú pháp db["transactions"] ở mức module mà không kết nối."""
+
+    def __getitem__(self, name: str) -> LazyCollection:
+        return LazyCollection(name)
+
+    def __getattr__(self, attr):
+        return getattr(get_db(), attr)
+
+
+db = LazyDatabase()
 inventory_collection = db["inventories"]
 transaction_collection = db["transactions"]
 task_collection = db["tasks"]
+
+
+def run_in_transaction(callback):
+    """
+    Chạy callback(session) trong một Mongo transaction (Atlas/replica set).
+    Với mongod standalone (không hỗ trợ transaction) thì chạy callback(None).
+    """
+    with get_client().start_session() as session:
+        try:
+            return session.with_transaction(callback)
+        except OperationFailure as e:
+            if e.code != 20:  # IllegalOperation: transaction cần replica set
+                raise
+    return callback(None)
@@ -0,0 +1,176 @@
+import re
+from datetime import datetime, timedelta
+from bson.objectid import ObjectId
+from pymongo import ReturnDocument
+from .database import db
+from .config import TASK_LEASE_SECONDS, PICK_BATCH_MAX
+from .cache import invalidate_tasks
+from .pagination import fields_projection, TASK_FIELDS
+from .task_query import TASK_SORT
+
+# ============================================================
+# Dispatcher: nhân viên nhận task theo hàng đợi ưu tiên
+# ============================================================
+# Mỗi lần nhận là MỘT find_one_and_update trên task "open" của kho, sắp theo
+# (priority_rank, due_sort, _id) – cùng index status_wh_priority_due với truy vấn task –
+# nên 100 người nhận song song cũng không có task nào bị giao hai lần.
+# Task đã nhận chuyển sang "in_progress" kèm claimed_by + lease_until; `assignee` (người được
+# giao sẵn, nếu có) giữ nguyên. Hết lease mà không heartbeat (máy quét tắt, nhân viên bỏ dở) → task
+# được nhận lại ngay trong lần claim kế tiếp (filter claim gồm cả task in_progress hết lease), không cần
+# thêm lệnh ghi requeue trên mỗi lần nhận; requeue_expired() chỉ còn để dọn chủ động.
+tasks = db["tasks"]
+inventories = db["inventories"]
+
+CLAIM_PROJECTION = dict(fields_projection(TASK_FIELDS), lease_until=1, batch_id=1)
+
+
+class LeaseError(Exception):
+    """Task không ở trạng thái in_progress của nhân viên này (đã hết lease, đã xong hoặc người khác giữ)."""
+
+    def __init__(self, task_id, worker: str):
+        self.task_id, self.worker = task_id, worker
+        super().__init__(f"Task {task_id} không còn được giao cho {worker}.")
+
+
+def _oid(task_id):
+    return task_id if isinstance(task_id, ObjectId) else ObjectId(str(task_id).strip())
+
+
+def _claim_update(worker: str, now: datetime, lease_seconds: int, batch_id=None) -> dict:
+    fields = {"status": "in_progress", "claimed_by": worker, "claimed_at": now,
+              "lease_until": now + timedelta(seconds=lease_seconds), "updated_at": now}
+    update = {"$set": fields, "$inc": {"attempts": 1}}
+    if batch_id:
+        fields["batch_id"] = batch_id
+    else:
+        update["$unset"] = {"batch_id": ""}   # task hết lease nhận lại lẻ → không còn thuộc lô cũ
+    return update
+
+
+def _open_for(worker: str, wh: str, now: datetime) -> dict:
+    # Task chưa giao ai, hoặc đã được giao sẵn cho chính nhân viên này; open hoặc in_progress đã hết lease.
+    # Mỗi nhánh $or có status + payload.wh bằng nhau → dùng index status_wh_priority_due rồi gộp theo TASK_SORT
+    mine = {"payload.wh": wh, "assignee": {"$in": [None, worker]}}
+    return {"$or": [dict(mine, status="open"),
+                    dict(mine, status="in_progress", lease_until={"$lt": now})]}
+
+
+def requeue_expired(wh: str = None, now: datetime = None) -> int:
+    """Trả các task in_progress đã hết lease về open (bỏ người giữ, giữ người được giao sẵn)."""
+    now = now or datetime.utcnow()
+    q = {"status": "in_progress", "lease_until": {"$lt": now}}
+    if wh:
+        q["payload.wh"] = wh
+    res = tasks.update_many(q, {"$set": {"status": "open", "updated_at": now},
+                                "$unset": {"claimed_by": "", "lease_until": "", "claimed_at": "", "batch_id": ""}})
+    if res.modified_count:
+        invalidate_tasks()
+    return res.modified_count
+
+
+def claim_task(worker: str, wh: str, types=None, lease_seconds: int = None, now: datetime = None):
+    """Nhận task open ưu tiên cao nhất, hạn sớm nhất của kho `wh`. Không còn task → None."""
+    now = now or datetime.utcnow()
+    q = _open_for(worker, wh, now)
+    if types:
+        q["type"] = types if isinstance(types, str) else {"$in": list(types)}
+    doc = tasks.find_one_and_update(
+        q, _claim_update(worker, now, lease_seconds or TASK_LEASE_SECONDS),
+        sort=TASK_SORT, projection=CLAIM_PROJECTION, return_document=ReturnDocument.AFTER,
+    )
+    if doc:
+        invalidate_tasks()
+    return doc
+
+
+def zone_of(location: str) -> str:
+    """'A-03-02' → 'A' (khu đầu tiên trong mã vị trí)."""
+    match = re.match(r"\s*([A-Za-z0-9]+)", location or "")
+    return match.group(1) if match else ""
+
+
+def claim_pick_batch(worker: str, wh: str, max_tasks: int = None, lease_seconds: int = None,
+                     now: datetime = None) -> list:
+    """
+    Nhận 1 lô task pick cùng khu: task pick ưu tiên nhất làm mốc, rồi lần lượt nhận thêm các task pick
+    open của cùng SKU hoặc SKU nằm cùng khu (theo inventories.location). Mỗi task vẫn được nhận bằng
+    một find_one_and_update riêng nên lô không bao giờ chứa task người khác đã nhận.
+    Trả về danh sách task xếp theo vị trí để đi một vòng trong khu.
+    """
+    now = now or datetime.utcnow()
+    max_tasks = int(max_tasks or PICK_BATCH_MAX)
+    lease_seconds = lease_seconds or TASK_LEASE_SECONDS
+    batch_id = ObjectId()
+    anchor = tasks.find_one_and_update(
+        dict(_open_for(worker, wh, now), type="pick"), _claim_update(worker, now, lease_seconds, batch_id),
+        sort=TASK_SORT, projection=CLAIM_PROJECTION, return_document=ReturnDocument.AFTER,
+    )
+    if not anchor:
+        return []
+
+    sku = (anchor.get("payload") or {}).get("sku")
+    anchor_item = inventories.find_one({"sku": sku}, {"_id": 0, "location": 1}) or {}
+    locations = {sku: anchor_item.get("location")}
+    zone = zone_of(locations[sku])
+    if zone:
+        for d in inventories.find({"wh": wh, "location": {"$regex": f"^{re.escape(zone)}(?![A-Za-z0-9])"}},
+                                  {"_id": 0, "sku": 1, "location": 1}).limit(1000):
+            locations.setdefault(d["sku"], d.get("location"))
+
+    batch = [anchor]
+    q = dict(_open_for(worker, wh, now), type="pick", **{"payload.sku": {"$in": list(locations)}})
+    while len(batch) < max_tasks:
+        doc = tasks.find_one_and_update(
+            q, _claim_update(worker, now, lease_seconds, batch_id),
+            sort=TASK_SORT, projection=CLAIM_PROJECTION, return_document=ReturnDocument.AFTER,
+        )
+        if not doc:
+            break
+        batch.append(doc)
+    invalidate_tasks()
+    return sorted(batch, key=lambda t: (locations.get((t.get("payload") or {}).get("sku")) or "", str(t["_id"])))
+
+
+def _owned(task_id, worker: str) -> dict:
+    return {"_id": _oid(task_id), "status": "in_progress", "claimed_by": worker}
+
+
+def heartbeat(task_id, worker: str, lease_seconds: int = None, now: datetime = None):
+    """Gia hạn lease của task đang giữ."""
+    now = now or datetime.utcnow()
+    doc = tasks.find_one_and_update(
+        _owned(task_id, worker),
+        {"$set": {"lease_until": now + timedelta(seconds=lease_seconds or TASK_LEASE_SECONDS), "updated_at": now}},
+        projection=CLAIM_PROJECTION, return_document=ReturnDocument.AFTER,
+    )
+    if not doc:
+        raise LeaseError(task_id, worker)
+    return doc
+
+
+def complete_task(task_id, worker: str, now: datetime = None):
+    now = now or datetime.utcnow()
+    doc = tasks.find_one_and_update(
+        _owned(task_id, worker),
+        {"$set": {"status": "done", "completed_at": now, "updated_at": now}, "$unset": {"lease_until": ""}},
+        projection=CLAIM_PROJECTION, return_document=ReturnDocument.AFTER,
+    )
+    if not doc:
+        raise LeaseError(task_id, worker)
+    invalidate_tasks()
+    return doc
+
+
+def release_task(task_id, worker: str, now: datetime = None):
+    """Nhân viên trả task lại hàng đợi chung (không làm được / đổi ca): bỏ cả người được giao sẵn."""
+    now = now or datetime.utcnow()
+    doc = tasks.find_one_and_update(
+        _owned(task_id, worker),
+        {"$set": {"status": "open", "assignee": None, "updated_at": now},
+         "$unset": {"claimed_by": "", "lease_until": "", "claimed_at": "", "batch_id": ""}},
+        projection=CLAIM_PROJECTION, return_document=ReturnDocument.AFTER,
+    )
+    if not doc:
+        raise LeaseError(task_id, worker)
+    invalidate_tasks()
+    return doc
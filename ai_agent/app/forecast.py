@@ -0,0 +1,195 @@
+import math
+import time
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+from pymongo import UpdateOne
+from .database import db
+from .config import (
+    FORECAST_WINDOW_DAYS, FORECAST_ALPHA, FORECAST_LEAD_TIME_DAYS, FORECAST_SERVICE_Z, REBUILD_BATCH_SIZE,
+)
+from .cache import invalidate_tasks
+from .rollups import bucket_start
+from .task_query import priority_rank
+
+# ============================================================
+# Dự báo nhu cầu + điểm đặt hàng lại (NumPy/pandas, 1 lần chạy cho mọi SKU)
+# ============================================================
+# Chuỗi xuất kho theo ngày của mọi SKU được đọc bằng MỘT query (rollup ngày, hoặc một
+# $group trên transactions), dựng thành ma trận [SKU x ngày] rồi tính toàn bộ bằng phép
+# toán vector: trung bình trượt, làm mượt hàm mũ (lặp theo ngày, không theo SKU),
+# độ lệch chuẩn, tồn an toàn = z·σ·√lead_time, điểm đặt hàng = nhu cầu·lead_time + tồn an toàn.
+# SKU dưới điểm đặt hàng → task "putaway" (bổ sung hàng); tồn âm → task "cycle_count".
+transactions = db["transactions"]
+inventories = db["inventories"]
+rollups = db["movement_rollups"]
+tasks = db["tasks"]
+
+FORECAST_SOURCE = "forecast"   # đánh dấu task do engine tạo (để cập nhật thay vì tạo trùng)
+
+
+def load_daily_outbound(start: datetime, source: str = "rollups") -> pd.DataFrame:
+    """DataFrame (sku, wh, day, qty) xuất kho theo ngày từ `start`, đọc trong 1 query."""
+    if source == "rollups":
+        cursor = rollups.find(
+            {"g": "day", "t": {"$gte": start}, "outbound": {"$gt": 0}},
+            {"_id": 0, "sku": 1, "wh": 1, "t": 1, "outbound": 1},
+        ).batch_size(10000)
+        rows = ((d["sku"], d["wh"], d["t"], d["outbound"]) for d in cursor)
+    else:
+        cursor = transactions.aggregate([
+            {"$match": {"type": "outbound", "at": {"$gte": start}}},
+            {"$group": {"_id": {"sku": "$sku", "wh": "$wh", "t": {"$dateTrunc": {"date": "$at", "unit": "day"}}},
+                        "qty": {"$sum": "$qty"}}},
+        ], allowDiskUse=True, batchSize=10000)
+        rows = ((d["_id"]["sku"], d["_id"]["wh"], d["_id"]["t"], d["qty"]) for d in cursor)
+    return pd.DataFrame.from_records(rows, columns=["sku", "wh", "day", "qty"])
+
+
+def load_stock() -> pd.Series:
+    """Tồn tổng hiện tại theo SKU (stream toàn bộ inventories, chỉ lấy sku + qty)."""
+    cursor = inventories.find({}, {"_id": 0, "sku": 1, "qty": 1}).batch_size(10000)
+    frame = pd.DataFrame.from_records(((d.get("sku"), d.get("qty", 0)) for d in cursor), columns=["sku", "qty"])
+    return frame.dropna(subset=["sku"]).groupby("sku")["qty"].sum()
+
+
+def demand_matrix(frame: pd.DataFrame, start: datetime, days: int):
+    """Ma trận [SKU x ngày] số lượng xuất (gộp các kho) + kho xuất nhiều nhất của mỗi SKU."""
+    codes, skus = pd.factorize(frame["sku"], sort=True)
+    day_idx = ((frame["day"] - start) // pd.Timedelta(days=1)).to_numpy()
+    valid = (day_idx >= 0) & (day_idx < days)
+    matrix = np.zeros((len(skus), days))
+    np.add.at(matrix, (codes[valid], day_idx[valid]), frame["qty"].to_numpy()[valid])
+    per_wh = frame.groupby(["sku", "wh"])["qty"].sum()
+    main_wh = per_wh.groupby(level="sku").idxmax().map(lambda key: key[1])
+    return matrix, pd.Index(skus), main_wh
+
+
+def exponential_smoothing(matrix: np.ndarray, alpha: float) -> np.ndarray:
+    """Làm mượt hàm mũ đơn cho mọi SKU cùng lúc: lặp theo cột (ngày), mỗi bước là 1 phép vector."""
+    level = matrix[:, 0].copy()
+    for day in range(1, matrix.shape[1]):
+        level = alpha * matrix[:, day] + (1 - alpha) * level
+    return level
+
+
+def compute_forecast(matrix: np.ndarray, skus: pd.Index, stock: pd.Series, method: str = "ses",
+                     alpha: float = FORECAST_ALPHA, ma_window: int = 28,
+                     lead_time: float = FORECAST_LEAD_TIME_DAYS, z: float = FORECAST_SERVICE_Z) -> pd.DataFrame:
+    if method == "ma":
+        daily = matrix[:, -ma_window:].mean(axis=1)
+    else:
+        daily = exponential_smoothing(matrix, alpha)
+    sigma = matrix.std(axis=1, ddof=1) if matrix.shape[1] > 1 else np.zeros(len(skus))
+    safety = z * sigma * math.sqrt(lead_time)
+    reorder_point = daily * lead_time + safety
+    on_hand = stock.reindex(skus).fillna(0).to_numpy(dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cover = np.where(daily > 0, on_hand / daily, np.inf)
+    return pd.DataFrame({
+        "sku": skus,
+        "stock": on_hand,
+        "daily_demand": daily.round(3),
+        "safety_stock": np.ceil(safety),
+        "reorder_point": np.ceil(reorder_point),
+        "days_of_cover": cover.round(1),
+    })
+
+
+def suggest(result: pd.DataFrame, main_wh: pd.Series, lead_time: float, horizon_days: float) -> pd.DataFrame:
+    """Chọn SKU cần xử lý: tồn âm → cycle_count; tồn ≤ điểm đặt hàng → putaway (bổ sung)."""
+    negative = result["stock"] < 0
+    below = (result["stock"] <= result["reorder_point"]) & (result["daily_demand"] > 0)
+    picked = result[negative | below].copy()
+    picked["wh"] = picked["sku"].map(main_wh).fillna("UNKNOWN")
+    picked["task_type"] = np.where(picked["stock"] < 0, "cycle_count", "putaway")
+    picked["priority"] = np.where(
+        (picked["stock"] < 0) | (picked["days_of_cover"] <= lead_time), "high",
+        np.where(picked["days_of_cover"] <= horizon_days, "normal", "low"))
+    picked["order_qty"] = np.maximum(
+        np.ceil(picked["reorder_point"] + picked["daily_demand"] * horizon_days - picked["stock"]), 0)
+    return picked.sort_values(["days_of_cover", "sku"])
+
+
+def _task_upserts(picked: pd.DataFrame, now: datetime) -> list:
+    ops = []
+    for row in picked.itertuples(index=False):
+        cover = None if math.isinf(row.days_of_cover) else float(row.days_of_cover)
+        due = now + timedelta(days=max(min(cover or 0.0, FORECAST_LEAD_TIME_DAYS), 0.0))
+        title = (f"Kiểm kê SKU {row.sku} (tồn âm {int(row.stock)})" if row.task_type == "cycle_count"
+                 else f"Bổ sung {int(row.order_qty)} SKU {row.sku} (còn ~{cover} ngày)")
+        ops.append(UpdateOne(
+            # Task đã được nhận (in_progress) vẫn là task của SKU này → cập nhật, không tạo task open thứ hai
+            {"source": FORECAST_SOURCE, "status": {"$in": ["open", "in_progress"]}, "type": row.task_type,
+             "payload.sku": row.sku},
+            {"$set": {"title": title, "priority": row.priority, "due_at": due, "updated_at": now,
+                      "priority_rank": priority_rank(row.priority), "due_sort": due,
+                      "payload": {"sku": row.sku, "wh": row.wh},
+                      "forecast": {"daily_demand": float(row.daily_demand), "reorder_point": float(row.reorder_point),
+                                   "safety_stock": float(row.safety_stock), "order_qty": float(row.order_qty)}},
+             "$setOnInsert": {"status": "open", "assignee": None, "created_at": now}},
+            upsert=True,
+        ))
+    return ops
+
+
+def run_forecast(window_days: int = None, method: str = "ses", horizon_days: float = 7,
+                 lead_time: float = None, create_tasks: bool = False, source: str = "rollups",
+                 batch_size: int = None) -> dict:
+    """
+    Dự báo cho mọi SKU có xuất kho trong `window_days` ngày gần nhất.
+    `create_tasks=True` → upsert task đề xuất vào `tasks` (cập nhật task forecast đang mở / đang làm thay vì tạo trùng).
+    """
+    started = time.perf_counter()
+    window_days = int(window_days or FORECAST_WINDOW_DAYS)
+    lead_time = float(lead_time or FORECAST_LEAD_TIME_DAYS)
+    batch_size = int(batch_size or REBUILD_BATCH_SIZE)
+    now = datetime.utcnow()
+    start = bucket_start(now, "day") - timedelta(days=window_days - 1)
+
+    frame = load_daily_outbound(start, source)
+    loaded = time.perf_counter()
+    if frame.empty:
+        return {"skus": 0, "suggestions": [], "tasks_upserted": 0, "seconds": round(loaded - started, 3)}
+
+    matrix, skus, main_wh = demand_matrix(frame, start, window_days)
+    result = compute_forecast(matrix, skus, load_stock(), method=method, lead_time=lead_time)
+    picked = suggest(result, main_wh, lead_time, horizon_days)
+    computed = time.perf_counter()
+
+    upserted = 0
+    if create_tasks and len(picked):
+        ops = _task_upserts(picked, now)
+        for i in range(0, len(ops), batch_size):
+            res = tasks.bulk_write(ops[i:i + batch_size], ordered=False)
+            upserted += res.upserted_count + res.modified_count
+        invalidate_tasks()
+
+    cover = picked["days_of_cover"]
+    picked["days_of_cover"] = cover.astype(object).where(np.isfinite(cover), None)   # inf → null trong JSON
+    suggestions = picked.to_dict("records")
+    return {
+        "skus": len(skus),
+        "rows": len(frame),
+        "suggestions": suggestions,
+        "tasks_upserted": upserted,
+        "load_seconds": round(loaded - started, 3),
+        "compute_seconds": round(computed - loaded, 3),
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+
+
+if __name__ == "__main__":
+    # python -m app.forecast [--create-tasks] [--source transactions]
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Dự báo nhu cầu và điểm đặt hàng lại")
+    parser.add_argument("--window", type=int, default=None)
+    parser.add_argument("--method", choices=["ses", "ma"], default="ses")
+    parser.add_argument("--horizon", type=float, default=7)
+    parser.add_argument("--source", choices=["rollups", "transactions"], default="rollups")
+    parser.add_argument("--create-tasks", action="store_true")
+    opts = parser.parse_args()
+    report = run_forecast(opts.window, opts.method, opts.horizon, create_tasks=opts.create_tasks, source=opts.source)
+    print(f"{report['skus']} SKU, {len(report['suggestions'])} đề xuất, {report['tasks_upserted']} task, "
+          f"{report['seconds']}s")
@@ -0,0 +1,148 @@
+from datetime import datetime
+
+# ============================================================
+# Lớp trình bày: record → câu trả lời chat / JSON gọn
+# ============================================================
+# Các hàm dữ liệu trong agent.py trả về record (Transaction, Inventory, Task); tools và
+# intent router dùng các hàm format_* bên dưới để ra chuỗi tiếng Việt như trước, còn REST
+# trả về JSON qua project() với đúng các cột client yêu cầu (?fields=sku,qty).
+
+
+def _time(value) -> str:
+    return value.strftime('%Y-%m-%d %H:%M:%S') if isinstance(value, datetime) else str(value or "")
+
+
+def _due(value) -> str:
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value)
+        except ValueError:
+            return value
+    return value.strftime("%d-%m-%Y %H:%M") if isinstance(value, datetime) else "N/A"
+
+
+def _more(lines: list, next_cursor: str = None) -> list:
+    if lines and next_cursor:
+        lines.append(f"➡ Còn tiếp, cursor: {next_cursor}")
+    return lines
+
+
+# ---------------- chuỗi chat ----------------
+def format_stock(record, sku: str, wh: str = None) -> str:
+    if wh:
+        if record:
+            return f"📦 Tồn kho SKU {sku} tại kho {wh}: {record.qty} sản phẩm."
+        return f"❌ Không tìm thấy tồn kho cho SKU {sku} tại kho {wh}."
+    if record:
+        return f"📦 Tồn kho SKU {sku}: {record.qty} sản phẩm."
+    return f"❌ Không tìm thấy tồn kho cho SKU {sku}."
+
+
+def format_history(records: list, sku: str) -> str:
+    logs = [
+        f"{_time(t.at)} - {t.type} {t.qty} (by {t.by}, wh: {t.wh}, note: {t.note or ''})"
+        for t in records
+    ]
+    return "\n".join(logs) if logs else f"❌ Không có giao dịch nào cho {sku}."
+
+
+def format_transactions(records: list, next_cursor: str = None) -> str:
+    results = [
+        f"{_time(t.at)} | {t.type} {t.qty} "
+        f"(SKU {t.sku}, Kho: {t.wh}, By: {t.by}, Note: {t.note or ''})"
+        for t in records
+    ]
+    return "\n".join(_more(results, next_cursor)) if results else "❌ Không tìm thấy giao dịch phù hợp."
+
+
+def format_inventories(records: list, next_cursor: str = None) -> str:
+    results = []
+    for item in records:
+        line = (
+            f"📦 {item.name or '(no name)'} (SKU: {item.sku})\n"
+            f"   ➡ Số lượng: {item.qty} {item.uom or 'EA'}\n"
+            f"   ➡ Kho: {item.wh or '?'} - Vị trí: {item.location or '?'}\n"
+        )
+        # Nếu có imageUrl thì hiển thị
+        if item.imageUrl:
+            line += f"   🖼 Ảnh: {item.imageUrl}\n"
+        results.append(line)
+    return "\n".join(_more(results, next_cursor)) if results else "❌ Không tìm thấy sản phẩm phù hợp."
+
+
+def _task_line(t) -> str:
+    scope = f" [{t.payload.sku}@{t.payload.wh}]" if t.payload else ""
+    return f"- {t.id}: {t.title or t.type or '(no title)'}{scope} | Ưu tiên: {t.priority or 'normal'} | Hạn: {_due(t.due_at)}"
+
+
+def format_open_tasks(records: list, next_cursor: str = None) -> str:
+    if not records:
+        return "✅ Không có task nào đang mở."
+    lines = ["📋 Danh sách task đang mở:"] + [_task_line(t) for t in records]
+    return "\n".join(_more(lines, next_cursor))
+
+
+def format_task_search(records: list, next_cursor: str = None) -> str:
+    if not records:
+        return "🔎 Không tìm thấy task nào phù hợp."
+    lines = ["🔎 Kết quả tìm kiếm task:"] + [
+        f"{_task_line(t)} | Trạng thái: {t.status or 'N/A'}" + (f" | {t.assignee}" if t.assignee else "")
+        for t in records
+    ]
+    return "\n".join(_more(lines, next_cursor))
+
+
+def format_claimed(records: list, worker: str, wh: str) -> str:
+    if not records:
+        return f"✅ Kho {wh} không còn task nào chờ nhận."
+    lease = _due(records[0].lease_until)
+    head = (f"📦 {worker} nhận lô {len(records)} task pick (giữ tới {lease}), đi theo thứ tự:" if len(records) > 1
+            else f"📌 {worker} nhận task (giữ tới {lease}):")
+    return "\n".join([head] + [_task_line(t) for t in records])
+
+
+def format_movements(series: list, totals, granularity: str = "day", sku: str = None, wh: str = None) -> str:
+    scope = " ".join(x for x in (f"SKU {sku}" if sku else "", f"kho {wh}" if wh else "") if x) or "toàn hệ thống"
+    if not series:
+        return f"❌ Không có giao dịch nào của {scope} trong khoảng thời gian này."
+    pattern = "%Y-%m-%d %H:00" if granularity == "hour" else "%Y-%m-%d"
+    lines = [f"📊 Nhập/xuất của {scope} theo {'giờ' if granularity == 'hour' else 'ngày'}:"]
+    for m in series:
+        lines.append(f"- {m.t.strftime(pattern)}: nhập {m.inbound}, xuất {m.outbound}, ròng {m.net:+d} ({m.count} GD)")
+    lines.append(f"➡ Tổng: nhập {totals.inbound}, xuất {totals.outbound}, ròng {totals.net:+d} ({totals.count} GD)")
+    return "\n".join(lines)
+
+
+def format_forecast(report: dict, limit: int = 10) -> str:
+    suggestions = report["suggestions"]
+    if not suggestions:
+        return f"✅ Không có SKU nào sắp hết hàng ({report['skus']} SKU đã dự báo)."
+    lines = [f"📈 {len(suggestions)}/{report['skus']} SKU cần bổ sung hoặc kiểm kê:"]
+    for s in suggestions[:limit]:
+        cover = "∞" if s["days_of_cover"] is None else s["days_of_cover"]
+        lines.append(
+            f"- {s['sku']} (kho {s['wh']}): tồn {int(s['stock'])}, nhu cầu ~{s['daily_demand']}/ngày, "
+            f"còn {cover} ngày, điểm đặt hàng {int(s['reorder_point'])} → {s['task_type']} ({s['priority']})"
+        )
+    if len(suggestions) > limit:
+        lines.append(f"... và {len(suggestions) - limit} SKU khác")
+    if report.get("tasks_upserted"):
+        lines.append(f"📝 Đã tạo/cập nhật {report['tasks_upserted']} task đề xuất.")
+    return "\n".join(lines)
+
+
+# ---------------- JSON cho REST ----------------
+def parse_fields(fields: str, model) -> set:
+    """'sku,qty' → {'sku', 'qty'}; None/'' → None (mọi cột). Cột không có trong model → ValueError."""
+    if not fields:
+        return None
+    wanted = {f.strip() for f in fields.split(",") if f.strip()}
+    unknown = wanted - set(model.model_fields)
+    if unknown:
+        raise ValueError(f"fields không hợp lệ: {', '.join(sorted(unknown))}")
+    return wanted
+
+
+def project(record, fields: set = None) -> dict:
+    """Record → dict JSON, chỉ giữ các cột yêu cầu và bỏ cột rỗng."""
+    return record.model_dump(mode="json", include=fields, exclude_none=True)
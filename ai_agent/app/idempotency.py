@@ -0,0 +1,73 @@
+import hashlib
+import json
+from datetime import datetime
+from pymongo.errors import DuplicateKeyError
+from .database import db, run_in_transaction
+
+# ============================================================
+# Idempotency-Key cho các API ghi (máy quét gửi lại khi timeout)
+# ============================================================
+# Key được ghi vào idempotency_keys (_id = "<scope>:<key>", unique sẵn) ở đầu CÙNG Mongo
+# transaction với thao tác ghi, kết quả trả về được lưu kèm ở cuối. Request gửi lại va vào
+# _id trùng ngay bước đầu → transaction bị hủy, không insert/$inc lần hai, và kết quả gốc
+# được đọc lại trả cho client. Kiểm tra trùng chỉ là 1 insert theo _id (index có sẵn);
+# TTL index trên created_at tự dọn key cũ.
+keys = db["idempotency_keys"]
+
+
+class IdempotencyError(Exception):
+    """Key đang được xử lý bởi request khác, hoặc đã dùng cho một request có nội dung khác."""
+
+    def __init__(self, message: str, status_code: int):
+        self.status_code = status_code
+        super().__init__(message)
+
+
+def fingerprint(request) -> str:
+    raw = json.dumps(request, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _replay(doc_id: str, request_hash: str):
+    stored = keys.find_one({"_id": doc_id}, {"_id": 0, "request": 1, "result": 1})
+    if stored is None:
+        return None, False
+    if stored.get("request") != request_hash:
+        raise IdempotencyError("Idempotency-Key đã được dùng cho một request khác.", 422)
+    if "result" not in stored:
+        raise IdempotencyError("Request với Idempotency-Key này đang được xử lý, vui lòng thử lại sau.", 409)
+    return stored["result"], True
+
+
+def run_idempotent(callback, key: str = None, scope: str = "", request=None):
+    """
+    run_in_transaction(callback) với key chống ghi trùng. callback(session) trả về kết quả
+    (chuỗi/dict) — kết quả này được lưu cùng key. Không có key → chạy như bình thường.
+    """
+    if not key:
+        return run_in_transaction(callback)
+    doc_id = f"{scope}:{key}"
+    request_hash = fingerprint(request)
+
+    def apply(session):
+        # Giữ chỗ key TRƯỚC khi ghi: request trùng dừng ngay ở insert này (DuplicateKey),
+        # chưa chạm tới transactions/tồn kho
+        keys.insert_one({"_id": doc_id, "request": request_hash, "created_at": datetime.utcnow()},
+                        session=session)
+        try:
+            result = callback(session)
+        except Exception:
+            if session is None:
+                # mongod standalone: không có rollback → nhả key để client gửi lại được
+                keys.delete_one({"_id": doc_id})
+            raise
+        keys.update_one({"_id": doc_id}, {"$set": {"result": result}}, session=session)
+        return result
+
+    try:
+        return run_in_transaction(apply)
+    except DuplicateKeyError:
+        result, found = _replay(doc_id, request_hash)
+        if not found:
+            raise   # trùng khóa ở collection khác, không phải key idempotency
+        return result
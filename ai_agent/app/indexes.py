@@ -0,0 +1,183 @@
+import logging
+from datetime import datetime
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import OperationFailure
+from .database import db
+from .config import IDEMPOTENCY_TTL
+from .task_query import TASK_SORT
+
+# ============================================================
+# Khai báo index cho mọi collection mà agent truy vấn
+# ============================================================
+# Mỗi index tương ứng một access path trong code (ghi chú bên cạnh).
+INDEXES = {
+    "transactions": [
+        # _id ở cuối để phân trang keyset (at, _id) không cần SORT trong bộ nhớ
+        ([("sku", ASCENDING), ("at", DESCENDING), ("_id", DESCENDING)], {"name": "sku_at_id"}),      # lịch sử theo SKU
+        ([("wh", ASCENDING), ("sku", ASCENDING), ("at", DESCENDING), ("_id", DESCENDING)],
+         {"name": "wh_sku_at_id"}),                                                                  # tìm theo kho + SKU
+        ([("wh", ASCENDING), ("at", DESCENDING), ("_id", DESCENDING)], {"name": "wh_at_id"}),        # export theo kho
+        ([("by_lc", ASCENDING), ("at", DESCENDING), ("_id", DESCENDING)], {"name": "by_lc_at_id"}),  # tìm theo user
+        ([("at", ASCENDING), ("_id", ASCENDING)], {"name": "at_id"}),                                # đối soát, export toàn bộ
+    ],
+    "inventories": [
+        ([("sku", ASCENDING), ("_id", ASCENDING)], {"name": "sku_id"}),
+        ([("name_lc", ASCENDING)], {"name": "name_lc"}),                       # tìm theo tên
+        ([("wh", ASCENDING)], {"name": "wh"}),
+        ([("updatedAt", ASCENDING)], {"name": "updatedAt"}),                   # refresh search index
+    ],
+    "stock_balances": [
+        ([("sku", ASCENDING), ("wh", ASCENDING)], {"name": "sku_wh_unique", "unique": True}),
+        ([("wh", ASCENDING), ("sku", ASCENDING), ("_id", ASCENDING)], {"name": "wh_sku_id"}),
+    ],
+    "inventory_ledger": [
+        ([("sku", ASCENDING)], {"name": "sku_unique", "unique": True}),
+    ],
+    "movement_rollups": [
+        ([("g", ASCENDING), ("sku", ASCENDING), ("wh", ASCENDING), ("t", ASCENDING)],
+         {"name": "g_sku_wh_t_unique", "unique": True}),                                        # $inc bucket, theo SKU
+        ([("g", ASCENDING), ("wh", ASCENDING), ("t", ASCENDING)], {"name": "g_wh_t"}),          # throughput theo kho
+        ([("g", ASCENDING), ("t", ASCENDING)], {"name": "g_t"}),                                # toàn hệ thống
+    ],
+    "idempotency_keys": [
+        # _id = "<scope>:<key>" đã unique sẵn; TTL dọn key hết hạn
+        ([("created_at", ASCENDING)], {"name": "created_at_ttl", "expireAfterSeconds": IDEMPOTENCY_TTL}),
+    ],
+    "tasks": [
+        ([("status", ASCENDING), ("created_at", DESCENDING)], {"name": "status_created_at"}),
+        # Filter bằng (status + 1 trường), sort (priority_rank, due_sort, _id) – xem app/task_query.py
+        ([("status", ASCENDING), ("priority_rank", ASCENDING), ("due_sort", ASCENDING), ("_id", ASCENDING)],
+         {"name": "status_priority_due"}),
+        ([("status", ASCENDING), ("payload.wh", ASCENDING), ("priority_rank", ASCENDING),
+          ("due_sort", ASCENDING), ("_id", ASCENDING)], {"name": "status_wh_priority_due"}),
+        ([("status", ASCENDING), ("assignee", ASCENDING), ("priority_rank", ASCENDING),
+          ("due_sort", ASCENDING), ("_id", ASCENDING)], {"name": "status_assignee_priority_due"}),
+        ([("payload.sku", ASCENDING), ("status", ASCENDING), ("priority_rank", ASCENDING),
+          ("due_sort", ASCENDING), ("_id", ASCENDING)], {"name": "sku_status_priority_due"}),
+        ([("status", ASCENDING), ("lease_until", ASCENDING)], {"name": "status_lease_until"}),   # requeue hết lease
+        ([("source", ASCENDING), ("status", ASCENDING), ("type", ASCENDING), ("payload.sku", ASCENDING)],
+         {"name": "source_status_type_sku"}),                                  # upsert task đề xuất từ forecast
+    ],
+}
+
+
+logger = logging.getLogger(__name__)
+
+INDEX_OPTIONS_CONFLICT = 85   # cùng key, khác tên/tùy chọn
+
+
+def _ensure_index(coll, keys: list, options: dict) -> str:
+    """
+    create_index; nếu đã có index cùng key dưới tên khác (vd. Mongoose tạo `sku_1` từ `index: true`,
+    hoặc bản khai báo cũ trước khi đổi tên) thì dùng lại index đó thay vì làm startup thất bại.
+    Chỉ dùng lại khi cùng tính unique, để không âm thầm mất ràng buộc.
+    """
+    try:
+        return coll.create_index(keys, **options)
+    except OperationFailure as e:
+        if e.code != INDEX_OPTIONS_CONFLICT:
+            raise
+        wanted = [(field, int(direction)) for field, direction in keys]
+        for name, info in coll.index_information().items():
+            if ([(f, int(d)) for f, d in info["key"]] == wanted
+                    and bool(info.get("unique")) == bool(options.get("unique"))):
+                logger.warning("index %s.%s đã có dưới tên %s, dùng lại", coll.name, options.get("name"), name)
+                return name
+        raise
+
+
+def ensure_indexes() -> dict:
+    """Tạo các index còn thiếu (create_index là idempotent). Trả về tên index theo collection."""
+    created = {}
+    for collection, specs in INDEXES.items():
+        created[collection] = [_ensure_index(db[collection], keys, options) for keys, options in specs]
+    return created
+
+
+# ============================================================
+# Audit query plan bằng explain()
+# ============================================================
+# Các query mẫu đúng hình dạng mà tools đang chạy: (tên, collection, filter, sort)
+AUDIT_QUERIES = [
+    ("get_stock_by_sku", "inventories", {"sku": "LT001"}, None),
+    ("get_stock_by_name", "inventories", {"name_lc": "laptop"}, None),
+    ("get_stock_by_sku (kho)", "stock_balances", {"sku": "LT001", "wh": "WH01"}, None),
+    ("get_transaction_history", "transactions", {"sku": "LT001"}, [("at", -1)]),
+    ("search_transactions (user)", "transactions", {"by_lc": "an"}, [("at", -1), ("_id", -1)]),
+    ("search_transactions (kho+SKU)", "transactions", {"wh": "WH01", "sku": "LT001"}, [("at", -1), ("_id", -1)]),
+    ("export transactions (kho)", "transactions", {"wh": "WH01"}, [("at", -1), ("_id", -1)]),
+    ("search_inventories (kho)", "stock_balances", {"wh": "WH01"}, [("sku", 1), ("_id", 1)]),
+    ("search_inventories (trang)", "inventories", {}, [("sku", 1), ("_id", 1)]),
+    ("reconcile_inventory", "transactions", {"at": {"$gt": datetime(2025, 1, 1)}}, [("at", 1), ("_id", 1)]),
+    ("movement_series (sku)", "movement_rollups",
+     {"g": "day", "sku": "LT001", "t": {"$gte": datetime(2025, 1, 1)}}, None),
+    ("movement_series (kho)", "movement_rollups",
+     {"g": "day", "wh": "WH01", "t": {"$gte": datetime(2025, 1, 1)}}, None),
+    ("get_open_tasks", "tasks", {"status": "open"}, [("created_at", -1)]),
+    ("get_open_tasks (ưu tiên)", "tasks", {"status": "open"}, TASK_SORT),
+    ("search_tasks (sku)", "tasks", {"status": {"$in": ["open", "done"]}, "payload.sku": "LT001"}, TASK_SORT),
+    ("search_tasks (kho)", "tasks", {"status": "open", "payload.wh": "WH01"}, TASK_SORT),
+    ("search_tasks (nhân viên)", "tasks", {"status": "open", "assignee": "An"}, TASK_SORT),
+    ("claim_task", "tasks", {"$or": [
+        {"status": "open", "payload.wh": "WH01", "assignee": {"$in": [None, "An"]}},
+        {"status": "in_progress", "payload.wh": "WH01", "assignee": {"$in": [None, "An"]},
+         "lease_until": {"$lt": datetime(2025, 1, 1)}}]}, TASK_SORT),
+    ("requeue_expired", "tasks", {"status": "in_progress", "lease_until": {"$lt": datetime(2025, 1, 1)}}, None),
+    ("search_tasks (quá hạn)", "tasks", {"status": "open", "due_sort": {"$lt": datetime(2025, 1, 1)}}, TASK_SORT),
+]
+
+
+def _stages(plan: dict):
+    """Duyệt đệ quy cây winningPlan, trả về mọi stage."""
+    if not isinstance(plan, dict):
+        return
+    if "stage" in plan:
+        yield plan
+    for key in ("inputStage", "queryPlan"):
+        if key in plan:
+            yield from _stages(plan[key])
+    for child in plan.get("inputStages", []) + plan.get("shards", []):
+        yield from _stages(child.get("winningPlan", child))
+
+
+def audit_query(collection: str, filter: dict, sort=None) -> dict:
+    cursor = db[collection].find(filter)
+    if sort:
+        cursor = cursor.sort(sort)
+    plan = cursor.explain()["queryPlanner"]["winningPlan"]
+    stages = [s["stage"] for s in _stages(plan)]
+    index_names = [s["indexName"] for s in _stages(plan) if "indexName" in s]
+    problems = []
+    if "COLLSCAN" in stages:
+        problems.append("COLLSCAN")
+    if "SORT" in stages:
+        problems.append("in-memory SORT")
+    return {"stages": stages, "indexes": index_names, "problems": problems}
+
+
+def audit_indexes() -> list:
+    return [dict(name=name, collection=collection, **audit_query(collection, filter, sort))
+            for name, collection, filter, sort in AUDIT_QUERIES]
+
+
+def format_audit(report: list) -> str:
+    lines = []
+    for r in report:
+        status = "❌ " + ", ".join(r["problems"]) if r["problems"] else "✅"
+        lines.append(f"{status} {r['name']} [{r['collection']}] "
+                     f"stages={'>'.join(r['stages'])} index={','.join(r['indexes']) or '-'}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    # python -m app.indexes ensure | audit
+    import sys
+
+    command = sys.argv[1] if len(sys.argv) > 1 else "audit"
+    if command == "ensure":
+        for collection, names in ensure_indexes().items():
+            print(f"✅ {collection}: {', '.join(names)}")
+    else:
+        report = audit_indexes()
+        print(format_audit(report))
+        sys.exit(1 if any(r["problems"] for r in report) else 0)
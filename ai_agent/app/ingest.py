@@ -0,0 +1,123 @@
+import csv
+import io
+from datetime import datetime
+from .database import db
+from .idempotency import run_idempotent, IdempotencyError
+from .stock import fold_stock_deltas, revert_stock_deltas, InsufficientStockError
+from .rollups import apply_rollups
+from .cache import invalidate_skus
+from .text import search_key
+from .search_index import product_index
+
+# ============================================================
+# Nhập/xuất kho theo lô (pallet manifest từ máy quét)
+# ============================================================
+transactions = db["transactions"]
+
+TRANSACTION_TYPES = ("inbound", "outbound")
+CSV_FIELDS = ["sku", "qty", "wh", "by", "note"]
+
+
+def parse_csv_lines(text: str) -> list:
+    """CSV theo định dạng sku,qty,wh,by,note (dòng tiêu đề 'sku,...' nếu có sẽ bị bỏ qua)."""
+    rows = []
+    for parts in csv.reader(io.StringIO(text.strip())):
+        if not parts or not any(p.strip() for p in parts):
+            continue
+        if parts[0].strip().lower() == "sku":
+            continue
+        rows.append(dict(zip(CSV_FIELDS, (p.strip() for p in parts))))
+    return rows
+
+
+def normalize_line(line: dict, default_type: str) -> dict:
+    """Chuẩn hóa 1 dòng thành document transaction; raise ValueError nếu thiếu/sai dữ liệu."""
+    if not isinstance(line, dict):
+        raise ValueError("dòng phải là object JSON {sku, qty, wh, by, ...}")
+    sku = str(line.get("sku") or "").strip()
+    wh = str(line.get("wh") or line.get("warehouse") or "").strip()
+    by = str(line.get("by") or "").strip()
+    tx_type = str(line.get("type") or default_type).strip().lower()
+    raw_qty = line.get("qty", line.get("quantity"))
+
+    if not sku:
+        raise ValueError("thiếu sku")
+    if not wh:
+        raise ValueError("thiếu kho (wh)")
+    if not by:
+        raise ValueError("thiếu người thực hiện (by)")
+    if tx_type not in TRANSACTION_TYPES:
+        raise ValueError(f"loại giao dịch không hợp lệ: {tx_type}")
+    try:
+        qty = int(raw_qty)
+    except (TypeError, ValueError):
+        raise ValueError(f"số lượng không hợp lệ: {raw_qty}")
+    if qty <= 0:
+        raise ValueError("số lượng phải > 0")
+
+    return {"sku": sku, "type": tx_type, "qty": qty, "wh": wh,
+            "by": by, "by_lc": search_key(by), "note": str(line.get("note") or "")}
+
+
+def add_transactions_batch(lines: list, default_type: str = "inbound", idempotency_key: str = None) -> dict:
+    """
+    Ghi nhiều transaction bằng 1 insert_many và cộng tồn kho bằng 1 bulk_write
+    (net delta theo SKU/kho), tất cả trong cùng 1 Mongo transaction.
+    Dòng lỗi validate hoặc xuất vượt tồn được báo riêng và không chặn các dòng hợp lệ.
+    Có idempotency_key → lô gửi lại trả về đúng báo cáo của lần ghi đầu.
+    """
+    now = datetime.utcnow()
+    results = []
+    docs = []
+    deltas = {}
+    for i, line in enumerate(lines, start=1):
+        try:
+            doc = normalize_line(line, default_type)
+        except ValueError as e:
+            results.append({"line": i, "ok": False, "error": str(e)})
+            continue
+        doc["at"] = now
+        docs.append(doc)
+        key = (doc["sku"], doc["wh"])
+        deltas[key] = deltas.get(key, 0) + (doc["qty"] if doc["type"] == "inbound" else -doc["qty"])
+        results.append({"line": i, "ok": True, "sku": doc["sku"], "type": doc["type"],
+                        "qty": doc["qty"], "wh": doc["wh"]})
+
+    while docs:
+        def apply(session):
+            # Trừ/cộng tồn trước (xuất ròng có điều kiện qty >= n), rồi mới ghi transaction
+            fold_stock_deltas(deltas, now, session=session)
+            try:
+                transactions.insert_many(docs, session=session)
+                apply_rollups(docs, session=session)
+            except Exception:
+                if session is None:
+                    revert_stock_deltas(deltas, now)
+                raise
+            inserted = sum(1 for r in results if r["ok"])
+            return {"inserted": inserted, "failed": len(results) - inserted, "results": results}
+
+        try:
+            report = run_idempotent(apply, idempotency_key, "batch", [default_type, lines])
+            invalidate_skus({sku for sku, _wh in deltas})
+            product_index.mark_stale()
+            return report
+        except IdempotencyError:
+            raise
+        except InsufficientStockError as e:
+            # Bỏ các dòng của (sku, kho) không đủ hàng rồi ghi lại phần còn lại của lô
+            key = (e.sku, e.wh)
+            for r in results:
+                if r["ok"] and (r["sku"], r["wh"]) == key:
+                    r.update(ok=False, error=str(e))
+            docs = [d for d in docs if (d["sku"], d["wh"]) != key]
+            deltas.pop(key, None)
+        except Exception as e:
+            # Cả lô bị rollback → đánh dấu mọi dòng hợp lệ là lỗi
+            for r in results:
+                if r["ok"]:
+                    r.update(ok=False, error=f"lỗi ghi Mongo: {e}")
+            break
+
+    inserted = sum(1 for r in results if r["ok"])
+    return {"inserted": inserted, "failed": len(results) - inserted, "results": results}
@@ -0,0 +1,142 @@
+import re
+import threading
+from . import agent
+from .formatters import format_stock, format_history, format_inventories
+
+# ============================================================
+# Bộ định tuyến intent trước khi gọi LLM
+# ============================================================
+# Phần lớn câu hỏi /ask là các mẫu cố định ("tồn kho SKU X", "lịch sử SKU X",
+# "nhập kho N SKU X vào kho Y bởi Z"...). Router chạy các regex đã có của tools;
+# nếu đúng MỘT intent khớp thì gọi thẳng tool (vài ms), ngược lại trả về None để
+# /ask chuyển sang ReAct agent.
+
+STOCK_PATTERN = re.compile(
+    r"tồn kho.*?(?:sku|mã)\s*([A-Za-z0-9\-]+)(?:.*?\bkho\s+([A-Za-z0-9\-]+))?", re.IGNORECASE)
+HISTORY_PATTERN = re.compile(r"lịch sử.*?(?:sku|mã)\s*([A-Za-z0-9\-]+)", re.IGNORECASE)
+TRANSACTION_SEARCH_PATTERN = re.compile(
+    r"giao dịch.*(?:user\s+\w+|kho\s+\w+.*sku\s+\w+)", re.IGNORECASE)
+PRODUCT_LIST_PATTERN = re.compile(r"(?:liệt kê|danh sách)\s+sản phẩm.*\bkho\s+(\w+)", re.IGNORECASE)
+MOVEMENT_PATTERN = re.compile(
+    r"(?:nhập|xuất|ròng|throughput).*(?:theo (?:ngày|giờ)|tuần này|tháng này|quý này|hôm nay|\d+\s*(?:ngày|giờ|tuần) qua)",
+    re.IGNORECASE)
+TASK_PATTERN = re.compile(r"\btask\b", re.IGNORECASE)
+OPEN_PATTERN = re.compile(r"đang mở|\bopen\b", re.IGNORECASE)
+
+
+def _inbound(text):
+    if agent.INBOUND_PATTERN.search(text):
+        return lambda: agent.inbound_tool_wrapper(text)
+
+
+def _outbound(text):
+    if agent.OUTBOUND_PATTERN.search(text):
+        return lambda: agent.outbound_tool_wrapper(text)
+
+
+def _stock(text):
+    match = STOCK_PATTERN.search(text)
+    if match:
+        sku, wh = match.groups()
+        return lambda: format_stock(agent.get_stock_by_sku(sku, wh), sku, wh)
+
+
+def _history(text):
+    match = HISTORY_PATTERN.search(text)
+    if match:
+        return lambda: format_history(agent.get_transaction_history(match.group(1)), match.group(1))
+
+
+def _search_transactions(text):
+    if TRANSACTION_SEARCH_PATTERN.search(text):
+        return lambda: agent.search_transactions_tool(text)
+
+
+def _list_products(text):
+    match = PRODUCT_LIST_PATTERN.search(text)
+    if match and "giao dịch" not in text.lower():
+        return lambda: format_inventories(*agent.search_inventories(wh=match.group(1)))
+
+
+def _movements(text):
+    if MOVEMENT_PATTERN.search(text):
+        return lambda: agent.movement_rollup_tool(text)
+
+
+def _dispatch(text):
+    if agent.TASK_ACTION_PATTERN.search(text):
+        return lambda: agent.task_action_tool(text)
+    if agent.CLAIM_PATTERN.search(text) and agent.extract_assignee(text) and agent.extract_wh(text):
+        return lambda: agent.claim_task_tool(text)
+
+
+def _tasks(text):
+    if not TASK_PATTERN.search(text) or agent.CLAIM_PATTERN.search(text) or agent.TASK_ACTION_PATTERN.search(text):
+        return None
+    filters = agent.extract_task_filters(text)
+    if set(filters) - {"status", "cursor"}:
+        return lambda: agent.search_tasks_tool(text)
+    if OPEN_PATTERN.search(text):
+        return lambda: agent.open_tasks_tool(text)
+
+
+INTENTS = [
+    ("inbound", _inbound),
+    ("outbound", _outbound),
+    ("stock", _stock),
+    ("history", _history),
+    ("search_transactions", _search_transactions),
+    ("list_products", _list_products),
+    ("movements", _movements),
+    ("dispatch", _dispatch),
+    ("tasks", _tasks),
+]
+
+
+class IntentRouter:
+    def __init__(self, intents=INTENTS):
+        self.intents = intents
+        self._lock = threading.Lock()
+        self.hits = {name: 0 for name, _ in intents}
+        self.fallbacks = 0
+        self.ambiguous = 0
+
+    def match(self, text: str):
+        """Trả về (tên intent, hàm gọi tool) nếu đúng 1 intent khớp, ngược lại (None, None)."""
+        matches = []
+        for name, matcher in self.intents:
+            call = matcher(text)
+            if call:
+                matches.append((name, call))
+        if len(matches) == 1:
+            return matches[0]
+        if len(matches) > 1:
+            with self._lock:
+                self.ambiguous += 1
+        return None, None
+
+    def route(self, text: str):
+        """Gọi thẳng tool nếu nhận diện chắc chắn; None → để LLM xử lý."""
+        name, call = self.match((text or "").strip())
+        with self._lock:
+            if name is None:
+                self.fallbacks += 1
+            else:
+                self.hits[name] += 1
+        return call() if call else None
+
+    def stats(self) -> dict:
+        with self._lock:
+            routed = sum(self.hits.values())
+            total = routed + self.fallbacks
+            return {
+                "total": total,
+                "routed": routed,
+                "fallbacks": self.fallbacks,
+                "ambiguous": self.ambiguous,
+                "hit_rate": round(routed / total, 4) if total else 0.0,
+                "hits": dict(self.hits),
+            }
+
+
+intent_router = IntentRouter()
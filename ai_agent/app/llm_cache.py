@@ -0,0 +1,144 @@
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from typing import Optional
+from langchain_core.caches import BaseCache, RETURN_VAL_TYPE
+from langchain_core.load import dumps, loads
+
+# ============================================================
+# Cache câu trả lời LLM (SQLite, lưu trên đĩa)
+# ============================================================
+# ChatGroq chạy với temperature=0 nên cùng một prompt ReAct luôn cho cùng kết quả.
+# Khóa cache = hash(llm_string (model + tham số) + prompt đã chuẩn hóa + hash danh sách tool).
+# Mỗi bước ReAct chứa observation mới nhất của tool, nên khi dữ liệu đổi thì prompt
+# bước sau cũng đổi → không trả lời cũ. Câu hỏi ghi dữ liệu (nhập/xuất kho, rebuild...)
+# luôn bỏ qua cache.
+
+# Chỉ xét phần câu hỏi của user, vì phần mô tả tool trong prompt cũng chứa "nhập kho"...
+QUESTION_PATTERN = re.compile(r"Question:\s*(.*)")
+WRITE_INTENT_PATTERN = re.compile(
+    r"(nhập|xuất)\s+kho|inbound|outbound|rebuild|đồng bộ|đối soát|tạo\s+(task|đề xuất)"
+    r"|nhận\s+(task|việc|lô)|(hoàn thành|trả|gia hạn)\s+task", re.IGNORECASE)
+
+
+def normalize_prompt(prompt: str) -> str:
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFC", prompt)).strip()
+
+
+def tools_fingerprint(tools) -> str:
+    """Hash tên + mô tả tool: đổi danh sách tool thì cache cũ tự động không dùng nữa."""
+    spec = json.dumps([(t.name, t.description) for t in tools], ensure_ascii=False)
+    return hashlib.sha256(spec.encode("utf-8")).hexdigest()[:16]
+
+
+def prompt_text(prompt: str) -> str:
+    """
+    Với chat model (ChatGroq), LangChain đưa vào cache danh sách message đã serialize thành JSON
+    (tiếng Việt bị \\u-escape) → lấy lại nội dung message để regex tiếng Việt khớp được.
+    """
+    try:
+        messages = json.loads(prompt)
+    except ValueError:
+        return prompt
+    if not isinstance(messages, list):
+        return prompt
+    return "\n".join(str((m.get("kwargs") or {}).get("content", "")) if isinstance(m, dict) else str(m)
+                     for m in messages)
+
+
+def is_write_intent(prompt: str) -> bool:
+    prompt = prompt_text(prompt)
+    questions = QUESTION_PATTERN.findall(prompt)
+    text = questions[-1] if questions else prompt
+    return bool(WRITE_INTENT_PATTERN.search(text))
+
+
+class SQLiteLLMCache(BaseCache):
+    def __init__(self, path: str, tools_hash: str = "", ttl: float = 86400,
+                 max_entries: int = 50000, max_bytes: int = 256 * 1024 * 1024):
+        self.path = path
+        self.tools_hash = tools_hash
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL,"
+            " created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_accessed ON llm_cache (accessed_at)")
+        self._conn.commit()
+
+    def _key(self, prompt: str, llm_string: str) -> str:
+        raw = "\x1f".join([llm_string, normalize_prompt(prompt), self.tools_hash])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        if is_write_intent(prompt):
+            with self._lock:
+                self.bypassed += 1
+            return None
+        key = self._key(prompt, llm_string)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created_at FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            if row is None or now - row[1] >= self.ttl:
+                if row is not None:
+                    self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                    self._conn.commit()
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE llm_cache SET accessed_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+        return [loads(g) for g in json.loads(row[0])]
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        if is_write_intent(prompt):
+            return
+        value = json.dumps([dumps(g) for g in return_val])
+        size = len(value.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, size, created_at, accessed_at)"
+                " VALUES (?, ?, ?, ?, ?)",
+                (self._key(prompt, llm_string), value, size, now, now),
+            )
+            self._evict(now)
+            self._conn.commit()
+
+    def _evict(self, now: float):
+        self._conn.execute("DELETE FROM llm_cache WHERE created_at <= ?", (now - self.ttl,))
+        count, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_cache").fetchone()
+        while count > self.max_entries or total > self.max_bytes:
+            # Xóa entry ít được dùng gần đây nhất (LRU)
+            key, size = self._conn.execute(
+                "SELECT key, size FROM llm_cache ORDER BY accessed_at LIMIT 1").fetchone()
+            self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+            count, total = count - 1, total - size
+
+    def clear(self, **kwargs) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM llm_cache")
+            self._conn.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            count, total = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_cache").fetchone()
+            lookups = self.hits + self.misses
+            return {"entries": count, "bytes": total, "hits": self.hits, "misses": self.misses,
+                    "bypassed": self.bypassed, "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0}
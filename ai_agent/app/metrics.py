@@ -0,0 +1,301 @@
+import bisect
+import contextvars
+import json
+import logging
+import threading
+import time
+import uuid
+from functools import wraps
+from pymongo import monitoring
+from .config import LOG_LEVEL, LOG_FORMAT
+
+# ============================================================
+# Metrics (định dạng Prometheus) + trace theo từng request
+# ============================================================
+# Histogram/counter giữ trong bộ nhớ tiến trình, GET /metrics xuất dạng text của Prometheus.
+# Mỗi request HTTP có một RequestTrace (contextvar) được cộng dồn bởi: listener lệnh Mongo,
+# callback LLM của LangChain, wrapper của từng Tool. Cuối request middleware ghi 1 dòng log
+# có cấu trúc (request_id, route, thời gian, số round trip Mongo, token LLM, số bước agent).
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100)
+
+logger = logging.getLogger(__name__)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values)) + "}"
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames=()):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(labels.get(n, "") for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}   # nhãn → [số đếm theo bucket..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels.get(n, "") for n in self.labelnames)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.setdefault(key, [0] * (len(self.buckets) + 2))
+            if i < len(self.buckets):
+                series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        names = self.labelnames + ("le",)
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                cumulative = 0
+                for bound, n in zip(self.buckets, series):
+                    cumulative += n
+                    lines.append(f"{self.name}_bucket{_labels(names, key + (bound,))} {cumulative}")
+                lines.append(f"{self.name}_bucket{_labels(names, key + ('+Inf',))} {series[-1]}")
+                lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {series[-2]}")
+                lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {series[-1]}")
+        return lines
+
+
+HTTP_SECONDS = Histogram("http_request_duration_seconds", "Thời gian xử lý request HTTP",
+                         ("method", "route", "status"))
+TOOL_SECONDS = Histogram("agent_tool_duration_seconds", "Thời gian chạy một Tool", ("tool", "status"))
+MONGO_SECONDS = Histogram("mongo_command_duration_seconds", "Thời gian một lệnh Mongo", ("command",))
+MONGO_FAILURES = Counter("mongo_command_failures_total", "Lệnh Mongo lỗi", ("command",))
+MONGO_PER_REQUEST = Histogram("mongo_round_trips_per_request", "Số round trip Mongo mỗi request",
+                              ("route",), COUNT_BUCKETS)
+LLM_SECONDS = Histogram("llm_request_duration_seconds", "Thời gian một lần gọi LLM", ("model",))
+LLM_TOKENS = Counter("llm_tokens_total", "Token LLM đã dùng", ("model", "kind"))
+AGENT_STEPS = Histogram("agent_steps_per_request", "Số bước ReAct (lần gọi tool) mỗi lượt /ask",
+                        (), COUNT_BUCKETS)
+ASK_PATH = Counter("ask_requests_total", "Lượt /ask theo đường xử lý", ("path",))
+
+REGISTRY = [HTTP_SECONDS, TOOL_SECONDS, MONGO_SECONDS, MONGO_FAILURES, MONGO_PER_REQUEST,
+            LLM_SECONDS, LLM_TOKENS, AGENT_STEPS, ASK_PATH]
+
+
+def render_metrics() -> str:
+    return "\n".join(line for metric in REGISTRY for line in metric.render()) + "\n"
+
+
+# ============================================================
+# Trace theo request
+# ============================================================
+class RequestTrace:
+    def __init__(self, request_id: str = None):
+        self.request_id = request_id or uuid.uuid4().hex[:16]
+        self.mongo_calls = 0
+        self.mongo_seconds = 0.0
+        self.llm_calls = 0
+        self.llm_seconds = 0.0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.agent_steps = 0
+        self.tools = []            # [(tên tool, ms)]
+        self.path = None           # /ask: "intent" hoặc "agent"
+        self._lock = threading.Lock()
+
+    def add(self, **amounts):
+        with self._lock:
+            for field, amount in amounts.items():
+                setattr(self, field, getattr(self, field) + amount)
+
+    def summary(self) -> dict:
+        return {
+            "request_id": self.request_id,
+            "mongo_calls": self.mongo_calls,
+            "mongo_ms": round(self.mongo_seconds * 1000, 2),
+            "llm_calls": self.llm_calls,
+            "llm_ms": round(self.llm_seconds * 1000, 2),
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "agent_steps": self.agent_steps,
+            "tools": [{"tool": name, "ms": ms} for name, ms in self.tools],
+            "path": self.path,
+        }
+
+
+_trace = contextvars.ContextVar("request_trace", default=None)
+
+
+def current_trace():
+    return _trace.get()
+
+
+def start_trace(request_id: str = None) -> RequestTrace:
+    trace = RequestTrace(request_id)
+    _trace.set(trace)
+    return trace
+
+
+def observe_request(trace: RequestTrace, method: str, route: str, status: int, seconds: float):
+    HTTP_SECONDS.observe(seconds, method=method, route=route, status=status)
+    MONGO_PER_REQUEST.observe(trace.mongo_calls, route=route)
+    logger.info("request", extra={"fields": dict(
+        trace.summary(), method=method, route=route, status=status, ms=round(seconds * 1000, 2))})
+
+
+def set_ask_path(path: str):
+    ASK_PATH.inc(path=path)
+    trace = current_trace()
+    if trace:
+        trace.path = path
+        if path == "agent":
+            AGENT_STEPS.observe(trace.agent_steps)
+
+
+# ============================================================
+# Tool
+# ============================================================
+def timed_tool(name: str, func):
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        status = "error"
+        try:
+            result = func(*args, **kwargs)
+            # Tool bắt lỗi và trả về chuỗi "❌ ..." thay vì raise
+            status = "error" if isinstance(result, str) and result.startswith("❌") else "ok"
+            return result
+        finally:
+            seconds = time.perf_counter() - started
+            TOOL_SECONDS.observe(seconds, tool=name, status=status)
+            trace = current_trace()
+            if trace:
+                with trace._lock:
+                    trace.tools.append((name, round(seconds * 1000, 2)))
+    return wrapper
+
+
+def instrument_tools(tools: list) -> list:
+    """Bọc func của mọi Tool bằng timed_tool (gọi 1 lần khi khai báo danh sách tools)."""
+    for tool in tools:
+        tool.func = timed_tool(tool.name, tool.func)
+    return tools
+
+
+# ============================================================
+# Mongo: đếm round trip + thời gian qua CommandListener của pymongo
+# ============================================================
+class MongoCommandMetrics(monitoring.CommandListener):
+    # pymongo đồng bộ gọi listener trên chính thread chạy lệnh → contextvar của request vẫn đúng
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        self._record(event)
+
+    def failed(self, event):
+        MONGO_FAILURES.inc(command=event.command_name)
+        self._record(event)
+
+    def _record(self, event):
+        seconds = event.duration_micros / 1e6
+        MONGO_SECONDS.observe(seconds, command=event.command_name)
+        trace = current_trace()
+        if trace:
+            trace.add(mongo_calls=1, mongo_seconds=seconds)
+
+
+# ============================================================
+# LLM: callback LangChain đếm lượt gọi, token, thời gian và số bước agent
+# ============================================================
+_llm_callback = None
+
+
+def llm_callback():
+    """Callback handler dùng chung (tạo lười để module này không phải import langchain)."""
+    global _llm_callback
+    if _llm_callback is None:
+        from langchain_core.callbacks import BaseCallbackHandler
+
+        class LLMMetricsCallback(BaseCallbackHandler):
+            def __init__(self):
+                self._started = {}
+
+            def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+                self._started[run_id] = time.perf_counter()
+
+            def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+                self._started[run_id] = time.perf_counter()
+
+            def on_llm_end(self, response, *, run_id, **kwargs):
+                seconds = time.perf_counter() - self._started.pop(run_id, time.perf_counter())
+                output = response.llm_output or {}
+                usage = output.get("token_usage") or {}
+                model = output.get("model_name", "")
+                LLM_SECONDS.observe(seconds, model=model)
+                LLM_TOKENS.inc(usage.get("prompt_tokens", 0), model=model, kind="prompt")
+                LLM_TOKENS.inc(usage.get("completion_tokens", 0), model=model, kind="completion")
+                trace = current_trace()
+                if trace:
+                    trace.add(llm_calls=1, llm_seconds=seconds, prompt_tokens=usage.get("prompt_tokens", 0),
+                              completion_tokens=usage.get("completion_tokens", 0))
+
+            def on_llm_error(self, error, *, run_id, **kwargs):
+                self._started.pop(run_id, None)
+
+            def on_agent_action(self, action, **kwargs):
+                trace = current_trace()
+                if trace:
+                    trace.add(agent_steps=1)
+
+        _llm_callback = LLMMetricsCallback()
+    return _llm_callback
+
+
+# ============================================================
+# Log có cấu trúc
+# ============================================================
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        trace = current_trace()
+        if trace:
+            payload["request_id"] = trace.request_id
+        payload.update(getattr(record, "fields", {}))
+        if record.exc_info:
+            payload["exc"] = self.formatException(record.exc_info)
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+def configure_logging(level: str = LOG_LEVEL, fmt: str = LOG_FORMAT):
+    handler = logging.StreamHandler()
+    if fmt == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    root = logging.getLogger()
+    root.handlers[:] = [handler]
+    root.setLevel(level)
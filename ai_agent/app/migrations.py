@@ -0,0 +1,47 @@
+from pymongo import UpdateOne
+from .database import db
+from .text import search_key
+from .task_query import priority_rank, due_sort
+
+# ============================================================
+# Backfill khóa tìm kiếm / khóa sắp xếp dẫn xuất
+# ============================================================
+# transactions.by_lc, inventories.name_lc, tasks.priority_rank/due_sort được ghi khi insert;
+# migration này bổ sung cho dữ liệu cũ (và dữ liệu do hệ thống khác ghi). Chỉ đọc các document còn thiếu khóa
+# nên chạy lại nhiều lần vẫn an toàn: python -m app.migrations
+
+BACKFILLS = [
+    # (collection, trường nguồn, trường khóa, hàm tính khóa)
+    ("transactions", "by", "by_lc", search_key),
+    ("inventories", "name", "name_lc", search_key),
+    ("tasks", "priority", "priority_rank", priority_rank),
+    ("tasks", "due_at", "due_sort", due_sort),
+]
+
+
+def backfill_search_key(collection: str, source: str, target: str, batch_size: int = 1000,
+                        derive=search_key) -> int:
+    coll = db[collection]
+    cursor = coll.find({target: {"$exists": False}}, {source: 1}).batch_size(batch_size)
+    updated = 0
+    ops = []
+    for doc in cursor:
+        ops.append(UpdateOne({"_id": doc["_id"]}, {"$set": {target: derive(doc.get(source))}}))
+        if len(ops) >= batch_size:
+            coll.bulk_write(ops, ordered=False)
+            updated += len(ops)
+            ops = []
+    if ops:
+        coll.bulk_write(ops, ordered=False)
+        updated += len(ops)
+    return updated
+
+
+def run_backfills(batch_size: int = 1000) -> dict:
+    return {f"{collection}.{target}": backfill_search_key(collection, source, target, batch_size, derive)
+            for collection, source, target, derive in BACKFILLS}
+
+
+if __name__ == "__main__":
+    for field, count in run_backfills().items():
+        print(f"✅ {field}: đã cập nhật {count} document")
@@ -0,0 +1,32 @@
+from datetime import datetime
+from pydantic import BaseModel, Field
+from typing import Optional
+
+class Inventory(BaseModel):
+    sku: str = Field(..., description="Mã sản phẩm")
+    name: Optional[str] = Field(None, description="Tên sản phẩm")
+    qty: int = Field(0, description="Số lượng tồn (theo kho nếu có wh)")
+    uom: Optional[str] = Field(None, description="Đơn vị tính")
+    wh: Optional[str] = Field(None, description="Mã kho")
+    location: Optional[str] = Field(None, description="Vị trí trong kho")
+    imageUrl: Optional[str] = Field(None, description="Ảnh sản phẩm")
+    updatedAt: Optional[datetime] = Field(None, description="Lần cập nhật gần nhất")
+
+    @classmethod
+    def from_doc(cls, doc: dict) -> "Inventory":
+        fields = {k: doc[k] for k in cls.model_fields if k in doc}
+        fields.setdefault("qty", 0)
+        return cls.model_construct(**fields)
+
+    class Config:
+        schema_extra = {
+            "example": {
+                "sku": "LT001",
+                "name": "Laptop Dell Inspiron",
+                "qty": 25,
+                "uom": "EA",
+                "wh": "WH01",
+                "location": "A1-03",
+                "imageUrl": "https://example.com/lt001.png"
+            }
+        }
@@ -0,0 +1,10 @@
+from datetime import datetime
+from pydantic import BaseModel, Field
+from typing import Optional
+
+class Movement(BaseModel):
+    t: Optional[datetime] = Field(None, description="Đầu bucket (UTC)")
+    inbound: int = Field(0, description="Tổng nhập")
+    outbound: int = Field(0, description="Tổng xuất")
+    net: int = Field(0, description="Nhập - xuất")
+    count: int = Field(0, description="Số giao dịch")
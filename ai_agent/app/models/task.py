@@ -0,0 +1,34 @@
+from datetime import datetime
+from pydantic import BaseModel, Field
+from typing import Optional, Union
+
+class TaskPayload(BaseModel):
+    sku: Optional[str] = Field(None, description="Mã sản phẩm")
+    wh: Optional[str] = Field(None, description="Mã kho")
+
+class Task(BaseModel):
+    id: str = Field(..., description="Mã task (ObjectId dạng chuỗi)")
+    title: Optional[str] = Field(None, description="Tiêu đề")
+    type: Optional[str] = Field(None, description="Loại task: 'putaway', 'cycle_count' hoặc 'pick'")
+    status: Optional[str] = Field(None, description="Trạng thái: 'open', 'in_progress' hoặc 'done'")
+    priority: Optional[str] = Field(None, description="Độ ưu tiên: 'low', 'normal' hoặc 'high'")
+    payload: Optional[TaskPayload] = Field(None, description="SKU và kho liên quan")
+    assignee: Optional[str] = Field(None, description="Nhân viên phụ trách")
+    claimed_by: Optional[str] = Field(None, description="Nhân viên đang giữ task (khi in_progress)")
+    # Một số task cũ lưu hạn dạng chuỗi ISO
+    due_at: Optional[Union[datetime, str]] = Field(None, description="Hạn xử lý")
+    created_at: Optional[datetime] = Field(None, description="Thời điểm tạo")
+    lease_until: Optional[datetime] = Field(None, description="Hết hạn giữ task (khi in_progress)")
+    batch_id: Optional[str] = Field(None, description="Lô pick mà task thuộc về")
+
+    @classmethod
+    def from_doc(cls, doc: dict) -> "Task":
+        fields = {k: doc[k] for k in ("title", "type", "status", "priority", "assignee", "claimed_by", "due_at",
+                                      "created_at", "lease_until")
+                  if k in doc}
+        payload = doc.get("payload")
+        if isinstance(payload, dict):
+            fields["payload"] = TaskPayload.model_construct(sku=payload.get("sku"), wh=payload.get("wh"))
+        if doc.get("batch_id"):
+            fields["batch_id"] = str(doc["batch_id"])
+        return cls.model_construct(id=str(doc.get("_id")), **fields)
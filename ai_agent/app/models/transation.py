@@ -3,6 +3,7 @@ from pydantic import BaseModel, Field
 from typing import Optional
 
 class Transaction(BaseModel):
+    id: Optional[str] = Field(None, description="Mã giao dịch (ObjectId dạng chuỗi)")
     sku: str = Field(..., description="Mã sản phẩm")
     type: str = Field(..., description="Loại giao dịch: 'inbound' hoặc 'outbound'")
     qty: int = Field(..., gt=0, description="Số lượng sản phẩm")
@@ -11,6 +12,17 @@ class Transaction(BaseModel):
     note: Optional[str] = Field("", description="Ghi chú (nếu có)")
     at: datetime = Field(default_factory=datetime.utcnow, description="Thời gian giao dịch")
 
+    @classmethod
+    def from_doc(cls, doc: dict) -> "Transaction":
+        # Dữ liệu đọc từ Mongo đã hợp lệ → model_construct bỏ qua validate (nhanh hơn nhiều)
+        fields = {k: doc.get(k) for k in ("sku", "type", "qty", "wh", "by")}
+        fields["note"] = doc.get("note", "")
+        if "at" in doc:
+            fields["at"] = doc["at"]
+        if "_id" in doc:
+            fields["id"] = str(doc["_id"])
+        return cls.model_construct(**fields)
+
     class Config:
         schema_extra = {
             "example": {
@@ -0,0 +1,207 @@
+import base64
+import csv
+import io
+import json
+from datetime import datetime
+from bson.objectid import ObjectId
+from .database import db
+from .text import search_key
+from .search_index import search_products
+
+# ============================================================
+# Phân trang keyset + stream kết quả
+# ============================================================
+# Thay vì skip/limit (càng về sau càng chậm), mỗi trang bắt đầu ngay sau khóa sắp xếp
+# của dòng cuối trang trước: transactions theo (at, _id) giảm dần, tồn kho theo (sku, _id),
+# tìm sản phẩm theo tên theo vị trí trong bảng xếp hạng của chỉ mục tìm kiếm.
+# Khóa này được đóng gói thành cursor token (base64) mà client gửi lại nguyên vẹn.
+transactions = db["transactions"]
+inventories = db["inventories"]
+stock_balances = db["stock_balances"]
+
+TRANSACTION_FIELDS = ["_id", "at", "type", "sku", "qty", "wh", "by", "note"]
+INVENTORY_FIELDS = ["sku", "name", "qty", "uom", "wh", "location", "imageUrl"]
+TASK_FIELDS = ["_id", "title", "type", "status", "priority", "payload", "assignee", "claimed_by", "due_at",
+               "created_at"]
+
+
+def fields_projection(fields: list) -> dict:
+    """Projection Mongo cho đúng các cột được dùng (không có _id thì loại _id)."""
+    projection = dict.fromkeys(fields, 1)
+    if "_id" not in projection:
+        projection["_id"] = 0
+    return projection
+
+
+def encode_cursor(values: dict) -> str:
+    raw = {k: (v.isoformat() if isinstance(v, datetime) else str(v) if isinstance(v, ObjectId) else v)
+           for k, v in values.items()}
+    return base64.urlsafe_b64encode(json.dumps(raw).encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(token: str, keys=()) -> dict:
+    """Giải mã cursor token; `keys` là các khóa bắt buộc (cursor của danh sách khác → ValueError)."""
+    try:
+        raw = json.loads(base64.urlsafe_b64decode(token.encode("ascii")))
+        values = dict(raw)
+        for key in ("at", "due"):
+            if values.get(key) is not None:   # None: dòng thiếu khóa sắp xếp (vd. task chưa migrate)
+                values[key] = datetime.fromisoformat(values[key])
+        if "id" in values:
+            values["id"] = ObjectId(values["id"])
+    except Exception:
+        raise ValueError("cursor không hợp lệ")
+    if not set(keys) <= set(values):
+        raise ValueError("cursor không thuộc danh sách này")
+    return values
+
+
+def transaction_filter(user: str = None, wh: str = None, sku: str = None) -> dict:
+    q = {}
+    if user:
+        q["by_lc"] = search_key(user)
+    if wh:
+        q["wh"] = wh
+    if sku:
+        q["sku"] = sku
+    return q
+
+
+def _page(cursor, limit: int, key):
+    """Đọc limit + 1 dòng để biết còn trang sau hay không."""
+    if limit < 1:
+        raise ValueError("limit phải >= 1")
+    docs = list(cursor.limit(limit + 1))
+    next_cursor = encode_cursor(key(docs[limit - 1])) if len(docs) > limit else None
+    return docs[:limit], next_cursor
+
+
+def page_transactions(user: str = None, wh: str = None, sku: str = None,
+                      limit: int = 10, cursor: str = None, projection: dict = None):
+    """Một trang transactions mới nhất trước. Trả về (docs, next_cursor)."""
+    q = transaction_filter(user, wh, sku)
+    if cursor:
+        after = decode_cursor(cursor, ("at", "id"))
+        q["$or"] = [{"at": {"$lt": after["at"]}}, {"at": after["at"], "_id": {"$lt": after["id"]}}]
+    found = transactions.find(q, projection).sort([("at", -1), ("_id", -1)])
+    return _page(found, limit, lambda d: {"at": d["at"], "id": d["_id"]})
+
+
+def iter_transactions(user: str = None, wh: str = None, sku: str = None,
+                      projection: dict = None, batch_size: int = 1000):
+    """Stream toàn bộ transactions khớp filter (cursor Mongo, không nạp hết vào bộ nhớ)."""
+    q = transaction_filter(user, wh, sku)
+    return transactions.find(q, projection).sort([("at", -1), ("_id", -1)]).batch_size(batch_size)
+
+
+def page_inventories(wh: str = None, sku: str = None, limit: int = 20, cursor: str = None):
+    """
+    Một trang tồn kho theo thứ tự SKU. Có `wh` → đọc stock_balances của kho đó (số lượng theo kho)
+    rồi ghép thông tin sản phẩm bằng 1 truy vấn $in cho cả trang.
+    """
+    q = {}
+    if sku:
+        q["sku"] = sku
+    if cursor:
+        after = decode_cursor(cursor, ("sku", "id"))
+        q["$or"] = [{"sku": {"$gt": after["sku"]}}, {"sku": after["sku"], "_id": {"$gt": after["id"]}}]
+    key = lambda d: {"sku": d["sku"], "id": d["_id"]}
+
+    if not wh:
+        projection = dict.fromkeys(INVENTORY_FIELDS + ["_id"], 1)
+        return _page(inventories.find(q, projection).sort([("sku", 1), ("_id", 1)]), limit, key)
+
+    q["wh"] = wh
+    balances, next_cursor = _page(
+        stock_balances.find(q, {"sku": 1, "qty": 1}).sort([("sku", 1), ("_id", 1)]), limit, key)
+    info = {d["sku"]: d for d in inventories.find(
+        {"sku": {"$in": [b["sku"] for b in balances]}}, fields_projection(INVENTORY_FIELDS))}
+    docs = []
+    for b in balances:
+        doc = dict(info.get(b["sku"], {"sku": b["sku"]}))
+        doc.update(_id=b["_id"], qty=b["qty"], wh=wh)
+        docs.append(doc)
+    return docs, next_cursor
+
+
+def page_inventory_search(query: str, wh: str = None, sku: str = None, limit: int = 20, cursor: str = None):
+    """
+    Một trang kết quả tìm theo tên (xếp hạng bởi chỉ mục trong bộ nhớ). Lọc `sku`/`wh` trước khi cắt
+    `limit` nên trang không bị hụt; lấy thêm ứng viên (gấp đôi mỗi vòng) tới khi đủ limit + 1 dòng.
+    Cursor = (câu truy vấn, vị trí xếp hạng sau dòng cuối trang).
+    """
+    if limit < 1:
+        raise ValueError("limit phải >= 1")
+    start = 0
+    if cursor:
+        after = decode_cursor(cursor, ("q", "rank"))
+        if after["q"] != query:
+            raise ValueError("cursor không thuộc danh sách này")
+        start = int(after["rank"])
+
+    page = []   # (vị trí xếp hạng, document)
+    pos, size = start, start + limit + 1
+    while len(page) <= limit:
+        ranked = search_products(query, size)
+        chunk = [(i, s) for i, s in enumerate(ranked[pos:], pos) if not sku or s == sku]
+        wanted = [s for _i, s in chunk]
+        info = {d["sku"]: d for d in inventories.find(
+            {"sku": {"$in": wanted}}, fields_projection(INVENTORY_FIELDS))} if wanted else {}
+        if wh and wanted:
+            # Số lượng theo kho từ stock_balances; sản phẩm không có ở kho này bị bỏ
+            qty_in_wh = {b["sku"]: b["qty"] for b in stock_balances.find(
+                {"wh": wh, "sku": {"$in": wanted}}, {"_id": 0, "sku": 1, "qty": 1})}
+            info = {s: dict(d, qty=qty_in_wh[s], wh=wh) for s, d in info.items() if s in qty_in_wh}
+        for i, s in chunk:
+            if s in info:
+                page.append((i, info[s]))
+                if len(page) > limit:
+                    break
+        if len(ranked) < size:
+            break
+        pos, size = len(ranked), size * 2
+
+    next_cursor = encode_cursor({"q": query, "rank": page[limit - 1][0] + 1}) if len(page) > limit else None
+    return [doc for _i, doc in page[:limit]], next_cursor
+
+
+def iter_inventories(wh: str = None, batch_size: int = 1000):
+    """Stream tồn kho theo từng trang keyset (giữ bộ nhớ ổn định cho export lớn)."""
+    cursor = None
+    while True:
+        docs, cursor = page_inventories(wh=wh, limit=batch_size, cursor=cursor)
+        yield from docs
+        if not cursor:
+            return
+
+
+def to_jsonable(doc: dict, fields: list) -> dict:
+    out = {}
+    for f in fields:
+        v = doc.get(f)
+        if isinstance(v, ObjectId):
+            v = str(v)
+        elif isinstance(v, datetime):
+            v = v.isoformat()
+        out["id" if f == "_id" else f] = v
+    return out
+
+
+def stream_rows(docs, fields: list, fmt: str = "ndjson"):
+    """Generator chuyển từng document thành 1 dòng NDJSON/CSV (dùng cho StreamingResponse)."""
+    columns = ["id" if f == "_id" else f for f in fields]
+    if fmt == "csv":
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(columns)
+        for doc in docs:
+            row = to_jsonable(doc, fields)
+            writer.writerow(["" if row[c] is None else row[c] for c in columns])
+            if buffer.tell() >= 64 * 1024:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+    else:
+        for doc in docs:
+            yield json.dumps(to_jsonable(doc, fields), ensure_ascii=False) + "\n"
@@ -0,0 +1,146 @@
+import time
+from datetime import datetime
+from pymongo import UpdateOne
+from .database import db
+from .config import REBUILD_BATCH_SIZE
+from .stock import stock_balances, balance_upsert
+from .cache import tool_cache
+from .text import search_key
+from .search_index import product_index
+
+# ============================================================
+# Rebuild engine: tính tồn kho cho toàn bộ SKU trong 1 lần aggregate
+# ============================================================
+transactions = db["transactions"]
+inventories = db["inventories"]
+
+# Giá trị mặc định khi SKU chưa có document trong inventories
+NEW_INVENTORY_DEFAULTS = {
+    "name": None,          # None → dùng chính SKU làm tên
+    "uom": "EA",
+    "wh": "UNKNOWN",
+    "location": "UNKNOWN",
+    "exp": None,
+    "imageUrl": "",
+}
+
+
+def stock_pipeline(match: dict = None) -> list:
+    """Pipeline gom nhóm toàn bộ transaction theo SKU → tồn kho (inbound - outbound)."""
+    pipeline = []
+    if match:
+        pipeline.append({"$match": match})
+    pipeline += [
+        {"$group": {"_id": "$sku",
+                    "inbound": {"$sum": {"$cond": [{"$eq": ["$type", "inbound"]}, "$qty", 0]}},
+                    "outbound": {"$sum": {"$cond": [{"$eq": ["$type", "outbound"]}, "$qty", 0]}}
+                    }},
+        {"$project": {"_id": 0, "sku": "$_id", "stock": {"$subtract": ["$inbound", "$outbound"]}}},
+    ]
+    return pipeline
+
+
+def inventory_defaults(sku: str) -> dict:
+    """Các trường $setOnInsert cho document inventories mới của SKU."""
+    on_insert = dict(NEW_INVENTORY_DEFAULTS)
+    on_insert["name"] = on_insert["name"] or sku
+    on_insert["name_lc"] = search_key(on_insert["name"])
+    return on_insert
+
+
+def stock_upsert(sku: str, stock: int, now: datetime, with_defaults: bool = True) -> UpdateOne:
+    """Ghi đè qty cho SKU; nếu chưa có thì tạo document mới với giá trị mặc định."""
+    update = {"$set": {"qty": stock, "updatedAt": now}}
+    if with_defaults:
+        update["$setOnInsert"] = inventory_defaults(sku)
+    return UpdateOne({"sku": sku}, update, upsert=True)
+
+
+def balance_pipeline(match: dict = None) -> list:
+    """Pipeline gom nhóm theo (sku, wh), sắp theo SKU để gộp tồn tổng ngay khi stream."""
+    pipeline = []
+    if match:
+        pipeline.append({"$match": match})
+    pipeline += [
+        {"$group": {"_id": {"sku": "$sku", "wh": "$wh"},
+                    "inbound": {"$sum": {"$cond": [{"$eq": ["$type", "inbound"]}, "$qty", 0]}},
+                    "outbound": {"$sum": {"$cond": [{"$eq": ["$type", "outbound"]}, "$qty", 0]}}
+                    }},
+        {"$sort": {"_id.sku": 1}},
+        {"$project": {"_id": 0, "sku": "$_id.sku", "wh": "$_id.wh",
+                      "stock": {"$subtract": ["$inbound", "$outbound"]}}},
+    ]
+    return pipeline
+
+
+def run_rebuild(batch_size: int = None, match: dict = None, target=None,
+                with_defaults: bool = True, balances: bool = False) -> dict:
+    """
+    Tính tồn kho cho mọi SKU bằng một lần $group duy nhất (cursor stream, không list()),
+    rồi ghi kết quả bằng bulk_write unordered theo từng lô `batch_size`.
+    `balances=True` gom theo (sku, wh) để ghi luôn stock_balances trong cùng lần quét.
+
+    Trả về thống kê: số SKU, số lô, thời gian chạy và tốc độ (SKU/giây).
+    """
+    batch_size = int(batch_size or REBUILD_BATCH_SIZE)
+    target = target if target is not None else inventories
+
+    started = time.perf_counter()
+    now = datetime.utcnow()
+    pipeline = balance_pipeline(match) if balances else stock_pipeline(match)
+    cursor = transactions.aggregate(pipeline, allowDiskUse=True, batchSize=batch_size)
+
+    skus = 0
+    batches = 0
+    ops = []
+    balance_ops = []
+
+    def flush():
+        nonlocal skus, batches, ops, balance_ops
+        if balance_ops:
+            stock_balances.bulk_write(balance_ops, ordered=False)
+        if ops:
+            target.bulk_write(ops, ordered=False)
+            skus += len(ops)
+            batches += 1
+        ops, balance_ops = [], []
+
+    current, total = None, 0
+    for row in cursor:
+        if not balances:
+            ops.append(stock_upsert(row["sku"], row["stock"], now, with_defaults))
+        else:
+            # Hàng đã sắp theo SKU → gặp SKU mới thì chốt tồn tổng của SKU trước
+            if current is not None and row["sku"] != current:
+                ops.append(stock_upsert(current, total, now, with_defaults))
+                total = 0
+            current = row["sku"]
+            total += row["stock"]
+            balance_ops.append(balance_upsert(row["sku"], row["wh"], row["stock"], now))
+        if len(ops) >= batch_size:
+            flush()
+    if current is not None:
+        ops.append(stock_upsert(current, total, now, with_defaults))
+    flush()
+    tool_cache.clear()
+    product_index.mark_stale()
+
+    elapsed = time.perf_counter() - started
+    return {
+        "skus": skus,
+        "batches": batches,
+        "batch_size": batch_size,
+        "seconds": round(elapsed, 3),
+        "skus_per_second": round(skus / elapsed, 1) if elapsed > 0 else float(skus),
+    }
+
+
+def format_rebuild_stats(stats: dict) -> str:
+    text = (f"{stats['skus']} SKU trong {stats['seconds']}s "
+            f"(~{stats['skus_per_second']} SKU/s, {stats['batches']} lô x {stats['batch_size']}")
+    if "workers" in stats:
+        text += f", {stats['workers']} tiến trình / {stats['shards']} shard"
+    text += ")"
+    if stats.get("failed"):
+        text += f" — ⚠️ {len(stats['failed'])} shard lỗi, chạy tiếp với run_id {stats['run_id']}"
+    return text
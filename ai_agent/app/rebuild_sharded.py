@@ -0,0 +1,179 @@
+import logging
+import multiprocessing
+import os
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from . import database
+from .database import db
+from .config import MONGO_URI, REBUILD_BATCH_SIZE, REBUILD_SHARDS_PER_WORKER, REBUILD_SHARD_RETRIES
+from .cache import tool_cache
+from .search_index import product_index
+
+# ============================================================
+# Rebuild song song: chia dải SKU cho nhiều tiến trình
+# ============================================================
+# Mỗi SKU được tính độc lập → chia không gian SKU thành các dải [lo, hi) liên tiếp; mỗi tiến trình
+# (MongoClient riêng) chạy run_rebuild(match=dải) và bulk upsert phần của mình.
+# Chia theo dải (không băm) vì $match {"sku": {"$gte", "$lt"}} dùng được index sku_at_id của
+# transactions: mỗi worker chỉ đọc phần của nó, còn băm SKU buộc worker nào cũng quét toàn bộ.
+# Số shard = workers x REBUILD_SHARDS_PER_WORKER để worker xong sớm lấy tiếp shard khác.
+#
+# Tiến độ lưu ở rebuild_shards (1 document / shard, chỉ tiến trình điều phối ghi).
+# Shard lỗi (kể cả worker chết → BrokenProcessPool) được chạy lại tối đa REBUILD_SHARD_RETRIES lần;
+# còn lỗi thì chạy tiếp bằng run_sharded_rebuild(resume=run_id): chỉ các shard chưa "done" được chạy.
+# Upsert ghi đè qty ($set) nên chạy lại một shard không làm sai tồn kho.
+transactions = db["transactions"]
+rebuild_shards = db["rebuild_shards"]
+
+logger = logging.getLogger(__name__)
+
+
+def sku_boundaries(parts: int) -> list:
+    """Chia danh sách SKU (đã sắp) thành `parts` dải gần bằng nhau → [(lo, hi), ...]; None = không chặn."""
+    # $sort trước $group → Mongo dùng DISTINCT_SCAN trên index sku_at_id, không quét transaction
+    cursor = transactions.aggregate([{"$sort": {"sku": 1}}, {"$group": {"_id": "$sku"}}, {"$sort": {"_id": 1}}])
+    skus = [row["_id"] for row in cursor if row["_id"] is not None]
+    parts = max(1, min(parts, len(skus)))
+    cuts = [skus[len(skus) * i // parts] for i in range(1, parts)]
+    bounds = [None] + cuts + [None]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def shard_match(lo: str = None, hi: str = None) -> dict:
+    cond = {}
+    if lo is not None:
+        cond["$gte"] = lo
+    if hi is not None:
+        cond["$lt"] = hi
+    return {"sku": cond} if cond else None
+
+
+# ============================================================
+# Worker (chạy trong tiến trình con)
+# ============================================================
+def _init_worker(mongo_uri: str, db_name: str):
+    # Tiến trình con tự mở MongoClient riêng (pymongo không an toàn khi dùng chung qua fork)
+    from pymongo import MongoClient
+    from .metrics import MongoCommandMetrics
+
+    database._client = MongoClient(mongo_uri, event_listeners=[MongoCommandMetrics()])
+    database.MONGO_DB = db_name
+
+
+def _rebuild_shard(lo: str, hi: str, batch_size: int, balances: bool) -> dict:
+    from .rebuild import run_rebuild
+
+    stats = run_rebuild(batch_size, match=shard_match(lo, hi), balances=balances)
+    stats["pid"] = os.getpid()
+    return stats
+
+
+# ============================================================
+# Điều phối
+# ============================================================
+def _create_run(run_id: str, workers: int, shards_per_worker: int) -> list:
+    now = datetime.utcnow()
+    docs = [{"_id": f"{run_id}:{i}", "run_id": run_id, "i": i, "lo": lo, "hi": hi,
+             "status": "pending", "attempts": 0, "created_at": now}
+            for i, (lo, hi) in enumerate(sku_boundaries(workers * shards_per_worker))]
+    if docs:
+        rebuild_shards.insert_many(docs, ordered=False)
+    return docs
+
+
+def _mark(shard: dict, status: str, **fields):
+    shard.update(status=status, **fields)
+    rebuild_shards.update_one({"_id": shard["_id"]},
+                              {"$set": dict(fields, status=status, updated_at=datetime.utcnow())})
+
+
+def run_sharded_rebuild(workers: int = None, batch_size: int = None, balances: bool = True,
+                        resume: str = None, retries: int = REBUILD_SHARD_RETRIES,
+                        shards_per_worker: int = REBUILD_SHARDS_PER_WORKER,
+                        mongo_uri: str = None, db_name: str = None) -> dict:
+    """
+    Rebuild tồn kho bằng `workers` tiến trình, mỗi tiến trình xử lý các dải SKU của mình.
+    `resume=run_id` chạy tiếp một lần rebuild trước, bỏ qua các shard đã xong.
+
+    Trả về thống kê giống run_rebuild (cộng dồn các shard chạy lần này) kèm run_id, workers, số shard
+    và danh sách shard còn lỗi ("failed") nếu có.
+    """
+    workers = max(1, int(workers or os.cpu_count() or 1))
+    batch_size = int(batch_size or REBUILD_BATCH_SIZE)
+    started = time.perf_counter()
+
+    if resume:
+        run_id = resume
+        shards = list(rebuild_shards.find({"run_id": run_id}).sort("i", 1))
+        if not shards:
+            raise ValueError(f"Không tìm thấy lần rebuild {run_id}")
+    else:
+        run_id = uuid.uuid4().hex[:12]
+        shards = _create_run(run_id, workers, shards_per_worker)
+
+    todo = [s for s in shards if s["status"] != "done"]
+    tries = {}
+    skus = batches = 0
+    # spawn: tiến trình con không kế thừa MongoClient/thread nền của tiến trình cha
+    context = multiprocessing.get_context("spawn")
+    initargs = (mongo_uri or MONGO_URI, db_name or database.MONGO_DB)
+    while todo:
+        retry = []
+        with ProcessPoolExecutor(min(workers, len(todo)), mp_context=context,
+                                 initializer=_init_worker, initargs=initargs) as pool:
+            futures = {}
+            for shard in todo:
+                tries[shard["i"]] = tries.get(shard["i"], 0) + 1
+                _mark(shard, "running", attempts=shard["attempts"] + 1)
+                futures[pool.submit(_rebuild_shard, shard["lo"], shard["hi"], batch_size, balances)] = shard
+            for future in as_completed(futures):
+                shard = futures[future]
+                try:
+                    stats = future.result()
+                except Exception as e:
+                    _mark(shard, "failed", error=repr(e))
+                    logger.warning("rebuild shard failed", extra={"fields": {
+                        "run_id": run_id, "shard": shard["i"], "attempts": shard["attempts"], "error": repr(e)}})
+                    if tries[shard["i"]] <= retries:
+                        retry.append(shard)
+                    continue
+                _mark(shard, "done", stats=stats, error=None)
+                skus += stats["skus"]
+                batches += stats["batches"]
+                done = sum(s["status"] == "done" for s in shards)
+                logger.info("rebuild shard done", extra={"fields": {
+                    "run_id": run_id, "shard": shard["i"], "done": done, "total": len(shards),
+                    "skus": stats["skus"], "seconds": stats["seconds"], "pid": stats["pid"]}})
+        todo = retry
+
+    tool_cache.clear()
+    product_index.mark_stale()
+
+    elapsed = time.perf_counter() - started
+    return {
+        "run_id": run_id,
+        "workers": workers,
+        "shards": len(shards),
+        "failed": [s["i"] for s in shards if s["status"] != "done"],
+        "skus": skus,
+        "batches": batches,
+        "batch_size": batch_size,
+        "seconds": round(elapsed, 3),
+        "skus_per_second": round(skus / elapsed, 1) if elapsed > 0 else float(skus),
+    }
+
+
+if __name__ == "__main__":
+    # python -m app.rebuild_sharded [workers] [--resume run_id]
+    import sys
+    from .rebuild import format_rebuild_stats
+
+    args = sys.argv[1:]
+    run = args[args.index("--resume") + 1] if "--resume" in args else None
+    count = next((int(a) for a in args if a.isdigit()), None)
+    stats = run_sharded_rebuild(count, resume=run)
+    print(format_rebuild_stats(stats))
+    if stats["failed"]:
+        print(f"Shard lỗi: {stats['failed']} → chạy lại: python -m app.rebuild_sharded --resume {stats['run_id']}")
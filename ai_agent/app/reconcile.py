@@ -0,0 +1,254 @@
+import time
+from datetime import datetime, timedelta
+from pymongo import UpdateOne
+from .database import db, run_in_transaction
+from .config import REBUILD_BATCH_SIZE, RECONCILE_LAG_SECONDS
+from .rebuild import run_rebuild, stock_pipeline, balance_pipeline, inventory_defaults
+from .stock import stock_balances
+from .cache import invalidate_skus
+
+# ============================================================
+# Đối soát tồn kho tăng dần (incremental reconciliation)
+# ============================================================
+# - inventory_ledger: tồn kho tính từ transaction log tới high-water mark
+# - reconcile_state : high-water mark (at, _id) của transaction cuối đã cộng dồn
+# Mỗi lần chạy chỉ đọc các transaction mới hơn high-water mark → chi phí O(giao dịch mới).
+# Các write path $inc trực tiếp vào inventories, nên đối soát không ghi đè qty từ ledger (vốn trễ hơn,
+# sẽ xóa mất các cập nhật đó): chỉ so sánh các SKU bị ảnh hưởng và báo SKU lệch. `fix=True` sửa
+# đúng các SKU đó bằng $inc phần chênh (fix_mismatches) — $inc chạy xen giữa vẫn được giữ.
+# - Delta của một lô và checkpoint được ghi trong cùng 1 Mongo transaction → chạy lại sau sự cố
+#   không cộng lô đó hai lần.
+# - Chỉ cộng dồn transaction có at <= now - RECONCILE_LAG_SECONDS: `at` do client gán trước khi
+#   commit, transaction commit muộn với `at` nhỏ hơn high-water mark sẽ bị bỏ sót vĩnh viễn.
+transactions = db["transactions"]
+inventories = db["inventories"]
+ledger = db["inventory_ledger"]
+reconcile_state = db["reconcile_state"]
+
+STATE_ID = "inventory"
+
+
+def _after(at: datetime, last_id) -> dict:
+    """Điều kiện lấy transaction nằm sau high-water mark theo thứ tự (at, _id)."""
+    return {"$or": [{"at": {"$gt": at}}, {"at": at, "_id": {"$gt": last_id}}]}
+
+
+def _upto(at: datetime, last_id) -> dict:
+    return {"$or": [{"at": {"$lt": at}}, {"at": at, "_id": {"$lte": last_id}}]}
+
+
+def _cutoff(lag: float = None) -> datetime:
+    return datetime.utcnow() - timedelta(seconds=RECONCILE_LAG_SECONDS if lag is None else lag)
+
+
+def _latest_transaction(cutoff: datetime):
+    cursor = (transactions.find({"at": {"$lte": cutoff}}, {"_id": 1, "at": 1})
+              .sort([("at", -1), ("_id", -1)]).limit(1))
+    return next(iter(cursor), None)
+
+
+def _save_checkpoint(at: datetime, last_id, folded: int, session=None):
+    reconcile_state.update_one(
+        {"_id": STATE_ID},
+        {"$set": {"at": at, "last_id": last_id, "updatedAt": datetime.utcnow()},
+         "$inc": {"folded": folded}},
+        upsert=True,
+        session=session,
+    )
+
+
+def _bootstrap(batch_size: int, cutoff: datetime, fix: bool) -> dict:
+    """
+    Lần chạy đầu: tính ledger từ toàn bộ log tới transaction mới nhất trước mốc trễ,
+    rồi so toàn bộ SKU trong ledger với inventories theo lô `batch_size`.
+    """
+    latest = _latest_transaction(cutoff)
+    if not latest:
+        return {"mode": "bootstrap", "transactions": 0, "skus": 0, "mismatches": [], "fixed": 0,
+                "seconds": 0.0}
+    started = time.perf_counter()
+    upto = _upto(latest["at"], latest["_id"])
+    stats = run_rebuild(batch_size, match=upto, target=ledger, with_defaults=False)
+    _save_checkpoint(latest["at"], latest["_id"], 0)
+
+    mismatches, skus = [], []
+    for row in ledger.find({}, {"_id": 0, "sku": 1}).sort("sku", 1).batch_size(batch_size):
+        skus.append(row["sku"])
+        if len(skus) >= batch_size:
+            mismatches += compare_with_ledger(skus)
+            skus = []
+    mismatches += compare_with_ledger(skus)
+    return {"mode": "bootstrap", "transactions": None, "skus": stats["skus"], "mismatches": mismatches,
+            "fixed": fix_mismatches(mismatches) if fix else 0,
+            "seconds": round(time.perf_counter() - started, 3)}
+
+
+def _fold(deltas: dict, last: dict, pending: int, now: datetime):
+    """Cộng delta của lô vào ledger và dời checkpoint — cùng 1 Mongo transaction."""
+    def apply(session):
+        ledger.bulk_write(
+            [UpdateOne({"sku": sku}, {"$inc": {"qty": d}, "$set": {"updatedAt": now}}, upsert=True)
+             for sku, d in deltas.items()],
+            ordered=False,
+            session=session,
+        )
+        _save_checkpoint(last["at"], last["_id"], pending, session=session)
+
+    run_in_transaction(apply)
+
+
+def compare_with_ledger(skus: list) -> list:
+    """
+    So inventories.qty với ledger + các transaction sau high-water mark (chưa cộng vào ledger)
+    cho danh sách SKU. Trả về [{"sku", "qty", "expected"}] của các SKU bị lệch.
+    """
+    if not skus:
+        return []
+    state = reconcile_state.find_one({"_id": STATE_ID}) or {}
+    expected = {b["sku"]: b.get("qty", 0) for b in ledger.find({"sku": {"$in": skus}}, {"_id": 0, "sku": 1, "qty": 1})}
+    match = {"sku": {"$in": skus}}
+    if state:
+        match = {"$and": [match, _after(state["at"], state["last_id"])]}
+    for r in transactions.aggregate(stock_pipeline(match)):
+        expected[r["sku"]] = expected.get(r["sku"], 0) + r["stock"]
+    current = {d["sku"]: d.get("qty", 0) for d in inventories.find({"sku": {"$in": skus}}, {"_id": 0, "sku": 1, "qty": 1})}
+    return [{"sku": sku, "qty": current.get(sku, 0), "expected": expected.get(sku, 0)}
+            for sku in skus if current.get(sku, 0) != expected.get(sku, 0)]
+
+
+def fix_mismatches(mismatches: list, now: datetime = None) -> int:
+    """
+    Sửa các SKU lệch bằng $inc (expected - qty), không ghi đè: ghi xen giữa lúc so sánh và lúc sửa
+    vẫn được giữ. stock_balances của các SKU đó được tính lại theo (sku, wh) từ log và cũng $inc
+    phần chênh. Trả về số SKU đã sửa.
+    """
+    deltas = {m["sku"]: m["expected"] - m["qty"] for m in mismatches if m["expected"] != m["qty"]}
+    if not deltas:
+        return 0
+    now = now or datetime.utcnow()
+    skus = sorted(deltas)
+    inventories.bulk_write(
+        [UpdateOne({"sku": sku}, {"$inc": {"qty": d}, "$set": {"updatedAt": now},
+                                  "$setOnInsert": inventory_defaults(sku)}, upsert=True)
+         for sku, d in deltas.items()],
+        ordered=False,
+    )
+    expected = {(r["sku"], r["wh"]): r["stock"]
+                for r in transactions.aggregate(balance_pipeline({"sku": {"$in": skus}}))}
+    current = {(b["sku"], b["wh"]): b.get("qty", 0)
+               for b in stock_balances.find({"sku": {"$in": skus}}, {"_id": 0, "sku": 1, "wh": 1, "qty": 1})}
+    balance_ops = [
+        UpdateOne({"sku": sku, "wh": wh},
+                  {"$inc": {"qty": expected.get((sku, wh), 0) - current.get((sku, wh), 0)},
+                   "$set": {"updatedAt": now}}, upsert=True)
+        for sku, wh in sorted(set(expected) | set(current), key=str)
+        if expected.get((sku, wh), 0) != current.get((sku, wh), 0)
+    ]
+    if balance_ops:
+        stock_balances.bulk_write(balance_ops, ordered=False)
+    invalidate_skus(skus)
+    return len(skus)
+
+
+def reconcile_inventory(batch_size: int = None, lag: float = None, fix: bool = False) -> dict:
+    """
+    Cộng dồn các transaction mới hơn high-water mark (và cũ hơn mốc trễ `lag` giây) vào ledger
+    theo lô `batch_size`, rồi so các SKU bị ảnh hưởng với inventories; `fix=True` sửa các SKU lệch.
+    Checkpoint đi cùng lô nên lần chạy bị gián đoạn sẽ tiếp tục từ lô kế tiếp.
+    """
+    batch_size = int(batch_size or REBUILD_BATCH_SIZE)
+    cutoff = _cutoff(lag)
+    state = reconcile_state.find_one({"_id": STATE_ID})
+    if not state:
+        return _bootstrap(batch_size, cutoff, fix)
+
+    started = time.perf_counter()
+    cursor = (transactions
+              .find({"$and": [_after(state["at"], state["last_id"]), {"at": {"$lte": cutoff}}]},
+                    {"sku": 1, "type": 1, "qty": 1, "at": 1})
+              .sort([("at", 1), ("_id", 1)])
+              .batch_size(batch_size))
+
+    folded = 0
+    touched = set()
+    deltas = {}
+    pending = 0
+    last = None
+    for tx in cursor:
+        sign = 1 if tx["type"] == "inbound" else -1 if tx["type"] == "outbound" else 0
+        deltas[tx["sku"]] = deltas.get(tx["sku"], 0) + sign * int(tx["qty"])
+        last = tx
+        pending += 1
+        if pending >= batch_size:
+            _fold(deltas, last, pending, datetime.utcnow())
+            folded += pending
+            touched.update(deltas)
+            deltas, pending = {}, 0
+    if pending:
+        _fold(deltas, last, pending, datetime.utcnow())
+        folded += pending
+        touched.update(deltas)
+
+    mismatches = compare_with_ledger(sorted(touched))
+    return {"mode": "incremental", "transactions": folded, "skus": len(touched), "mismatches": mismatches,
+            "fixed": fix_mismatches(mismatches) if fix else 0,
+            "seconds": round(time.perf_counter() - started, 3)}
+
+
+def verify_sample(size: int = 50, fix: bool = False) -> dict:
+    """
+    Kiểm tra ngẫu nhiên `size` SKU: tính lại tồn kho từ log (1 aggregate cho cả mẫu)
+    và so với inventories.qty. `fix=True` sửa các SKU bị lệch (fix_mismatches).
+    """
+    sample = {d["sku"]: d.get("qty", 0) for d in inventories.aggregate([
+        {"$sample": {"size": int(size)}},
+        {"$project": {"_id": 0, "sku": 1, "qty": 1}},
+    ])}
+    actual = {r["sku"]: r["stock"] for r in transactions.aggregate(stock_pipeline({"sku": {"$in": list(sample)}}))}
+
+    mismatches = [
+        {"sku": sku, "qty": qty, "expected": actual.get(sku, 0)}
+        for sku, qty in sample.items() if qty != actual.get(sku, 0)
+    ]
+    if fix and mismatches:
+        fix_mismatches(mismatches)
+    return {"checked": len(sample), "mismatches": mismatches, "fixed": bool(fix and mismatches)}
+
+
+def format_reconcile_stats(stats: dict) -> str:
+    if stats["mode"] == "bootstrap":
+        text = f"✅ Đã khởi tạo ledger tồn kho cho {stats['skus']} SKU trong {stats['seconds']}s."
+    else:
+        text = (f"✅ Đã đối soát {stats['transactions']} giao dịch mới "
+                f"({stats['skus']} SKU) trong {stats['seconds']}s.")
+    mismatches = stats.get("mismatches") or []
+    if mismatches:
+        text += (f"\n⚠️ {len(mismatches)} SKU lệch so với ledger "
+                 + ("(đã sửa):" if stats.get("fixed") else "(chưa sửa):"))
+        text += "".join(f"\n- {m['sku']}: inventories={m['qty']}, ledger+log={m['expected']}" for m in mismatches[:20])
+    return text
+
+
+def format_verify_result(result: dict) -> str:
+    if not result["mismatches"]:
+        return f"✅ Đã kiểm tra {result['checked']} SKU ngẫu nhiên, không có sai lệch."
+    lines = [f"⚠️ {len(result['mismatches'])}/{result['checked']} SKU bị lệch"
+             + (" (đã sửa):" if result["fixed"] else ":")]
+    for m in result["mismatches"]:
+        lines.append(f"- {m['sku']}: inventories={m['qty']}, log={m['expected']}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    # Chạy định kỳ (cron): python -m app.reconcile [--fix] [--verify N]
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Đối soát tồn kho tăng dần")
+    parser.add_argument("--batch-size", type=int, default=None)
+    parser.add_argument("--verify", type=int, default=0, help="Kiểm tra thêm N SKU ngẫu nhiên")
+    parser.add_argument("--fix", action="store_true", help="Sửa các SKU lệch (đối soát và --verify)")
+    opts = parser.parse_args()
+
+    print(format_reconcile_stats(reconcile_inventory(opts.batch_size, fix=opts.fix)))
+    if opts.verify:
+        print(format_verify_result(verify_sample(opts.verify, opts.fix)))
@@ -0,0 +1,172 @@
+import re
+import time
+from datetime import datetime, timedelta
+from pymongo import UpdateOne
+from .database import db
+from .config import REBUILD_BATCH_SIZE
+from .models.movement import Movement
+
+# ============================================================
+# Rollup nhập/xuất theo giờ và theo ngày cho từng (sku, wh)
+# ============================================================
+# Mỗi document trong movement_rollups là 1 bucket:
+#   {g: "hour"|"day", t: đầu bucket (UTC), sku, wh, inbound, outbound, net, count}
+# Write path (add_inbound/outbound, batch) $inc bucket trong cùng Mongo transaction với
+# insert transaction, nên câu hỏi theo khoảng thời gian chỉ đọc O(số bucket) thay vì
+# quét toàn bộ transactions. Transaction ghi qua backend Node được cộng bằng hook post("save")
+# trong backend/models/transaction.js. rebuild_rollups() dựng lại từ transaction log khi cần.
+transactions = db["transactions"]
+rollups = db["movement_rollups"]
+
+GRANULARITIES = ("hour", "day")
+
+
+def bucket_start(at: datetime, granularity: str) -> datetime:
+    if granularity == "hour":
+        return at.replace(minute=0, second=0, microsecond=0)
+    return at.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _fold(totals: dict, granularity: str, t: datetime, sku: str, wh: str,
+          inbound: int, outbound: int, count: int):
+    key = (granularity, t, sku, wh)
+    acc = totals.setdefault(key, [0, 0, 0])
+    acc[0] += inbound
+    acc[1] += outbound
+    acc[2] += count
+
+
+def _updates(totals: dict) -> list:
+    return [
+        UpdateOne(
+            {"g": g, "t": t, "sku": sku, "wh": wh},
+            {"$inc": {"inbound": inbound, "outbound": outbound, "net": inbound - outbound, "count": count}},
+            upsert=True,
+        )
+        for (g, t, sku, wh), (inbound, outbound, count) in totals.items()
+    ]
+
+
+def apply_rollups(docs: list, session=None):
+    """Cộng các transaction vừa ghi vào bucket giờ + ngày (1 bulk_write cho cả lô)."""
+    totals = {}
+    for doc in docs:
+        inbound = doc["qty"] if doc["type"] == "inbound" else 0
+        outbound = doc["qty"] if doc["type"] == "outbound" else 0
+        for g in GRANULARITIES:
+            _fold(totals, g, bucket_start(doc["at"], g), doc["sku"], doc["wh"], inbound, outbound, 1)
+    if totals:
+        rollups.bulk_write(_updates(totals), ordered=False, session=session)
+
+
+def rebuild_rollups(sku: str = None, wh: str = None, batch_size: int = None) -> dict:
+    """
+    Dựng lại rollup từ transaction log: $group theo (sku, wh, giờ) trên server ($dateTrunc,
+    MongoDB 5.0+), gộp bucket ngày khi stream, ghi bằng bulk_write theo lô.
+    Có sku/wh → chỉ dựng lại phần đó (bucket cũ bị xóa trước khi ghi lại).
+    Giống rebuild tồn kho: nên chạy khi không có giao dịch mới ghi vào phần đang dựng.
+    """
+    batch_size = int(batch_size or REBUILD_BATCH_SIZE)
+    started = time.perf_counter()
+    match = {}
+    if sku:
+        match["sku"] = sku
+    if wh:
+        match["wh"] = wh
+    rollups.delete_many(match)
+
+    pipeline = [{"$match": match}] if match else []
+    pipeline.append({"$group": {
+        "_id": {"sku": "$sku", "wh": "$wh", "t": {"$dateTrunc": {"date": "$at", "unit": "hour"}}},
+        "inbound": {"$sum": {"$cond": [{"$eq": ["$type", "inbound"]}, "$qty", 0]}},
+        "outbound": {"$sum": {"$cond": [{"$eq": ["$type", "outbound"]}, "$qty", 0]}},
+        "count": {"$sum": 1},
+    }})
+
+    totals, buckets, batches = {}, 0, 0
+    for row in transactions.aggregate(pipeline, allowDiskUse=True, batchSize=batch_size):
+        key = row["_id"]
+        for g in GRANULARITIES:
+            _fold(totals, g, bucket_start(key["t"], g), key["sku"], key["wh"],
+                  row["inbound"], row["outbound"], row["count"])
+        buckets += 1
+        if len(totals) >= batch_size:
+            rollups.bulk_write(_updates(totals), ordered=False)
+            totals, batches = {}, batches + 1
+    if totals:
+        rollups.bulk_write(_updates(totals), ordered=False)
+        batches += 1
+
+    return {"hour_buckets": buckets, "batches": batches, "seconds": round(time.perf_counter() - started, 3)}
+
+
+def movement_series(start: datetime, end: datetime, sku: str = None, wh: str = None,
+                    granularity: str = "day") -> list:
+    """Nhập/xuất/ròng theo từng bucket trong [start, end), cộng gộp qua các SKU/kho khớp filter."""
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"granularity không hợp lệ: {granularity}")
+    match = {"g": granularity, "t": {"$gte": bucket_start(start, granularity), "$lt": end}}
+    if sku:
+        match["sku"] = sku
+    if wh:
+        match["wh"] = wh
+    pipeline = [
+        {"$match": match},
+        {"$group": {"_id": "$t", "inbound": {"$sum": "$inbound"}, "outbound": {"$sum": "$outbound"},
+                    "net": {"$sum": "$net"}, "count": {"$sum": "$count"}}},
+        {"$sort": {"_id": 1}},
+    ]
+    return [Movement.model_construct(t=r["_id"], inbound=r["inbound"], outbound=r["outbound"],
+                                     net=r["net"], count=r["count"])
+            for r in rollups.aggregate(pipeline)]
+
+
+def movement_totals(series: list) -> Movement:
+    return Movement.model_construct(
+        t=series[0].t if series else None,
+        inbound=sum(m.inbound for m in series),
+        outbound=sum(m.outbound for m in series),
+        net=sum(m.net for m in series),
+        count=sum(m.count for m in series),
+    )
+
+
+# ============================================================
+# Khoảng thời gian từ câu hỏi tiếng Việt
+# ============================================================
+def parse_period(text: str, now: datetime = None):
+    """
+    'hôm nay', 'tuần này', 'tháng này', 'quý này', 'N ngày/giờ qua' → (start, end).
+    Mặc định 7 ngày gần nhất.
+    """
+    now = now or datetime.utcnow()
+    today = bucket_start(now, "day")
+    text = (text or "").lower()
+    end = now + timedelta(microseconds=1)
+    match = re.search(r"(\d+)\s*(ngày|giờ|tuần)", text)
+    if match:
+        n, unit = int(match.group(1)), match.group(2)
+        if unit == "giờ":
+            return bucket_start(now, "hour") - timedelta(hours=n - 1), end
+        return today - timedelta(days=n * (7 if unit == "tuần" else 1) - 1), end
+    if "hôm nay" in text:
+        return today, end
+    if "tuần" in text:
+        return today - timedelta(days=today.weekday()), end
+    if "tháng" in text:
+        return today.replace(day=1), end
+    if "quý" in text:
+        return today.replace(month=3 * ((today.month - 1) // 3) + 1, day=1), end
+    return today - timedelta(days=6), end
+
+
+if __name__ == "__main__":
+    # python -m app.rollups rebuild
+    import sys
+
+    if (sys.argv[1] if len(sys.argv) > 1 else "") == "rebuild":
+        print(rebuild_rollups())
+    else:
+        start, end = parse_period(" ".join(sys.argv[1:]))
+        for m in movement_series(start, end):
+            print(m.t.date(), m.inbound, m.outbound, m.net)
@@ -1,6 +1,6 @@
 from fastapi import APIRouter
 from pydantic import BaseModel
-from ..agent import agent
+from ..agent import get_agent
 
 router = APIRouter()
 
@@ -9,5 +9,5 @@ class Query(BaseModel):
 
 @router.post("/ask")
 def ask_agent(query: Query):
-    response = agent.run(query.question)
+    response = get_agent().run(query.question)
     return {"answer": response}
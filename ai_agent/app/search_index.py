@@ -0,0 +1,235 @@
+import bisect
+import heapq
+import re
+import threading
+import time
+import unicodedata
+from datetime import datetime
+from .database import db
+from .config import SEARCH_INDEX_REFRESH, SEARCH_INDEX_FULL_REBUILD
+
+# ============================================================
+# Chỉ mục tìm kiếm sản phẩm trong bộ nhớ (không dấu, token + trigram)
+# ============================================================
+# "dien thoai" và "điện thoại" cho cùng kết quả: mọi chuỗi được bỏ dấu (fold) trước khi
+# tách token. Tra cứu theo thứ tự: token khớp chính xác → token khớp tiền tố (bisect trên
+# từ điển đã sắp xếp) → trigram (gõ sai chính tả). Kết quả được xếp hạng theo điểm khớp,
+# cụm từ liền nhau và độ dài tên.
+#
+# Index được build từ inventories ở lần dùng đầu (hoặc warm-up), sau đó cập nhật tăng dần
+# theo updatedAt; các write path gọi mark_stale() để lần tìm kế tiếp refresh ngay.
+# Cập nhật một sản phẩm để lại slot cũ (None) trong _docs; khi số slot chết vượt COMPACT_RATIO
+# thì đánh lại doc id từ các entry còn sống (không đọc lại Mongo) → bộ nhớ không tăng theo số lần cập nhật.
+inventories = db["inventories"]
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+COMPACT_RATIO = 0.5      # tỉ lệ slot đã xóa trong _docs thì nén lại
+COMPACT_MIN_DEAD = 1024  # không nén khi còn ít slot chết (index nhỏ)
+
+
+def fold(text) -> str:
+    """Bỏ dấu tiếng Việt + lowercase: 'Điện Thoại' → 'dien thoai'."""
+    text = unicodedata.normalize("NFD", str(text or "")).replace("đ", "d").replace("Đ", "D")
+    text = "".join(c for c in text if unicodedata.category(c) != "Mn")
+    return text.lower()
+
+
+def tokenize(text) -> list:
+    return TOKEN_RE.findall(fold(text))
+
+
+def trigrams(token: str) -> set:
+    padded = f"  {token} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class ProductIndex:
+    def __init__(self, compact_ratio: float = COMPACT_RATIO, compact_min_dead: int = COMPACT_MIN_DEAD):
+        self.compact_ratio = compact_ratio
+        self.compact_min_dead = compact_min_dead
+        self._lock = threading.RLock()
+        self._refresh_lock = threading.Lock()
+        self._reset()
+        self.built_at = None
+        self.refreshed_at = None
+        self._stale = False
+
+    def _reset(self):
+        self._ids = {}        # sku -> doc id
+        self._docs = []       # doc id -> (sku, folded name) hoặc None nếu đã xóa
+        self._tokens = {}     # token -> set(doc id)
+        self._grams = {}      # trigram -> set(token)
+        self._vocab = []      # danh sách token đã sắp xếp (tra tiền tố)
+        self._dead = 0        # số slot None trong _docs
+
+    # ---------------- build / cập nhật ----------------
+    def add(self, sku: str, name: str = None, _keep_vocab_sorted: bool = True):
+        with self._lock:
+            self._remove(sku)
+            doc_id = len(self._docs)
+            folded = fold(name or sku)
+            self._docs.append((sku, folded))
+            self._ids[sku] = doc_id
+            for token in set(TOKEN_RE.findall(folded)) | set(tokenize(sku)):
+                postings = self._tokens.get(token)
+                if postings is None:
+                    postings = self._tokens[token] = set()
+                    if _keep_vocab_sorted:
+                        bisect.insort(self._vocab, token)
+                    for gram in trigrams(token):
+                        self._grams.setdefault(gram, set()).add(token)
+                postings.add(doc_id)
+            if self._dead >= max(self.compact_min_dead, self.compact_ratio * len(self._docs)):
+                self._compact()
+
+    def _remove(self, sku: str):
+        doc_id = self._ids.pop(sku, None)
+        if doc_id is None:
+            return
+        _sku, folded = self._docs[doc_id]
+        self._docs[doc_id] = None
+        self._dead += 1
+        for token in set(TOKEN_RE.findall(folded)) | set(tokenize(sku)):
+            self._tokens.get(token, set()).discard(doc_id)
+
+    def _compact(self):
+        """Bỏ slot đã xóa và token không còn sản phẩm nào: dựng lại từ các entry còn sống (tên đã fold)."""
+        live = [entry for entry in self._docs if entry is not None]
+        self._reset()
+        for sku, folded in live:
+            self.add(sku, folded, _keep_vocab_sorted=False)
+        self._vocab = sorted(self._tokens)
+
+    def build(self):
+        """Build lại toàn bộ từ inventories (stream cursor, chỉ lấy sku + name)."""
+        started = datetime.utcnow()
+        fresh = ProductIndex()
+        for doc in inventories.find({}, {"_id": 0, "sku": 1, "name": 1}).batch_size(5000):
+            if doc.get("sku"):
+                fresh.add(doc["sku"], doc.get("name"), _keep_vocab_sorted=False)
+        fresh._vocab = sorted(fresh._tokens)
+        with self._lock:
+            self._ids, self._docs, self._tokens = fresh._ids, fresh._docs, fresh._tokens
+            self._grams, self._vocab, self._dead = fresh._grams, fresh._vocab, fresh._dead
+            self.built_at = self.refreshed_at = started
+            self._stale = False
+
+    def refresh(self):
+        """Cập nhật tăng dần các sản phẩm có updatedAt mới hơn lần refresh trước."""
+        started = datetime.utcnow()
+        since = self.refreshed_at
+        for doc in inventories.find({"updatedAt": {"$gte": since}}, {"_id": 0, "sku": 1, "name": 1}):
+            if doc.get("sku"):
+                self.add(doc["sku"], doc.get("name"))
+        with self._lock:
+            self.refreshed_at = started
+            self._stale = False
+
+    def mark_stale(self):
+        self._stale = True
+
+    def ensure_fresh(self):
+        with self._refresh_lock:
+            now = datetime.utcnow()
+            if self.built_at is None or (now - self.built_at).total_seconds() > SEARCH_INDEX_FULL_REBUILD:
+                self.build()
+            elif self._stale or (now - self.refreshed_at).total_seconds() > SEARCH_INDEX_REFRESH:
+                self.refresh()
+
+    # ---------------- tra cứu ----------------
+    def _match_token(self, token: str) -> dict:
+        """Trả về {doc id: điểm} cho 1 token của câu truy vấn."""
+        exact = self._tokens.get(token)
+        if exact:
+            return dict.fromkeys(exact, 1.0)
+
+        scores = {}
+        # Tiền tố: "thoa" → "thoai"
+        i = bisect.bisect_left(self._vocab, token)
+        while i < len(self._vocab) and self._vocab[i].startswith(token):
+            for doc_id in self._tokens[self._vocab[i]]:
+                scores[doc_id] = 0.8
+            i += 1
+        if scores:
+            return scores
+
+        # Trigram: token gõ sai gần giống token trong từ điển
+        grams = trigrams(token)
+        overlap = {}
+        for gram in grams:
+            for candidate in self._grams.get(gram, ()):
+                overlap[candidate] = overlap.get(candidate, 0) + 1
+        for candidate, common in overlap.items():
+            similarity = common / len(grams | trigrams(candidate))
+            if similarity >= 0.3:
+                for doc_id in self._tokens[candidate]:
+                    scores[doc_id] = max(scores.get(doc_id, 0), 0.6 * similarity)
+        return scores
+
+    def search(self, query: str, limit: int = 20) -> list:
+        """Trả về danh sách SKU xếp hạng theo độ khớp."""
+        return [sku for sku, _coverage in self.search_scored(query, limit)]
+
+    def search_scored(self, query: str, limit: int = 20) -> list:
+        """
+        Như search() nhưng kèm độ phủ của từng kết quả: trung bình điểm khớp trên các token truy vấn
+        (1.0 = mọi token khớp chính xác, 0.8 = khớp tiền tố, thấp hơn = chỉ giống theo trigram / khớp một phần).
+        """
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        with self._lock:
+            per_token = [self._match_token(t) for t in tokens]
+            # Ưu tiên sản phẩm khớp mọi token (AND); nếu không có thì chấp nhận khớp một phần (OR)
+            per_token.sort(key=len)
+            candidates = set(per_token[0]).intersection(*per_token[1:])
+            if not candidates:
+                candidates = set().union(*per_token)
+            phrase = " ".join(tokens)
+
+            def rank(doc_id):
+                entry = self._docs[doc_id]
+                if entry is None:
+                    return None
+                sku, folded = entry
+                score = sum(s.get(doc_id, 0) for s in per_token)
+                coverage = score / len(per_token)
+                if folded.startswith(phrase):
+                    score += 1.0
+                elif phrase in folded:
+                    score += 0.5
+                return (-score, len(folded), sku, coverage)
+
+            ranked = heapq.nsmallest(limit, (r for r in map(rank, candidates) if r is not None))
+        return [(sku, round(coverage, 3)) for _score, _len, sku, coverage in ranked]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"products": len(self._ids), "tokens": len(self._tokens), "trigrams": len(self._grams),
+                    "deleted_slots": self._dead, "built_at": self.built_at, "refreshed_at": self.refreshed_at}
+
+
+product_index = ProductIndex()
+
+
+def search_products(query: str, limit: int = 20) -> list:
+    product_index.ensure_fresh()
+    return product_index.search(query, limit)
+
+
+def search_products_scored(query: str, limit: int = 20) -> list:
+    product_index.ensure_fresh()
+    return product_index.search_scored(query, limit)
+
+
+if __name__ == "__main__":
+    # python -m app.search_index "dien thoai"
+    import sys
+
+    t0 = time.perf_counter()
+    product_index.build()
+    print(f"build: {product_index.stats()['products']} sản phẩm trong {time.perf_counter() - t0:.2f}s")
+    query = " ".join(sys.argv[1:]) or "dien thoai"
+    t0 = time.perf_counter()
+    result = product_index.search(query)
+    print(f"search '{query}': {(time.perf_counter() - t0) * 1000:.3f} ms → {result}")
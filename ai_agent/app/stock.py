@@ -0,0 +1,146 @@
+from datetime import datetime
+from pymongo import ASCENDING, UpdateOne, ReturnDocument
+from .database import db
+
+# ============================================================
+# Sổ tồn kho theo (sku, wh)
+# ============================================================
+# inventories giữ tổng tồn theo SKU; stock_balances giữ tồn của từng SKU tại từng kho,
+# khóa duy nhất (sku, wh) (xem app/indexes.py) → câu hỏi "còn bao nhiêu X ở WH02" là 1 point read có index.
+inventories = db["inventories"]
+stock_balances = db["stock_balances"]
+
+
+def apply_stock_delta(sku: str, wh: str, delta: int, now: datetime = None, session=None):
+    """Cộng delta vào tồn tổng (inventories) và tồn theo kho (stock_balances)."""
+    now = now or datetime.utcnow()
+    inventories.update_one(
+        {"sku": sku},
+        {"$inc": {"qty": delta}, "$set": {"updatedAt": now}},
+        upsert=True,
+        session=session,
+    )
+    stock_balances.update_one(
+        {"sku": sku, "wh": wh},
+        {"$inc": {"qty": delta}, "$set": {"updatedAt": now}},
+        upsert=True,
+        session=session,
+    )
+
+
+class InsufficientStockError(Exception):
+    """Xuất kho vượt quá tồn hiện có của SKU tại kho."""
+
+    def __init__(self, sku: str, wh: str, requested: int, available: int):
+        self.sku, self.wh, self.requested, self.available = sku, wh, requested, available
+        super().__init__(f"Không đủ tồn kho: SKU {sku} tại kho {wh} chỉ còn {available}, yêu cầu {requested}.")
+
+
+def reserve_stock(sku: str, wh: str, qty: int, now: datetime = None, session=None) -> int:
+    """
+    Trừ tồn có điều kiện (qty >= n), atomically trên server: hai picker đồng thời không
+    thể cùng lấy phần tồn cuối. Không upsert → SKU chưa có tồn không tạo document "ma".
+
+    inventories là nguồn chuẩn (backend Node chỉ ghi inventories + transactions) nên điều kiện
+    chính đặt trên tồn tổng. Nếu SKU đã có dòng stock_balances tại kho thì tồn tại kho cũng phải đủ;
+    chưa có dòng (hàng nhập qua backend) thì chỉ kiểm tồn tổng, dòng theo kho sẽ có sau lần rebuild.
+    Trả về tồn còn lại; không đủ hàng → InsufficientStockError.
+    """
+    now = now or datetime.utcnow()
+    total = inventories.find_one_and_update(
+        {"sku": sku, "qty": {"$gte": qty}},
+        {"$inc": {"qty": -qty}, "$set": {"updatedAt": now}},
+        projection={"_id": 0, "qty": 1},
+        return_document=ReturnDocument.AFTER,
+        session=session,
+    )
+    if total is None:
+        current = inventories.find_one({"sku": sku}, {"_id": 0, "qty": 1}, session=session)
+        raise InsufficientStockError(sku, wh, qty, current["qty"] if current else 0)
+    balance = stock_balances.find_one_and_update(
+        {"sku": sku, "wh": wh, "qty": {"$gte": qty}},
+        {"$inc": {"qty": -qty}, "$set": {"updatedAt": now}},
+        projection={"_id": 0, "qty": 1},
+        return_document=ReturnDocument.AFTER,
+        session=session,
+    )
+    if balance is not None:
+        return balance["qty"]
+    current = stock_balances.find_one({"sku": sku, "wh": wh}, {"_id": 0, "qty": 1}, session=session)
+    if current is None:
+        return total["qty"]
+    # Đủ tồn tổng nhưng kho này thiếu → hoàn lại tồn tổng (có session thì transaction tự abort)
+    if session is None:
+        inventories.update_one({"sku": sku}, {"$inc": {"qty": qty}, "$set": {"updatedAt": now}})
+    raise InsufficientStockError(sku, wh, qty, current["qty"])
+
+
+def release_stock(sku: str, wh: str, qty: int, now: datetime = None):
+    """Hoàn lại phần đã reserve (chỉ dùng khi không có Mongo transaction để rollback)."""
+    now = now or datetime.utcnow()
+    stock_balances.update_one({"sku": sku, "wh": wh}, {"$inc": {"qty": qty}, "$set": {"updatedAt": now}})
+    inventories.update_one({"sku": sku}, {"$inc": {"qty": qty}, "$set": {"updatedAt": now}})
+
+
+def revert_stock_deltas(deltas: dict, now: datetime = None):
+    """Đảo ngược fold_stock_deltas() khi ghi transaction thất bại mà không có Mongo transaction."""
+    now = now or datetime.utcnow()
+    for (sku, wh), delta in deltas.items():
+        if delta:
+            stock_balances.update_one({"sku": sku, "wh": wh}, {"$inc": {"qty": -delta}, "$set": {"updatedAt": now}})
+            inventories.update_one({"sku": sku}, {"$inc": {"qty": -delta}, "$set": {"updatedAt": now}})
+
+
+def balance_upsert(sku: str, wh: str, qty: int, now: datetime) -> UpdateOne:
+    return UpdateOne({"sku": sku, "wh": wh}, {"$set": {"qty": qty, "updatedAt": now}}, upsert=True)
+
+
+def get_balance(sku: str, wh: str):
+    return stock_balances.find_one({"sku": sku, "wh": wh}, {"_id": 0, "qty": 1})
+
+
+def get_balances(wh: str, skus: list = None, limit: int = 0):
+    q = {"wh": wh}
+    if skus is not None:
+        q["sku"] = {"$in": skus}
+    return stock_balances.find(q, {"_id": 0, "sku": 1, "qty": 1}).sort("sku", ASCENDING).limit(limit)
+
+
+def fold_stock_deltas(deltas: dict, now: datetime = None, session=None):
+    """
+    Cộng dồn nhiều delta một lần: `deltas` có dạng {(sku, wh): delta}.
+    Delta âm (xuất ròng) đi qua reserve_stock() để không bao giờ làm tồn âm; delta dương
+    gộp thành 1 round trip bulk_write mỗi collection (tồn tổng gộp theo SKU).
+    """
+    if not deltas:
+        return
+    now = now or datetime.utcnow()
+    reserved = []
+    try:
+        for (sku, wh), delta in sorted(deltas.items()):
+            if delta < 0:
+                reserve_stock(sku, wh, -delta, now, session=session)
+                reserved.append((sku, wh, -delta))
+    except InsufficientStockError:
+        if session is None:
+            for sku, wh, qty in reserved:
+                release_stock(sku, wh, qty, now)
+        raise
+    deltas = {key: d for key, d in deltas.items() if d > 0}
+    if not deltas:
+        return
+    per_sku = {}
+    for (sku, _wh), delta in deltas.items():
+        per_sku[sku] = per_sku.get(sku, 0) + delta
+    inventories.bulk_write(
+        [UpdateOne({"sku": sku}, {"$inc": {"qty": d}, "$set": {"updatedAt": now}}, upsert=True)
+         for sku, d in per_sku.items()],
+        ordered=False,
+        session=session,
+    )
+    stock_balances.bulk_write(
+        [UpdateOne({"sku": sku, "wh": wh}, {"$inc": {"qty": d}, "$set": {"updatedAt": now}}, upsert=True)
+         for (sku, wh), d in deltas.items()],
+        ordered=False,
+        session=session,
+    )
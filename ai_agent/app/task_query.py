@@ -0,0 +1,98 @@
+from datetime import datetime
+from .database import db
+from .pagination import decode_cursor, fields_projection, _page, TASK_FIELDS
+
+# ============================================================
+# Truy vấn task: filter ghép được, sắp theo ưu tiên → hạn, phân trang keyset
+# ============================================================
+# Schema task (backend/models/tasks.js): type, status, priority (low/normal/high),
+# payload.sku / payload.wh, due_at, assignee. priority là chuỗi nên không sắp trực tiếp được;
+# mỗi task có thêm 2 khóa dẫn xuất để index phục vụ cả filter lẫn sort:
+#   priority_rank: high=0, normal=1, low=2
+#   due_sort:      due_at, hoặc MAX_DUE nếu task không có hạn (xếp cuối)
+# Node backend ghi 2 khóa này khi save; dữ liệu cũ được bổ sung bằng python -m app.migrations.
+tasks = db["tasks"]
+
+TASK_TYPES = ("putaway", "cycle_count", "pick")
+TASK_STATUSES = ("open", "in_progress", "done")   # in_progress: đã nhận qua app/dispatcher.py
+PRIORITY_RANK = {"high": 0, "normal": 1, "low": 2}
+MAX_DUE = datetime(9999, 12, 31)
+TASK_SORT = [("priority_rank", 1), ("due_sort", 1), ("_id", 1)]
+
+
+def priority_rank(priority) -> int:
+    return PRIORITY_RANK.get(str(priority or "normal").lower(), PRIORITY_RANK["normal"])
+
+
+def due_sort(due_at) -> datetime:
+    if isinstance(due_at, str):
+        try:
+            due_at = datetime.fromisoformat(due_at)
+        except ValueError:
+            return MAX_DUE
+    return due_at if isinstance(due_at, datetime) else MAX_DUE
+
+
+def sort_keys(task: dict) -> dict:
+    """Các khóa dẫn xuất cần $set cùng priority/due_at khi ghi task."""
+    return {"priority_rank": priority_rank(task.get("priority")), "due_sort": due_sort(task.get("due_at"))}
+
+
+def _one_or_many(value):
+    if isinstance(value, (list, tuple, set)):
+        return {"$in": list(value)}
+    return value
+
+
+def task_filter(status=None, type=None, priority=None, assignee=None, sku=None, wh=None,
+                due_after: datetime = None, due_before: datetime = None) -> dict:
+    """
+    Filter task; mỗi tham số nhận 1 giá trị hoặc danh sách. Không chỉ định status → mọi
+    trạng thái ($in) để index bắt đầu bằng status vẫn phục vụ được sort.
+    """
+    q = {"status": _one_or_many(status) if status else {"$in": list(TASK_STATUSES)}}
+    if type:
+        q["type"] = _one_or_many(type)
+    if priority:
+        ranks = [priority_rank(p) for p in (priority if isinstance(priority, (list, tuple, set)) else [priority])]
+        q["priority_rank"] = ranks[0] if len(ranks) == 1 else {"$in": ranks}
+    if assignee:
+        q["assignee"] = _one_or_many(assignee)
+    if sku:
+        q["payload.sku"] = _one_or_many(sku)
+    if wh:
+        q["payload.wh"] = _one_or_many(wh)
+    if due_after or due_before:
+        q["due_sort"] = {}
+        if due_after:
+            q["due_sort"]["$gte"] = due_after
+        if due_before:
+            q["due_sort"]["$lt"] = due_before
+    return q
+
+
+def _greater(field: str, value) -> dict:
+    # Task chưa migrate thiếu khóa → Mongo sắp như null, đứng trước mọi giá trị: "sau null" = mọi giá trị khác null
+    return {field: {"$ne": None}} if value is None else {field: {"$gt": value}}
+
+
+def after_key(cursor: str) -> dict:
+    """Điều kiện keyset: các task xếp sau (priority_rank, due_sort, _id) của cursor."""
+    after = decode_cursor(cursor, ("rank", "due", "id"))
+    r, d, i = after["rank"], after["due"], after["id"]
+    return {"$or": [
+        _greater("priority_rank", r),
+        dict(_greater("due_sort", d), priority_rank=r),
+        {"priority_rank": r, "due_sort": d, "_id": {"$gt": i}},
+    ]}
+
+
+def page_tasks(limit: int = 20, cursor: str = None, projection: dict = None, **filters):
+    """Một trang task theo ưu tiên cao → hạn sớm. Trả về (docs, next_cursor)."""
+    q = task_filter(**filters)
+    if cursor:
+        q = {"$and": [q, after_key(cursor)]}
+    projection = dict(projection or fields_projection(TASK_FIELDS))
+    projection.update(_id=1, priority_rank=1, due_sort=1)
+    found = tasks.find(q, projection).sort(TASK_SORT)
+    return _page(found, limit, lambda d: {"rank": d.get("priority_rank"), "due": d.get("due_sort"), "id": d["_id"]})
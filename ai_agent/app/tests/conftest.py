@@ -0,0 +1,19 @@
+import uuid
+import pytest
+
+from app.tests.helpers import MONGO_TEST_URI
+
+
+@pytest.fixture(scope="module")
+def test_db():
+    """Trỏ app.database sang một database tạm, xóa sau khi chạy xong module."""
+    from pymongo import MongoClient
+    from app import database
+
+    client = MongoClient(MONGO_TEST_URI)
+    name = f"swm_test_{uuid.uuid4().hex[:8]}"
+    old_client, old_db = database._client, database.MONGO_DB
+    database._client, database.MONGO_DB = client, name
+    yield client[name]
+    client.drop_database(name)
+    database._client, database.MONGO_DB = old_client, old_db
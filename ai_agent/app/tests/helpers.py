@@ -0,0 +1,26 @@
+import os
+import pytest
+
+# Hàm/marker dùng chung cho các test (module thường: test import từ đây, không import conftest).
+# Test cần MongoDB thật (replica set để có transaction; standalone vẫn chạy nhánh không transaction):
+#   MONGO_TEST_URI=mongodb://localhost:27017/?replicaSet=rs0 pytest app/tests
+MONGO_TEST_URI = os.getenv("MONGO_TEST_URI")
+requires_mongo = pytest.mark.skipif(not MONGO_TEST_URI, reason="cần MONGO_TEST_URI trỏ tới MongoDB thử nghiệm")
+
+
+def seed(db, sku, wh, qty):
+    db["inventories"].insert_one({"sku": sku, "name": sku, "qty": qty})
+    db["stock_balances"].insert_one({"sku": sku, "wh": wh, "qty": qty})
+
+
+def make_task(sku, wh, priority="normal", due_at=None, status="open", type="pick", assignee=None,
+              created_at=None):
+    """Document task như backend ghi, kèm khóa sắp xếp dẫn xuất (priority_rank, due_sort)."""
+    from app.task_query import sort_keys
+
+    doc = {"title": f"{type} {sku}", "type": type, "status": status, "priority": priority,
+           "payload": {"sku": sku, "wh": wh}, "assignee": assignee, "due_at": due_at}
+    if created_at is not None:
+        doc["created_at"] = created_at
+    doc.update(sort_keys(doc))
+    return doc
@@ -0,0 +1,28 @@
+import pytest
+
+pytest.importorskip("dotenv")
+
+from app.cache import cached, tool_cache, invalidate_skus  # noqa: E402
+
+
+def test_value_read_before_write_is_not_cached():
+    tool_cache.clear()
+    stock = {"LT900": 10}
+
+    @cached(lambda sku: [sku])
+    def read_stock(sku):
+        value = stock[sku]
+        # Write chạy xen giữa lúc reader đã đọc xong nhưng chưa ghi cache
+        stock[sku] -= 3
+        invalidate_skus([sku])
+        return value
+
+    assert read_stock("LT900") == 10
+    assert tool_cache.get(("read_stock", ("LT900",), ()))[1] is False
+
+    @cached(lambda sku: [sku])
+    def read_stock_again(sku):
+        return stock[sku]
+
+    assert read_stock_again("LT900") == 7
+    assert tool_cache.get(("read_stock_again", ("LT900",), ()))[0] == 7
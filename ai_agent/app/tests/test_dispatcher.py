@@ -0,0 +1,83 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+import pytest
+
+pytest.importorskip("pymongo")
+
+from app.tests.helpers import requires_mongo, make_task
+
+pytestmark = requires_mongo
+
+
+def _tasks(db, wh, n, type="pick", sku=lambda i: f"P{i:03d}", priority=lambda i: "normal"):
+    db["tasks"].insert_many([make_task(sku(i), wh, priority(i), type=type) for i in range(n)])
+
+
+def test_parallel_claimers_never_share_a_task(test_db):
+    from app.dispatcher import claim_task
+
+    _tasks(test_db, "WH10", 40, priority=lambda i: ["high", "normal", "low"][i % 3])
+    with ThreadPoolExecutor(100) as pool:
+        claimed = list(pool.map(lambda i: claim_task(f"worker{i}", "WH10"), range(100)))
+
+    ids = [t["_id"] for t in claimed if t]
+    assert len(ids) == 40 and len(set(ids)) == 40
+    assert test_db["tasks"].count_documents({"payload.wh": "WH10", "status": "in_progress"}) == 40
+    # Mỗi task đúng 1 lần nhận, người giữ khớp với người đã nhận được task
+    for i, t in enumerate(claimed):
+        if t:
+            stored = test_db["tasks"].find_one({"_id": t["_id"]})
+            assert stored["claimed_by"] == f"worker{i}" and stored["attempts"] == 1
+
+
+def test_claim_order_and_expired_lease_requeue(test_db):
+    from app.dispatcher import claim_task, complete_task, LeaseError
+
+    _tasks(test_db, "WH11", 3, type="putaway", priority=lambda i: ["low", "high", "normal"][i])
+    now = datetime.utcnow()
+    first = claim_task("An", "WH11", now=now, lease_seconds=60)
+    assert first["priority"] == "high"
+
+    # Hết lease → lần claim kế tiếp nhận lại luôn task đó, không cần requeue trước
+    later = now + timedelta(seconds=120)
+    again = claim_task("Binh", "WH11", now=later)
+    assert again["_id"] == first["_id"] and again["claimed_by"] == "Binh" and again["assignee"] is None
+    with pytest.raises(LeaseError):
+        complete_task(first["_id"], "An")
+    assert complete_task(first["_id"], "Binh")["status"] == "done"
+
+
+def test_expired_lease_keeps_supervisor_assignee(test_db):
+    from app.dispatcher import claim_task, requeue_expired
+
+    test_db["tasks"].insert_many([make_task("K1", "WH13", "high", assignee="An"), make_task("K2", "WH13", "low")])
+    now = datetime.utcnow()
+    assert claim_task("An", "WH13", now=now, lease_seconds=60)["payload"]["sku"] == "K1"
+
+    # Task giao sẵn cho An hết lease: người khác không nhận được, An nhận lại được
+    later = now + timedelta(seconds=120)
+    assert claim_task("Binh", "WH13", now=later)["payload"]["sku"] == "K2"
+    assert claim_task("Binh", "WH13", now=later) is None
+    again = claim_task("An", "WH13", now=later, lease_seconds=60)
+    assert again["payload"]["sku"] == "K1" and test_db["tasks"].find_one({"_id": again["_id"]})["attempts"] == 2
+
+    # Dọn chủ động: về open, bỏ người giữ, vẫn giao cho An
+    assert requeue_expired("WH13", now=later + timedelta(seconds=120)) == 1   # K2 của Binh còn lease
+    k1 = test_db["tasks"].find_one({"payload.sku": "K1"})
+    assert k1["status"] == "open" and k1["assignee"] == "An" and "claimed_by" not in k1
+
+
+def test_pick_batch_stays_in_zone(test_db):
+    from app.dispatcher import claim_pick_batch
+
+    test_db["inventories"].insert_many([
+        {"sku": "Z1", "wh": "WH12", "location": "A-01-02", "qty": 5},
+        {"sku": "Z2", "wh": "WH12", "location": "A-03-01", "qty": 5},
+        {"sku": "Z3", "wh": "WH12", "location": "B-01-01", "qty": 5},
+    ])
+    _tasks(test_db, "WH12", 6, sku=lambda i: f"Z{i % 3 + 1}", priority=lambda i: "high" if i == 0 else "normal")
+
+    batch = claim_pick_batch("An", "WH12", max_tasks=10)
+    assert {t["payload"]["sku"] for t in batch} == {"Z1", "Z2"}
+    assert len(batch) == 4 and len({t["batch_id"] for t in batch}) == 1
+    assert test_db["tasks"].count_documents({"payload.sku": "Z3", "status": "open"}) == 2
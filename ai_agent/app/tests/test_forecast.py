@@ -0,0 +1,104 @@
+import math
+from datetime import datetime, timedelta
+import pytest
+
+np = pytest.importorskip("numpy")
+pd = pytest.importorskip("pandas")
+pytest.importorskip("pymongo")
+
+from app.tests.helpers import requires_mongo  # noqa: E402
+
+START = datetime(2025, 1, 1)
+
+
+def _frame():
+    # Ngày 0..4 trong cửa sổ; dòng ngày 7 và ngày -1 nằm ngoài cửa sổ
+    rows = [("A", "WH01", 0, 2), ("A", "WH01", 1, 4), ("A", "WH02", 1, 1), ("A", "WH01", 4, 3),
+            ("A", "WH01", 7, 50), ("A", "WH01", -1, 50),
+            ("B", "WH02", 2, 6), ("D", "WH01", 3, 1), ("F", "WH03", 3, 1)]
+    return pd.DataFrame([(sku, wh, START + timedelta(days=d), qty) for sku, wh, d, qty in rows],
+                        columns=["sku", "wh", "day", "qty"])
+
+
+def _forecast(method="ses"):
+    from app.forecast import demand_matrix, compute_forecast
+
+    matrix, skus, main_wh = demand_matrix(_frame(), START, 5)
+    stock = pd.Series({"A": 5, "B": -2, "D": 3, "F": 100, "Z": 7})
+    result = compute_forecast(matrix, skus, stock, method=method, alpha=0.5, ma_window=2, lead_time=4, z=2)
+    return result.set_index("sku"), main_wh
+
+
+def test_demand_matrix_sums_warehouses_inside_window():
+    from app.forecast import demand_matrix
+
+    matrix, skus, main_wh = demand_matrix(_frame(), START, 5)
+    assert list(skus) == ["A", "B", "D", "F"]
+    assert matrix.tolist() == [[2, 5, 0, 0, 3], [0, 0, 6, 0, 0], [0, 0, 0, 1, 0], [0, 0, 0, 1, 0]]
+    assert main_wh.to_dict() == {"A": "WH01", "B": "WH02", "D": "WH01", "F": "WH03"}
+
+
+def test_exponential_smoothing_and_moving_average():
+    ses, _ = _forecast("ses")
+    # A: 2 → 0.5·5 + 0.5·2 = 3.5 → 1.75 → 0.875 → 0.5·3 + 0.4375 = 1.9375
+    assert ses.loc["A", "daily_demand"] == pytest.approx(1.9375, abs=1e-3)
+    assert ses.loc["B", "daily_demand"] == pytest.approx(0.75)
+
+    ma, _ = _forecast("ma")
+    assert ma.loc["A", "daily_demand"] == pytest.approx(1.5)   # trung bình 2 ngày cuối (0, 3)
+    assert ma.loc["B", "daily_demand"] == 0
+
+
+def test_safety_stock_and_reorder_point():
+    result, _ = _forecast()
+    sigma = np.std([2, 5, 0, 0, 3], ddof=1)
+    safety = 2 * sigma * math.sqrt(4)
+    assert result.loc["A", "safety_stock"] == math.ceil(safety)
+    assert result.loc["A", "reorder_point"] == math.ceil(1.9375 * 4 + safety)
+    assert result.loc["A", "days_of_cover"] == pytest.approx(5 / 1.9375, abs=0.05)
+    assert "Z" not in result.index   # không xuất trong cửa sổ → không dự báo
+
+
+def test_suggest_picks_negative_and_below_reorder_point():
+    from app.forecast import suggest
+
+    result, main_wh = _forecast()
+    picked = suggest(result.reset_index(), main_wh, lead_time=4, horizon_days=7).set_index("sku")
+
+    assert list(picked.index) == ["B", "A", "D"]       # theo số ngày còn đủ hàng tăng dần
+    assert picked.loc["B", "task_type"] == "cycle_count" and picked.loc["B", "priority"] == "high"
+    assert picked.loc["A", "task_type"] == "putaway" and picked.loc["A", "priority"] == "high"
+    assert picked.loc["A", "wh"] == "WH01"
+    assert picked.loc["A", "order_qty"] == math.ceil(
+        result.loc["A", "reorder_point"] + result.loc["A", "daily_demand"] * 7 - 5)
+    # D còn đủ hàng lâu hơn horizon nhưng chạm điểm đặt hàng → ưu tiên thấp; F tồn dư → không đề xuất
+    assert picked.loc["D", "priority"] == "low"
+    assert "F" not in picked.index
+
+
+@requires_mongo
+def test_run_forecast_twice_updates_tasks_instead_of_duplicating(test_db):
+    from app.forecast import run_forecast
+    from app.rollups import bucket_start
+
+    today = bucket_start(datetime.utcnow(), "day")
+    test_db["movement_rollups"].insert_many(
+        [{"g": "day", "sku": "FC1", "wh": "WH01", "t": today - timedelta(days=d), "inbound": 0, "outbound": 5}
+         for d in range(10)]
+        + [{"g": "day", "sku": "FC2", "wh": "WH02", "t": today - timedelta(days=1), "inbound": 0, "outbound": 1}])
+    test_db["inventories"].insert_many([{"sku": "FC1", "qty": 3}, {"sku": "FC2", "qty": -1}])
+
+    first = run_forecast(window_days=14, create_tasks=True)
+    assert first["tasks_upserted"] == 2
+    query = {"source": "forecast"}
+    assert test_db["tasks"].count_documents(query) == 2
+
+    # Task đã được nhận giữa hai lần chạy vẫn được cập nhật, không sinh task open thứ hai
+    test_db["tasks"].update_one({"payload.sku": "FC1"}, {"$set": {"status": "in_progress", "assignee": "An"}})
+    second = run_forecast(window_days=14, create_tasks=True)
+    assert second["tasks_upserted"] == 2
+    docs = {d["payload"]["sku"]: d for d in test_db["tasks"].find(query)}
+    assert len(docs) == 2 and test_db["tasks"].count_documents(query) == 2
+    assert docs["FC1"]["type"] == "putaway" and docs["FC1"]["status"] == "in_progress"
+    assert docs["FC1"]["assignee"] == "An"
+    assert docs["FC2"]["type"] == "cycle_count" and docs["FC2"]["status"] == "open"
@@ -0,0 +1,43 @@
+import pytest
+
+pytest.importorskip("langchain_core")
+
+from app.tests.helpers import requires_mongo, seed
+
+pytestmark = requires_mongo
+
+
+def test_retried_inbound_counts_once(test_db):
+    from app.agent import add_inbound_transaction
+
+    results = [add_inbound_transaction("LT100", 10, "WH01", "scanner1", idempotency_key="scan-001")
+               for _ in range(3)]
+
+    assert len(set(results)) == 1 and results[0].startswith("✅")
+    assert test_db["transactions"].count_documents({"sku": "LT100"}) == 1
+    assert test_db["stock_balances"].find_one({"sku": "LT100", "wh": "WH01"})["qty"] == 10
+
+
+def test_key_reused_for_different_request_is_rejected(test_db):
+    from app.agent import add_outbound_transaction
+    from app.idempotency import IdempotencyError
+
+    seed(test_db, "LT200", "WH01", 50)
+    add_outbound_transaction("LT200", 5, "WH01", "scanner1", idempotency_key="scan-002")
+
+    with pytest.raises(IdempotencyError) as err:
+        add_outbound_transaction("LT200", 7, "WH01", "scanner1", idempotency_key="scan-002")
+
+    assert err.value.status_code == 422
+    assert test_db["stock_balances"].find_one({"sku": "LT200", "wh": "WH01"})["qty"] == 45
+
+
+def test_replayed_batch_returns_original_report(test_db):
+    from app.ingest import add_transactions_batch
+
+    lines = [{"sku": "KB100", "qty": 3, "wh": "WH02", "by": "An"}, {"sku": "", "qty": 1, "wh": "WH02", "by": "An"}]
+    first = add_transactions_batch(lines, idempotency_key="pallet-9")
+    second = add_transactions_batch(lines, idempotency_key="pallet-9")
+
+    assert first == second and first["inserted"] == 1
+    assert test_db["transactions"].count_documents({"sku": "KB100"}) == 1
@@ -0,0 +1,35 @@
+import pytest
+
+pytest.importorskip("langchain_core")
+pytest.importorskip("pymongo")
+
+
+@pytest.mark.parametrize("text, wh", [
+    ("Nhập kho tuần này", None),
+    ("Xuất kho SKU LT001 theo ngày tháng này", None),
+    ("Nhập kho 10 cái SKU LT001 vào kho WH01 bởi An", "WH01"),
+    ("Xuất SKU LT001 kho WH02 30 ngày qua", "WH02"),
+    ("Các task đang mở tại kho HN-01", "HN-01"),
+])
+def test_extract_wh_requires_warehouse_code(text, wh):
+    from app.agent import extract_wh
+
+    assert extract_wh(text) == wh
+
+
+@pytest.mark.parametrize("text, sku, wh", [
+    ("Nhập kho tuần này", None, None),
+    ("Xuất kho SKU LT001 theo ngày tháng này", "LT001", None),
+    ("Xuất kho SKU LT001 tại kho WH03 tháng này", "LT001", "WH03"),
+])
+def test_movement_phrasings_route_without_llm(monkeypatch, text, sku, wh):
+    from app import agent
+    from app.intents import IntentRouter
+
+    calls = []
+    monkeypatch.setattr(agent, "movement_series", lambda start, end, **kw: calls.append(kw) or [])
+
+    name, call = IntentRouter().match(text)
+    assert name == "movements"
+    call()
+    assert calls == [{"sku": sku, "wh": wh, "granularity": "day"}]
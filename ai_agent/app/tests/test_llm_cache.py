@@ -0,0 +1,58 @@
+import pytest
+
+pytest.importorskip("langchain_core")
+
+from langchain_core.language_models import FakeListChatModel
+from app.llm_cache import SQLiteLLMCache, is_write_intent
+
+
+def make_llm(cache):
+    return FakeListChatModel(responses=["trả lời 1", "trả lời 2", "trả lời 3"], cache=cache)
+
+
+def test_same_prompt_served_from_cache(tmp_path):
+    cache = SQLiteLLMCache(str(tmp_path / "cache.sqlite3"))
+    llm = make_llm(cache)
+
+    first = llm.invoke("Question: có những task nào đang mở?")
+    second = llm.invoke("Question:   có những task nào   đang mở?")
+    third = llm.invoke("Question: tồn kho SKU LT001")
+
+    assert first.content == second.content == "trả lời 1"
+    assert third.content == "trả lời 2"
+    assert cache.stats()["hits"] == 1
+
+
+def test_cache_persists_across_instances(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    make_llm(SQLiteLLMCache(path)).invoke("Question: có những task nào đang mở?")
+
+    # Cùng model + tham số (llm_string) → instance cache mới vẫn đọc được kết quả đã lưu
+    cache = SQLiteLLMCache(path)
+    llm = make_llm(cache)
+    assert llm.invoke("Question: có những task nào đang mở?").content == "trả lời 1"
+    assert cache.stats()["hits"] == 1
+
+
+def test_write_intent_bypasses_cache(tmp_path):
+    cache = SQLiteLLMCache(str(tmp_path / "cache.sqlite3"))
+    llm = make_llm(cache)
+    question = "Question: Nhập kho 10 cái SKU LT001 vào kho WH01 bởi An"
+
+    assert llm.invoke(question).content == "trả lời 1"
+    assert llm.invoke(question).content == "trả lời 2"
+    assert cache.stats()["entries"] == 0
+    assert is_write_intent(question)
+
+
+def test_ttl_and_size_eviction(tmp_path):
+    expired = SQLiteLLMCache(str(tmp_path / "ttl.sqlite3"), ttl=0)
+    llm = make_llm(expired)
+    llm.invoke("Question: a")
+    assert llm.invoke("Question: a").content == "trả lời 2"
+
+    bounded = SQLiteLLMCache(str(tmp_path / "lru.sqlite3"), max_entries=2)
+    llm = make_llm(bounded)
+    for q in ("Question: a", "Question: b", "Question: c"):
+        llm.invoke(q)
+    assert bounded.stats()["entries"] == 2
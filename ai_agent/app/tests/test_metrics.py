@@ -0,0 +1,32 @@
+import pytest
+
+pytest.importorskip("pymongo")
+pytest.importorskip("dotenv")
+
+from app.metrics import Histogram, start_trace, timed_tool, TOOL_SECONDS  # noqa: E402
+
+
+def test_histogram_renders_cumulative_buckets():
+    h = Histogram("demo_seconds", "demo", ("route",), buckets=(0.1, 1))
+    for value in (0.05, 0.5, 5):
+        h.observe(value, route="/stock/{sku}")
+
+    lines = h.render()
+    assert 'demo_seconds_bucket{route="/stock/{sku}",le="0.1"} 1' in lines
+    assert 'demo_seconds_bucket{route="/stock/{sku}",le="1"} 2' in lines
+    assert 'demo_seconds_bucket{route="/stock/{sku}",le="+Inf"} 3' in lines
+    assert 'demo_seconds_count{route="/stock/{sku}"} 3' in lines
+
+
+def test_timed_tool_records_into_request_trace():
+    trace = start_trace("req-1")
+    ok = timed_tool("DemoTool", lambda q: f"📦 {q}")
+    failed = timed_tool("DemoTool", lambda q: "❌ lỗi")
+
+    assert ok("LT001") == "📦 LT001"
+    failed("LT001")
+
+    assert [name for name, _ in trace.tools] == ["DemoTool", "DemoTool"]
+    rendered = "\n".join(TOOL_SECONDS.render())
+    assert 'agent_tool_duration_seconds_count{tool="DemoTool",status="ok"} 1' in rendered
+    assert 'agent_tool_duration_seconds_count{tool="DemoTool",status="error"} 1' in rendered
@@ -0,0 +1,112 @@
+import csv
+import io
+import json
+from datetime import datetime, timedelta
+import pytest
+
+pytest.importorskip("pymongo")
+
+from app.tests.helpers import requires_mongo
+
+pytestmark = requires_mongo
+
+BASE = datetime(2025, 3, 1)
+
+
+def _walk(page, limit, **kwargs):
+    items, cursor, pages = [], None, 0
+    while True:
+        docs, cursor = page(limit=limit, cursor=cursor, **kwargs)
+        items += docs
+        pages += 1
+        if not cursor:
+            return items, pages
+
+
+@pytest.fixture(scope="module")
+def seeded(test_db):
+    # Nhiều transaction cùng `at` → thứ tự phải dựa vào _id để không lặp/bỏ sót dòng ở ranh giới trang
+    test_db["transactions"].insert_many([
+        {"sku": f"P{i % 4}", "type": "inbound", "qty": i, "wh": "WH01" if i % 3 else "WH02",
+         "by": "An", "by_lc": "an", "at": BASE + timedelta(minutes=i // 3)}
+        for i in range(25)])
+    test_db["inventories"].insert_many(
+        [{"sku": f"DT{i:02d}", "name": f"Điện thoại mẫu {i}", "qty": i} for i in range(12)]
+        + [{"sku": f"LT{i:02d}", "name": f"Laptop {i}", "qty": 5} for i in range(3)])
+    test_db["stock_balances"].insert_many(
+        [{"sku": f"DT{i:02d}", "wh": "WH02", "qty": 100 + i} for i in range(0, 12, 3)])
+    return test_db
+
+
+def test_transactions_keyset_pages_cover_every_row_once(seeded):
+    from app.pagination import page_transactions
+
+    items, pages = _walk(page_transactions, 4)
+    assert pages == 7 and len(items) == 25
+    assert len({d["_id"] for d in items}) == 25
+    keys = [(d["at"], d["_id"]) for d in items]
+    assert keys == sorted(keys, reverse=True)
+
+    items, _ = _walk(page_transactions, 3, user="AN", wh="WH02")
+    assert sorted(d["qty"] for d in items) == list(range(0, 25, 3))
+
+
+def test_inventories_keyset_pages_in_sku_order(seeded):
+    from app.pagination import page_inventories
+
+    items, pages = _walk(page_inventories, 4)
+    assert pages == 4 and [d["sku"] for d in items] == sorted(d["sku"] for d in items)
+    assert len(items) == 15
+
+    items, _ = _walk(page_inventories, 3, wh="WH02")
+    assert [(d["sku"], d["qty"], d["wh"], d["name"]) for d in items] == [
+        (f"DT{i:02d}", 100 + i, "WH02", f"Điện thoại mẫu {i}") for i in range(0, 12, 3)]
+
+
+def test_cursor_from_another_listing_is_rejected(seeded):
+    from app.pagination import page_transactions, page_inventories, page_inventory_search
+
+    _docs, tx_cursor = page_transactions(limit=2)
+    _docs, inv_cursor = page_inventories(limit=2)
+    with pytest.raises(ValueError, match="không thuộc danh sách này"):
+        page_inventories(limit=2, cursor=tx_cursor)
+    with pytest.raises(ValueError, match="không thuộc danh sách này"):
+        page_transactions(limit=2, cursor=inv_cursor)
+    with pytest.raises(ValueError, match="không thuộc danh sách này"):
+        page_inventory_search("laptop", limit=2, cursor=inv_cursor)
+    with pytest.raises(ValueError, match="không hợp lệ"):
+        page_inventories(limit=2, cursor="khong-phai-cursor")
+
+
+def test_name_search_filters_warehouse_before_limit_and_pages(seeded):
+    from app.pagination import page_inventory_search
+    from app.search_index import product_index
+
+    product_index.build()
+    # 12 điện thoại khớp, chỉ 4 có ở WH02: trang đầu vẫn đủ 3 dòng dù 3 kết quả xếp đầu có thể không ở kho này
+    items, pages = _walk(page_inventory_search, 3, query="dien thoai", wh="WH02")
+    assert sorted(d["sku"] for d in items) == [f"DT{i:02d}" for i in range(0, 12, 3)]
+    assert pages == 2 and all(d["wh"] == "WH02" and d["qty"] >= 100 for d in items)
+
+    items, _ = _walk(page_inventory_search, 5, query="dien thoai")
+    assert len(items) == 12 and len({d["sku"] for d in items}) == 12
+
+    _docs, cursor = page_inventory_search("dien thoai", limit=5)
+    with pytest.raises(ValueError, match="không thuộc danh sách này"):
+        page_inventory_search("laptop", limit=5, cursor=cursor)
+
+
+def test_exports_stream_ndjson_and_csv(seeded):
+    from app.pagination import (
+        iter_transactions, iter_inventories, stream_rows, TRANSACTION_FIELDS, INVENTORY_FIELDS,
+    )
+
+    lines = list(stream_rows(iter_transactions(sku="P1", batch_size=2), TRANSACTION_FIELDS))
+    rows = [json.loads(line) for line in lines]
+    assert len(rows) == 6 and all(r["sku"] == "P1" and isinstance(r["id"], str) for r in rows)
+    assert rows == sorted(rows, key=lambda r: (r["at"], r["id"]), reverse=True)
+
+    text = "".join(stream_rows(iter_inventories(wh="WH02", batch_size=3), INVENTORY_FIELDS, "csv"))
+    table = list(csv.DictReader(io.StringIO(text)))
+    assert [r["sku"] for r in table] == ["DT00", "DT03", "DT06", "DT09"]
+    assert table[1]["qty"] == "103" and table[1]["location"] == ""
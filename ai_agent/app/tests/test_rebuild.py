@@ -0,0 +1,54 @@
+import random
+import pytest
+
+pytest.importorskip("pymongo")
+
+from app.tests.helpers import requires_mongo
+
+pytestmark = requires_mongo
+
+
+def _per_sku_stock(db):
+    """Cách tính cũ: mỗi SKU một aggregate riêng."""
+    stock = {}
+    for sku in db["transactions"].distinct("sku"):
+        row = next(db["transactions"].aggregate([
+            {"$match": {"sku": sku}},
+            {"$group": {"_id": "$sku",
+                        "inbound": {"$sum": {"$cond": [{"$eq": ["$type", "inbound"]}, "$qty", 0]}},
+                        "outbound": {"$sum": {"$cond": [{"$eq": ["$type", "outbound"]}, "$qty", 0]}}}},
+        ]))
+        stock[sku] = row["inbound"] - row["outbound"]
+    return stock
+
+
+def test_grouped_rebuild_matches_per_sku_totals_and_writes_balances(test_db):
+    from app.rebuild import run_rebuild
+
+    rng = random.Random(7)
+    docs, balances = [], {}
+    for _ in range(400):
+        sku, wh = f"S{rng.randrange(23):02d}", rng.choice(["WH01", "WH02", "WH03"])
+        type_, qty = rng.choice(["inbound", "inbound", "outbound", "adjust"]), rng.randrange(1, 20)
+        docs.append({"sku": sku, "wh": wh, "type": type_, "qty": qty})
+        sign = {"inbound": 1, "outbound": -1}.get(type_, 0)
+        balances[(sku, wh)] = balances.get((sku, wh), 0) + sign * qty
+    test_db["transactions"].insert_many(docs)
+    # SKU đã có document: qty cũ bị ghi đè, các trường khác giữ nguyên
+    test_db["inventories"].insert_one({"sku": "S00", "name": "Máy quét", "qty": -999, "location": "A1"})
+    test_db["stock_balances"].insert_one({"sku": "S00", "wh": "WH01", "qty": -999})
+
+    stats = run_rebuild(batch_size=5)
+    expected = _per_sku_stock(test_db)
+    assert stats["skus"] == len(expected) == 23 and stats["batches"] == 5
+    assert {d["sku"]: d["qty"] for d in test_db["inventories"].find()} == expected
+    s00 = test_db["inventories"].find_one({"sku": "S00"})
+    assert s00["name"] == "Máy quét" and s00["location"] == "A1"
+    new = test_db["inventories"].find_one({"sku": "S01"})
+    assert new["name"] == "S01" and new["name_lc"] == "s01" and new["uom"] == "EA"
+
+    test_db["inventories"].update_many({}, {"$set": {"qty": 0}})
+    stats = run_rebuild(batch_size=4, balances=True)
+    assert stats["skus"] == 23
+    assert {d["sku"]: d["qty"] for d in test_db["inventories"].find()} == expected
+    assert {(b["sku"], b["wh"]): b["qty"] for b in test_db["stock_balances"].find()} == balances
@@ -0,0 +1,42 @@
+import pytest
+
+pytest.importorskip("pymongo")
+
+from app.tests.helpers import requires_mongo, MONGO_TEST_URI
+
+pytestmark = requires_mongo
+
+
+def _transactions(db, skus=30):
+    docs = []
+    for i in range(skus):
+        sku = f"R{i:03d}"
+        docs += [{"sku": sku, "type": "inbound", "qty": 10 + i, "wh": "WH01"},
+                 {"sku": sku, "type": "inbound", "qty": 5, "wh": "WH02"},
+                 {"sku": sku, "type": "outbound", "qty": i % 7, "wh": "WH01"}]
+    db["transactions"].insert_many(docs)
+
+
+def _stock(db):
+    return {d["sku"]: d["qty"] for d in db["inventories"].find({"sku": {"$regex": "^R"}})}
+
+
+def test_sharded_rebuild_matches_single_process_and_resumes(test_db):
+    from app.rebuild_sharded import run_sharded_rebuild, rebuild_shards
+
+    _transactions(test_db)
+    stats = run_sharded_rebuild(2, balances=True, shards_per_worker=3, mongo_uri=MONGO_TEST_URI,
+                                db_name=test_db.name)
+    assert stats["skus"] == 30 and stats["shards"] == 6 and stats["failed"] == []
+    expected = {f"R{i:03d}": 15 + i - i % 7 for i in range(30)}
+    assert _stock(test_db) == expected
+    assert test_db["stock_balances"].find_one({"sku": "R010", "wh": "WH01"})["qty"] == 20 - 3
+
+    # Giả lập shard 4 chưa chạy xong: resume chỉ chạy lại đúng shard đó
+    shard = rebuild_shards.find_one({"run_id": stats["run_id"], "i": 4})
+    rebuild_shards.update_one({"_id": shard["_id"]}, {"$set": {"status": "failed"}})
+    test_db["inventories"].update_many({"sku": {"$gte": shard["lo"], "$lt": shard["hi"]}}, {"$set": {"qty": 0}})
+
+    resumed = run_sharded_rebuild(2, resume=stats["run_id"], mongo_uri=MONGO_TEST_URI, db_name=test_db.name)
+    assert resumed["failed"] == [] and resumed["skus"] == shard["stats"]["skus"]
+    assert _stock(test_db) == expected
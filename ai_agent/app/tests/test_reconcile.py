@@ -0,0 +1,128 @@
+import pytest
+from datetime import datetime, timedelta
+
+pytest.importorskip("pymongo")
+
+from app.tests.helpers import requires_mongo
+
+pytestmark = requires_mongo
+
+BASE = datetime.utcnow() - timedelta(days=1)
+
+
+def _reset(db):
+    for name in ("transactions", "inventories", "stock_balances", "inventory_ledger", "reconcile_state"):
+        db[name].delete_many({})
+
+
+def _tx(db, sku, type, qty, wh="WH01", seconds=0, at=None):
+    db["transactions"].insert_one({"sku": sku, "type": type, "qty": qty, "wh": wh,
+                                   "at": at or BASE + timedelta(seconds=seconds)})
+
+
+def _qty(db, name, **key):
+    doc = db[name].find_one(key)
+    return doc["qty"] if doc else None
+
+
+def _bootstrapped(db):
+    """Log: A = 10 - 3 (WH01) + 5 (WH02) = 12, B = 4; inventories của B bị lệch (9)."""
+    from app.reconcile import reconcile_inventory
+
+    _reset(db)
+    _tx(db, "A", "inbound", 10, seconds=1)
+    _tx(db, "A", "outbound", 3, seconds=2)
+    _tx(db, "A", "inbound", 5, wh="WH02", seconds=3)
+    _tx(db, "B", "inbound", 4, seconds=4)
+    db["inventories"].insert_many([{"sku": "A", "name": "A", "qty": 12}, {"sku": "B", "name": "B", "qty": 9}])
+    db["stock_balances"].insert_many([{"sku": "A", "wh": "WH01", "qty": 7}, {"sku": "A", "wh": "WH02", "qty": 5},
+                                      {"sku": "B", "wh": "WH01", "qty": 0}])
+    return reconcile_inventory(lag=0)
+
+
+def test_bootstrap_builds_ledger_and_reports_without_overwriting(test_db):
+    stats = _bootstrapped(test_db)
+
+    assert stats["mode"] == "bootstrap" and stats["skus"] == 2 and stats["fixed"] == 0
+    assert stats["mismatches"] == [{"sku": "B", "qty": 9, "expected": 4}]
+    assert _qty(test_db, "inventory_ledger", sku="A") == 12 and _qty(test_db, "inventory_ledger", sku="B") == 4
+    assert _qty(test_db, "inventories", sku="B") == 9
+
+
+def test_fix_applies_difference_and_keeps_concurrent_writes(test_db):
+    from app.reconcile import fix_mismatches
+    from app.stock import apply_stock_delta
+
+    stats = _bootstrapped(test_db)
+    # Một write path chạy xen giữa lúc so sánh và lúc sửa: $inc + ghi transaction
+    apply_stock_delta("B", "WH01", 2)
+    _tx(test_db, "B", "inbound", 2, seconds=5)
+
+    assert fix_mismatches(stats["mismatches"]) == 1
+    assert _qty(test_db, "inventories", sku="B") == 4 + 2
+    assert _qty(test_db, "stock_balances", sku="B", wh="WH01") == 4 + 2
+    assert _qty(test_db, "inventories", sku="A") == 12
+
+
+def test_incremental_folds_only_past_checkpoint_and_fixes(test_db):
+    from app.reconcile import reconcile_inventory
+
+    _bootstrapped(test_db)
+    _tx(test_db, "A", "outbound", 2, seconds=10)
+    _tx(test_db, "C", "inbound", 6, wh="WH02", seconds=11)
+    test_db["inventories"].update_one({"sku": "A"}, {"$inc": {"qty": -2}})
+    test_db["inventories"].insert_one({"sku": "C", "name": "C", "qty": 1})
+
+    stats = reconcile_inventory(lag=0)
+    assert stats["mode"] == "incremental" and stats["transactions"] == 2 and stats["skus"] == 2
+    assert stats["mismatches"] == [{"sku": "C", "qty": 1, "expected": 6}]
+    assert _qty(test_db, "inventory_ledger", sku="A") == 10 and _qty(test_db, "inventory_ledger", sku="C") == 6
+    assert _qty(test_db, "inventories", sku="C") == 1
+
+    # Không có transaction mới → không cộng lại gì; fix=True sửa SKU lệch
+    assert reconcile_inventory(lag=0)["transactions"] == 0
+    _tx(test_db, "C", "outbound", 1, wh="WH02", seconds=12)
+    stats = reconcile_inventory(lag=0, fix=True)
+    assert stats["mismatches"] == [{"sku": "C", "qty": 1, "expected": 5}] and stats["fixed"] == 1
+    assert _qty(test_db, "inventories", sku="C") == 5
+    assert _qty(test_db, "stock_balances", sku="C", wh="WH02") == 5
+    assert _qty(test_db, "inventory_ledger", sku="C") == 5
+
+
+def test_lag_cutoff_defers_recent_transactions(test_db):
+    from app.reconcile import reconcile_inventory
+
+    _bootstrapped(test_db)
+    _tx(test_db, "A", "inbound", 1, at=datetime.utcnow())
+
+    assert reconcile_inventory(lag=60)["transactions"] == 0
+    assert _qty(test_db, "inventory_ledger", sku="A") == 12
+    assert reconcile_inventory(lag=0)["transactions"] == 1
+    assert _qty(test_db, "inventory_ledger", sku="A") == 13
+
+
+def test_interrupted_run_resumes_without_double_counting(test_db, monkeypatch):
+    from app import reconcile
+
+    _bootstrapped(test_db)
+    for i in range(5):
+        _tx(test_db, "A", "inbound", 1, seconds=20 + i)
+
+    fold = reconcile._fold
+    calls = []
+
+    def crash_after_first_batch(*args):
+        if calls:
+            raise RuntimeError("mất kết nối")
+        calls.append(1)
+        fold(*args)
+
+    monkeypatch.setattr(reconcile, "_fold", crash_after_first_batch)
+    with pytest.raises(RuntimeError):
+        reconcile.reconcile_inventory(batch_size=2, lag=0)
+    assert _qty(test_db, "inventory_ledger", sku="A") == 12 + 2
+
+    monkeypatch.setattr(reconcile, "_fold", fold)
+    assert reconcile.reconcile_inventory(batch_size=2, lag=0)["transactions"] == 3
+    assert _qty(test_db, "inventory_ledger", sku="A") == 12 + 5
+    assert test_db["reconcile_state"].find_one({"_id": reconcile.STATE_ID})["folded"] == 5
@@ -0,0 +1,78 @@
+import pytest
+
+pytest.importorskip("pymongo")
+pytest.importorskip("dotenv")
+
+from app.search_index import ProductIndex  # noqa: E402
+from app.tests.helpers import requires_mongo  # noqa: E402
+
+
+def test_search_scored_reports_token_coverage():
+    index = ProductIndex()
+    index.add("LT001", "Laptop Dell XPS 13")
+    index.add("PH001", "Điện thoại Samsung A55")
+
+    assert index.search_scored("dien thoai") == [("PH001", 1.0)]
+    assert index.search_scored("laptop del") == [("LT001", 0.9)]
+    # Chỉ giống một phần → độ phủ thấp, get_stock_by_name sẽ đưa danh sách gợi ý thay vì tự chọn
+    assert all(coverage < 0.8 for _sku, coverage in index.search_scored("laptp samsng"))
+
+
+def test_exact_prefix_and_trigram_ranking():
+    index = ProductIndex()
+    index.add("PH001", "Điện thoại Samsung A55")
+    index.add("PH002", "Ốp lưng điện thoại")
+    index.add("PH003", "Điện thoại Samsung Galaxy S24 Ultra")
+    index.add("KB001", "Bàn phím cơ")
+
+    # Cụm từ đứng đầu tên xếp trước; cùng điểm → tên ngắn hơn trước
+    assert index.search("dien thoai") == ["PH001", "PH003", "PH002"]
+    # Khớp chính xác hơn khớp tiền tố
+    assert index.search_scored("samsung")[0] == ("PH001", 1.0)
+    assert index.search_scored("sams") == [("PH001", 0.8), ("PH003", 0.8)]
+    # Gõ sai chính tả → trigram, điểm thấp hơn
+    ranked = index.search_scored("samsumg")
+    assert [sku for sku, _ in ranked] == ["PH001", "PH003"] and ranked[0][1] < 0.8
+    assert index.search("ban phim") == ["KB001"]
+    assert index.search("") == [] and index.search("xyz") == []
+
+
+def test_readd_replaces_old_name_and_compacts_tombstones():
+    index = ProductIndex(compact_ratio=0.5, compact_min_dead=4)
+    for i in range(4):
+        index.add(f"SP{i}", f"Sản phẩm {i}")
+    index.add("SP0", "Máy quét mã vạch")
+
+    assert index.search("may quet") == ["SP0"]
+    assert "SP0" not in index.search("san pham")
+    assert index.stats()["deleted_slots"] == 1
+
+    # Cập nhật lặp lại: slot chết được nén, _docs không tăng theo số lần cập nhật
+    for n in range(50):
+        index.add("SP1", f"Tên mới {n}")
+    assert len(index._docs) <= 2 * index.stats()["products"] + 4
+    assert index.stats()["deleted_slots"] < 4
+    assert index.search("ten moi 49") == ["SP1"] and index.search("ten moi") == ["SP1"]
+    assert index.search("san pham") == ["SP2", "SP3"] and index.search("may quet") == ["SP0"]
+    # Posting list chỉ trỏ tới slot còn sống
+    assert all(index._docs[doc_id] is not None for ids in index._tokens.values() for doc_id in ids)
+
+
+@requires_mongo
+def test_refresh_picks_up_renamed_and_new_products(test_db):
+    from datetime import datetime, timedelta
+
+    old = datetime.utcnow() - timedelta(hours=1)
+    test_db["inventories"].insert_many([{"sku": "RF1", "name": "Thùng carton", "updatedAt": old},
+                                        {"sku": "RF2", "name": "Băng keo", "updatedAt": old}])
+    index = ProductIndex()
+    index.build()
+    assert index.search("thung") == ["RF1"]
+
+    test_db["inventories"].update_one({"sku": "RF1"}, {"$set": {"name": "Pallet gỗ", "updatedAt": datetime.utcnow()}})
+    test_db["inventories"].insert_one({"sku": "RF3", "name": "Thùng nhựa", "updatedAt": datetime.utcnow()})
+    index.refresh()
+
+    assert index.search("pallet") == ["RF1"]
+    assert index.search("thung") == ["RF3"]
+    assert index.search("bang keo") == ["RF2"]
@@ -0,0 +1,80 @@
+from datetime import datetime, timedelta
+import pytest
+
+pytest.importorskip("pymongo")
+
+from app.tests.helpers import requires_mongo, make_task
+
+pytestmark = requires_mongo
+
+NOW = datetime(2025, 6, 1)
+
+
+def _task(sku, wh, priority, due_days=None, **fields):
+    due_at = NOW + timedelta(days=due_days) if due_days is not None else None
+    return make_task(sku, wh, priority, due_at, created_at=NOW, **fields)
+
+
+@pytest.fixture(scope="module", autouse=True)
+def tasks(test_db):
+    test_db["tasks"].insert_many([
+        _task("A1", "WH01", "low", 1),
+        _task("A2", "WH01", "high", 5),
+        _task("A3", "WH01", "high", None),
+        _task("A4", "WH01", "high", 2, assignee="An"),
+        _task("A5", "WH02", "normal", 1, type="cycle_count"),
+        _task("A6", "WH01", "normal", -1, status="done"),
+    ])
+
+
+def test_filters_use_payload_fields_and_priority_due_order():
+    from app.task_query import page_tasks
+
+    docs, cursor = page_tasks(status="open", wh="WH01")
+    assert [d["payload"]["sku"] for d in docs] == ["A4", "A2", "A3", "A1"]
+    assert cursor is None
+
+    docs, _ = page_tasks(sku="A5", type="cycle_count")
+    assert [d["payload"]["sku"] for d in docs] == ["A5"]
+
+
+def test_keyset_pages_cover_every_task_once():
+    from app.task_query import page_tasks
+
+    seen, cursor = [], None
+    while True:
+        docs, cursor = page_tasks(limit=2, cursor=cursor)
+        seen += [d["payload"]["sku"] for d in docs]
+        if not cursor:
+            break
+    assert seen == ["A4", "A2", "A3", "A6", "A5", "A1"]
+
+
+def test_keyset_pages_past_tasks_missing_sort_keys(test_db):
+    from app.task_query import page_tasks
+
+    # Task do hệ thống khác ghi, chưa chạy migration: không có priority_rank / due_sort
+    test_db["tasks"].insert_many([
+        {"title": "cũ 1", "type": "pick", "status": "open", "priority": "high", "payload": {"sku": "U1", "wh": "WH09"}},
+        {"title": "cũ 2", "type": "pick", "status": "open", "payload": {"sku": "U2", "wh": "WH09"}},
+        _task("U3", "WH09", "high", 1),
+        {"title": "cũ 4", "type": "pick", "status": "open", "priority_rank": 0, "payload": {"sku": "U4", "wh": "WH09"}},
+    ])
+    seen, cursor = [], None
+    while True:
+        docs, cursor = page_tasks(limit=1, cursor=cursor, wh="WH09")
+        seen += [d["payload"]["sku"] for d in docs]
+        if not cursor:
+            break
+    # Thiếu khóa sắp như null (đứng trước); trang không dừng ở task chưa migrate
+    assert seen == ["U1", "U2", "U4", "U3"]
+    test_db["tasks"].delete_many({"payload.wh": "WH09"})
+
+
+def test_due_window_and_assignee():
+    from app.task_query import page_tasks
+
+    docs, _ = page_tasks(status="open", due_before=NOW + timedelta(days=2))
+    assert [d["payload"]["sku"] for d in docs] == ["A5", "A1"]
+    docs, _ = page_tasks(assignee="An", priority="high")
+    assert [d["payload"]["sku"] for d in docs] == ["A4"]
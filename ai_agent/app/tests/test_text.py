@@ -0,0 +1,53 @@
+import unicodedata
+from datetime import datetime
+import pytest
+
+from app.text import search_key
+from app.tests.helpers import requires_mongo
+
+
+@pytest.mark.parametrize("value, key", [
+    ("Nguyễn Văn An", "nguyễn văn an"),   # NFD (gõ trên macOS) → NFC
+    ("  Trần\tThị \n Bình  ", "trần thị bình"),
+    ("ĐIỆN THOẠI Samsung", "điện thoại samsung"),
+    ("a.b*(c)?[x]", "a.b*(c)?[x]"),                         # ký tự đặc biệt regex giữ nguyên
+    (None, ""),
+    (42, "42"),
+])
+def test_search_key_normalizes(value, key):
+    assert search_key(value) == key
+
+
+@requires_mongo
+def test_backfill_fills_missing_keys_once(test_db):
+    from app.migrations import run_backfills
+    from app.pagination import page_transactions
+    from app.task_query import MAX_DUE
+
+    due = datetime(2025, 5, 1)
+    test_db["transactions"].insert_many([
+        {"sku": "X", "by": "Nguyễn  AN", "at": datetime(2025, 1, 1)},
+        {"sku": "X", "by": "a.b*", "at": datetime(2025, 1, 2)},
+        {"sku": "X", "by": "axb", "at": datetime(2025, 1, 3)},
+        {"sku": "X", "by": "Đã có", "by_lc": "giữ nguyên", "at": datetime(2025, 1, 4)},
+    ])
+    test_db["inventories"].insert_many([{"sku": "X", "name": " Máy  Quét "}, {"sku": "Y"}])
+    test_db["tasks"].insert_many([{"title": "t1", "priority": "HIGH", "due_at": due},
+                                  {"title": "t2", "due_at": "không phải ngày"}])
+
+    assert run_backfills(batch_size=2) == {"transactions.by_lc": 3, "inventories.name_lc": 2,
+                                           "tasks.priority_rank": 2, "tasks.due_sort": 2}
+    assert {d["by"]: d["by_lc"] for d in test_db["transactions"].find()} == {
+        "Nguyễn  AN": "nguyễn an", "a.b*": "a.b*", "axb": "axb", "Đã có": "giữ nguyên"}
+    assert {d["sku"]: d["name_lc"] for d in test_db["inventories"].find()} == {"X": "máy quét", "Y": ""}
+    t1, t2 = test_db["tasks"].find_one({"title": "t1"}), test_db["tasks"].find_one({"title": "t2"})
+    assert t1["priority_rank"] < t2["priority_rank"] and t1["due_sort"] == due and t2["due_sort"] == MAX_DUE
+
+    # Chạy lại: không còn document thiếu khóa
+    assert set(run_backfills().values()) == {0}
+
+    # Tìm theo user dùng khóa vừa backfill; tên chứa ký tự đặc biệt regex chỉ khớp chính xác, không khớp "axb"
+    docs, _ = page_transactions(user="A.B*", limit=10)
+    assert [d["by"] for d in docs] == ["a.b*"]
+    docs, _ = page_transactions(user="nguyễn an", limit=10)
+    assert len(docs) == 1
@@ -0,0 +1,12 @@
+import unicodedata
+
+# ============================================================
+# Chuẩn hóa chuỗi dùng làm khóa tìm kiếm
+# ============================================================
+
+
+def search_key(value) -> str:
+    """Khóa so khớp không phân biệt hoa/thường: NFC + bỏ khoảng trắng thừa + lowercase (giống backend Node)."""
+    if value is None:
+        return ""
+    return " ".join(unicodedata.normalize("NFC", str(value)).split()).lower()
@@ -0,0 +1,66 @@
+"""
+Đo thời gian phần tính toán của forecast engine trên dữ liệu tổng hợp (không cần Mongo).
+
+    python benchmarks/forecast.py --skus 100000 --days 90 --density 0.2
+
+Sinh ngẫu nhiên các dòng (sku, wh, day, qty) như load_daily_outbound() trả về,
+rồi chạy demand_matrix → compute_forecast → suggest đúng như run_forecast().
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.forecast import demand_matrix, compute_forecast, suggest  # noqa: E402
+
+
+def synthetic(skus: int, days: int, density: float, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    start = datetime(2025, 1, 1)
+    rows = int(skus * days * density)
+    sku_ids = rng.integers(0, skus, rows)
+    frame = pd.DataFrame({
+        "sku": pd.Series(sku_ids).map(lambda i: f"SKU{i:06d}"),
+        "wh": rng.choice(["WH01", "WH02", "WH03"], rows),
+        "day": start + pd.to_timedelta(rng.integers(0, days, rows), unit="D"),
+        "qty": rng.poisson(5, rows) + 1,
+    })
+    stock = pd.Series(rng.integers(-5, 200, skus), index=[f"SKU{i:06d}" for i in range(skus)])
+    return frame, stock, start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--skus", type=int, default=100000)
+    parser.add_argument("--days", type=int, default=90)
+    parser.add_argument("--density", type=float, default=0.2, help="Tỉ lệ (SKU, ngày) có xuất kho")
+    parser.add_argument("--method", choices=["ses", "ma"], default="ses")
+    opts = parser.parse_args()
+
+    frame, stock, start = synthetic(opts.skus, opts.days, opts.density)
+    t0 = time.perf_counter()
+    matrix, skus, main_wh = demand_matrix(frame, start, opts.days)
+    t1 = time.perf_counter()
+    result = compute_forecast(matrix, skus, stock, method=opts.method)
+    t2 = time.perf_counter()
+    picked = suggest(result, main_wh, 7, 7)
+    t3 = time.perf_counter()
+    print(json.dumps({
+        "rows": len(frame),
+        "skus": len(skus),
+        "suggestions": len(picked),
+        "matrix_s": round(t1 - t0, 3),
+        "forecast_s": round(t2 - t1, 3),
+        "suggest_s": round(t3 - t2, 3),
+        "total_s": round(t3 - t0, 3),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
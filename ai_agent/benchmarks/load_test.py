@@ -0,0 +1,63 @@
+"""
+Load test cho các endpoint đọc của ai_agent.
+
+Chạy server trước:  uvicorn main:app --port 8000
+Rồi:                python benchmarks/load_test.py --url http://localhost:8000 --sku LT001
+
+Với mỗi mức concurrency, gửi --requests request tới /stock và /history, in ra
+throughput (req/s) và độ trễ p50/p95. Nếu event loop không bị chặn, throughput
+phải tăng theo concurrency thay vì đứng yên ở mức 1 request tại một thời điểm.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+import httpx
+
+
+async def _worker(client: httpx.AsyncClient, queue: asyncio.Queue, latencies: list, sku: str):
+    while True:
+        try:
+            path = queue.get_nowait()
+        except asyncio.QueueEmpty:
+            return
+        started = time.perf_counter()
+        resp = await client.post(path, json={"sku": sku})
+        resp.raise_for_status()
+        latencies.append(time.perf_counter() - started)
+
+
+async def run_level(url: str, concurrency: int, total: int, sku: str) -> dict:
+    queue = asyncio.Queue()
+    for i in range(total):
+        queue.put_nowait("/stock" if i % 2 == 0 else "/history")
+    latencies = []
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=60) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(_worker(client, queue, latencies, sku) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(statistics.median(latencies) * 1000, 1),
+        "p95_ms": round(latencies[int(len(latencies) * 0.95) - 1] * 1000, 1),
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--sku", default="LT001")
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--levels", default="1,4,16,64")
+    opts = parser.parse_args()
+
+    for level in (int(x) for x in opts.levels.split(",")):
+        print(await run_level(opts.url, level, opts.requests, opts.sku))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,86 @@
+"""
+So sánh bytes đọc từ Mongo và độ trễ: query lấy nguyên document vs query có projection.
+
+    python benchmarks/projection.py --sku LT001 --name laptop --repeat 50
+
+Mỗi cặp (cũ, mới) chạy đúng hình dạng query mà tool dùng trước/sau khi thêm projection.
+Document được đọc dưới dạng RawBSONDocument nên số bytes là kích thước BSON thật mà
+server trả về (không tính overhead của driver khi decode).
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from bson.codec_options import CodecOptions
+from bson.raw_bson import RawBSONDocument
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.database import get_db  # noqa: E402
+from app.pagination import fields_projection, TRANSACTION_FIELDS, INVENTORY_FIELDS, TASK_FIELDS  # noqa: E402
+
+RAW = CodecOptions(document_class=RawBSONDocument)
+
+
+def cases(sku: str, name: str) -> list:
+    """(tên, collection, filter, projection cũ, projection mới, sort, limit)"""
+    return [
+        ("get_stock_by_name", "inventories", {"name_lc": name}, None, {"_id": 0, "sku": 1, "uom": 1}, None, 1),
+        ("get_transaction_history", "transactions", {"sku": sku}, None,
+         fields_projection(TRANSACTION_FIELDS), [("at", -1)], 5),
+        ("search_inventories (tên)", "inventories", {"sku": {"$in": [sku]}}, None,
+         fields_projection(INVENTORY_FIELDS), None, 0),
+        ("get_open_tasks", "tasks", {"status": "open"}, None, fields_projection(TASK_FIELDS), None, 0),
+        ("search_tasks (sku)", "tasks", {"payload.sku": sku}, None, fields_projection(TASK_FIELDS), None, 0),
+    ]
+
+
+def measure(collection, filter: dict, projection, sort, limit: int, repeat: int) -> dict:
+    latencies, size, count = [], 0, 0
+    for _ in range(repeat):
+        started = time.perf_counter()
+        cursor = collection.find(filter, projection)
+        if sort:
+            cursor = cursor.sort(sort)
+        if limit:
+            cursor = cursor.limit(limit)
+        size, count = 0, 0
+        for doc in cursor:
+            size += len(doc.raw)
+            count += 1
+        latencies.append(time.perf_counter() - started)
+    latencies.sort()
+    return {
+        "docs": count,
+        "bytes": size,
+        "p50_ms": round(statistics.median(latencies) * 1000, 3),
+        "p95_ms": round(latencies[int(len(latencies) * 0.95) - 1] * 1000, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sku", default="LT001")
+    parser.add_argument("--name", default="laptop", help="Tên sản phẩm (dạng name_lc)")
+    parser.add_argument("--repeat", type=int, default=50)
+    opts = parser.parse_args()
+
+    db = get_db()
+    report = []
+    for name, coll, filter, before, after, sort, limit in cases(opts.sku, opts.name):
+        collection = db.get_collection(coll, codec_options=RAW)
+        old = measure(collection, filter, before, sort, limit, opts.repeat)
+        new = measure(collection, filter, after, sort, limit, opts.repeat)
+        report.append({
+            "query": name,
+            "before": old,
+            "after": new,
+            "bytes_saved_pct": round(100 * (1 - new["bytes"] / old["bytes"]), 1) if old["bytes"] else 0.0,
+        })
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Đo tốc độ rebuild tồn kho khi tăng số tiến trình (app/rebuild_sharded.py) trên MongoDB thật.
+
+    python benchmarks/rebuild_scaling.py --mongo-uri mongodb://localhost:27017 --transactions 5000000
+    python benchmarks/rebuild_scaling.py --workers 1,2,4,8 --repeat 3
+
+Seed một database tạm giống benchmarks/suite.py (không cần mongomock: tiến trình con phải
+kết nối được tới cùng database), đo run_rebuild một tiến trình làm mốc rồi run_sharded_rebuild
+với từng số worker; in thời gian tốt nhất, speedup và hiệu suất (speedup / worker).
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import uuid
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from suite import seed, use_database  # noqa: E402  (đặt biến môi trường trước khi import app)
+from app.rebuild import run_rebuild  # noqa: E402
+from app.rebuild_sharded import run_sharded_rebuild  # noqa: E402
+
+
+def best_of(func, repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        stats = func()
+        if stats.get("failed"):
+            raise RuntimeError(f"shard lỗi: {stats['failed']}")
+        times.append(time.perf_counter() - started)
+    return min(times)
+
+
+def main():
+    cores = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--mongo-uri", default=os.getenv("BENCH_MONGO_URI", "mongodb://localhost:27017"))
+    parser.add_argument("--warehouses", type=int, default=5)
+    parser.add_argument("--skus", type=int, default=100000)
+    parser.add_argument("--transactions", type=int, default=5000000)
+    parser.add_argument("--days", type=int, default=90)
+    parser.add_argument("--workers", default=",".join(str(w) for w in (1, 2, 4, 8, 16) if w <= cores),
+                        help="Danh sách số tiến trình cần đo")
+    parser.add_argument("--batch-size", type=int, default=None)
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--keep", action="store_true", help="Giữ lại database benchmark")
+    parser.add_argument("--out", default=None, help="Ghi kết quả ra file JSON")
+    opts = parser.parse_args()
+
+    from pymongo import MongoClient
+    from app.indexes import ensure_indexes
+
+    client = MongoClient(opts.mongo_uri)
+    name = f"swm_bench_{uuid.uuid4().hex[:8]}"
+    db = use_database(client, name)
+    try:
+        ensure_indexes()
+        data = seed(db, SimpleNamespace(warehouses=opts.warehouses, skus=opts.skus,
+                                        transactions=opts.transactions, tasks=0, days=opts.days),
+                    random.Random(opts.seed))
+        print(f"seed: {opts.skus} SKU, {opts.transactions} transactions trong {data['seconds']}s "
+              f"({cores} CPU)", file=sys.stderr)
+
+        baseline = best_of(lambda: run_rebuild(opts.batch_size, balances=True), opts.repeat)
+        rows = [{"mode": "run_rebuild", "workers": 1, "seconds": round(baseline, 3), "speedup": 1.0}]
+        for workers in (int(w) for w in opts.workers.split(",") if w):
+            seconds = best_of(lambda: run_sharded_rebuild(workers, opts.batch_size, mongo_uri=opts.mongo_uri,
+                                                          db_name=name), opts.repeat)
+            rows.append({"mode": "sharded", "workers": workers, "seconds": round(seconds, 3),
+                         "speedup": round(baseline / seconds, 2)})
+    finally:
+        if not opts.keep:
+            client.drop_database(name)
+
+    for r in rows:
+        efficiency = r["speedup"] / r["workers"]
+        print(f"{r['mode']:<12} {r['workers']:>3} tiến trình  {r['seconds']:>9}s  "
+              f"speedup x{r['speedup']:<6} hiệu suất {efficiency:.0%}", file=sys.stderr)
+    if opts.out:
+        with open(opts.out, "w", encoding="utf-8") as f:
+            json.dump({"cpu": cores, "skus": opts.skus, "transactions": opts.transactions, "results": rows},
+                      f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
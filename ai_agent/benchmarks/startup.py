@@ -0,0 +1,65 @@
+"""
+Đo thời gian khởi động worker (cold start).
+
+    python benchmarks/startup.py --workers 8
+
+Mỗi worker là một process Python mới làm đúng việc uvicorn làm khi khởi động:
+import main (tạo FastAPI app). In ra thời gian import trung bình/tối đa khi N worker
+khởi động đồng thời, và thời gian khởi tạo agent riêng (--with-agent) để so sánh với
+cách cũ (import app.agent là tạo MongoClient + ChatGroq + initialize_agent ngay).
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = """
+import json, time
+t0 = time.perf_counter()
+import main
+t1 = time.perf_counter()
+result = {"import_s": t1 - t0}
+if WITH_AGENT:
+    from app.agent import get_agent
+    get_agent()
+    result["agent_s"] = time.perf_counter() - t1
+print(json.dumps(result))
+"""
+
+
+def start_worker(with_agent: bool) -> dict:
+    started = time.perf_counter()
+    out = subprocess.run(
+        [sys.executable, "-c", f"WITH_AGENT = {with_agent}\n" + PROBE],
+        cwd=ROOT, capture_output=True, text=True, check=True,
+    )
+    result = json.loads(out.stdout.strip().splitlines()[-1])
+    result["process_s"] = time.perf_counter() - started
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--with-agent", action="store_true", help="Đo thêm thời gian khởi tạo agent")
+    opts = parser.parse_args()
+
+    with ThreadPoolExecutor(opts.workers) as pool:
+        results = list(pool.map(lambda _: start_worker(opts.with_agent), range(opts.workers)))
+
+    report = {"workers": opts.workers}
+    for field in ("import_s", "agent_s", "process_s"):
+        values = [r[field] for r in results if field in r]
+        if values:
+            report[field] = {"mean": round(statistics.mean(values), 3), "max": round(max(values), 3)}
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
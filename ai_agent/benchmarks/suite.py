@@ -0,0 +1,443 @@
+"""
+Bộ benchmark offline: dữ liệu tổng hợp + LLM giả lập, không cần Atlas hay GROQ_API_KEY.
+
+    python benchmarks/suite.py --mongo-uri mongodb://localhost:27017 --transactions 2000000
+    python benchmarks/suite.py --mongomock --quick
+    python benchmarks/suite.py --compare benchmarks/results/<commit cũ>.json
+
+Seed một database tạm (kho, SKU, transactions, tasks) rồi đo: rebuild tồn kho/rollup,
+các hàm đọc của tools, write path nhập/xuất/batch, và pipeline /ask (intent router và
+ReAct agent chạy với FakeChatGroq trả lời theo kịch bản cố định). Mỗi case in ra
+throughput và p50/p95/p99; toàn bộ kết quả ghi ra JSON (mặc định benchmarks/results/<commit>.json)
+để so sánh giữa các commit bằng --compare.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import random
+import re
+import subprocess
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Trước khi import app: tắt cache LLM trên đĩa, warm-up và log request từng dòng
+os.environ.setdefault("LLM_CACHE_ENABLED", "0")
+os.environ.setdefault("WARMUP_AGENT", "0")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+os.environ.setdefault("GROQ_API_KEY", "offline-benchmark")
+
+from pymongo.errors import OperationFailure  # noqa: E402
+from langchain_core.language_models.chat_models import BaseChatModel  # noqa: E402
+from langchain_core.messages import AIMessage  # noqa: E402
+from langchain_core.outputs import ChatGeneration, ChatResult  # noqa: E402
+
+from app import database  # noqa: E402
+from app.task_query import sort_keys  # noqa: E402
+from app.text import search_key  # noqa: E402
+
+WORKERS = ["an", "binh", "chi", "dung", "giang", "hoa", "khanh", "linh"]
+PRODUCTS = ["Laptop", "Chuột", "Bàn phím", "Màn hình", "Tai nghe", "Điện thoại", "Máy in", "Ổ cứng"]
+TASK_TYPES = ["putaway", "cycle_count", "pick"]
+PRIORITIES = ["high", "normal", "normal", "low"]
+
+
+# ============================================================
+# LLM giả lập
+# ============================================================
+class FakeChatGroq(BaseChatModel):
+    """
+    Thay ChatGroq trong ReAct agent: lượt đầu chọn tool theo regex trên câu hỏi,
+    lượt sau (đã có Observation) trả Final Answer là observation cuối. Cùng câu hỏi → cùng
+    câu trả lời, nên số bước agent và số round trip Mongo ổn định giữa các lần chạy.
+    """
+    script: list = []          # [(regex câu hỏi, tên tool, action input)]
+    latency: float = 0.0       # giả lập thời gian gọi API (giây)
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-groq"
+
+    def _reply(self, prompt: str) -> str:
+        question = prompt.rsplit("Question:", 1)[-1]
+        if "Observation:" in question:
+            observation = question.rsplit("Observation:", 1)[-1].split("\nThought:")[0].strip()
+            return f"Tôi đã có câu trả lời.\nFinal Answer: {observation}"
+        for pattern, tool, tool_input in self.script:
+            match = re.search(pattern, question, re.IGNORECASE)
+            if match:
+                return f"Cần tra cứu dữ liệu kho.\nAction: {tool}\nAction Input: {match.expand(tool_input)}"
+        return "Câu hỏi ngoài phạm vi.\nAction: OutOfScopeTool\nAction Input: " + question.strip()[:80]
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        if self.latency:
+            time.sleep(self.latency)
+        prompt = "\n".join(str(m.content) for m in messages)
+        text = self._reply(prompt)
+        usage = {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(text) // 4}
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))],
+                          llm_output={"token_usage": usage, "model_name": "fake-groq"})
+
+
+AGENT_SCRIPT = [
+    (r"tình hình.*sku\s+(\w+)", "MongoDBStockChecker", r"\1"),
+    (r"lịch sử.*?(\w+\d+)", "MongoDBTransactionHistory", r"\1"),
+    (r"việc.*kho\s+(\w+)", "SearchTasksTool", r"task ưu tiên cao ở kho \1"),
+]
+
+
+# ============================================================
+# Backend: MongoDB thật hoặc mongomock
+# ============================================================
+def mongomock_client():
+    import mongomock
+
+    class _NoTransactionSession:
+        # mongomock không có session → hành xử như mongod standalone (run_in_transaction chạy callback(None))
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            return False
+
+        def with_transaction(self, callback):
+            raise OperationFailure("Transaction numbers are only allowed on a replica set", code=20)
+
+    class MockClient(mongomock.MongoClient):
+        def start_session(self, *args, **kwargs):
+            return _NoTransactionSession()
+
+    return MockClient()
+
+
+def use_database(client, name: str):
+    database._client, database.MONGO_DB = client, name
+    return client[name]
+
+
+# ============================================================
+# Dữ liệu tổng hợp
+# ============================================================
+def _batches(docs, size: int = 10000):
+    batch = []
+    for doc in docs:
+        batch.append(doc)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def seed(db, opts, rng: random.Random, mock: bool = False) -> dict:
+    started = time.perf_counter()
+    warehouses = [f"WH{i + 1:02d}" for i in range(opts.warehouses)]
+    skus = [f"SK{i:06d}" for i in range(opts.skus)]
+    now = datetime.utcnow().replace(microsecond=0)
+
+    def inventories():
+        for i, sku in enumerate(skus):
+            name = f"{PRODUCTS[i % len(PRODUCTS)]} {sku}"
+            yield {"sku": sku, "name": name, "name_lc": search_key(name), "qty": 0, "uom": "EA",
+                   "wh": warehouses[i % len(warehouses)], "location": f"{chr(65 + i % 8)}-{i % 40:02d}-{i % 7:02d}",
+                   "updatedAt": now}
+
+    for batch in _batches(inventories()):
+        db["inventories"].insert_many(batch, ordered=False)
+
+    span = opts.days * 86400
+
+    def transactions():
+        for _ in range(opts.transactions):
+            by = rng.choice(WORKERS)
+            yield {"sku": rng.choice(skus), "type": "inbound" if rng.random() < 0.6 else "outbound",
+                   "qty": rng.randint(1, 20), "wh": rng.choice(warehouses), "by": by, "by_lc": by,
+                   "note": "", "at": now - timedelta(seconds=rng.randrange(span))}
+
+    for batch in _batches(transactions()):
+        db["transactions"].insert_many(batch, ordered=False)
+
+    def tasks():
+        for i in range(opts.tasks):
+            doc = {"title": f"Task {i}", "type": rng.choice(TASK_TYPES),
+                   "status": "open" if rng.random() < 0.7 else "done", "priority": rng.choice(PRIORITIES),
+                   "payload": {"sku": rng.choice(skus), "wh": rng.choice(warehouses)},
+                   "assignee": rng.choice(WORKERS + [None] * 8),
+                   "due_at": now + timedelta(hours=rng.randint(-48, 240)) if rng.random() < 0.8 else None,
+                   "created_at": now - timedelta(seconds=rng.randrange(span))}
+            doc.update(sort_keys(doc))
+            yield doc
+
+    for batch in _batches(tasks()):
+        db["tasks"].insert_many(batch, ordered=False)
+
+    # Tồn kho + rollup khớp với transaction log trước khi đo (write path và movement_series cần)
+    from app.rebuild import run_rebuild
+    from app.rollups import rebuild_rollups
+
+    run_rebuild(balances=True)
+    if mock:
+        try:
+            rebuild_rollups()
+        except Exception as e:
+            # mongomock chưa hỗ trợ $dateTrunc → các case rollup sẽ báo lỗi riêng
+            print(f"seed: bỏ qua rebuild_rollups trên mongomock: {e}", file=sys.stderr)
+    else:
+        rebuild_rollups()
+
+    return {"warehouses": warehouses, "skus": skus, "seconds": round(time.perf_counter() - started, 2)}
+
+
+# ============================================================
+# Đo
+# ============================================================
+def percentile(sorted_values: list, p: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[max(0, math.ceil(p / 100 * len(sorted_values)) - 1)]
+
+
+def summarize(latencies: list, elapsed: float, errors: int) -> dict:
+    latencies = sorted(latencies)
+    ms = lambda v: round(v * 1000, 3)
+    return {
+        "ops": len(latencies),
+        "errors": errors,
+        "throughput_ops_s": round(len(latencies) / elapsed, 1) if elapsed > 0 else 0.0,
+        "mean_ms": ms(sum(latencies) / len(latencies)) if latencies else 0.0,
+        "p50_ms": ms(percentile(latencies, 50)),
+        "p95_ms": ms(percentile(latencies, 95)),
+        "p99_ms": ms(percentile(latencies, 99)),
+        "max_ms": ms(latencies[-1]) if latencies else 0.0,
+    }
+
+
+def bench(func, repeat: int, warmup: int = 0) -> dict:
+    """Gọi func(i) tuần tự `repeat` lần; lỗi đầu tiên được ghi lại thay vì dừng cả suite."""
+    for i in range(warmup):
+        try:
+            func(-1 - i)
+        except Exception:
+            pass
+    latencies, errors, first_error = [], 0, None
+    started = time.perf_counter()
+    for i in range(repeat):
+        t0 = time.perf_counter()
+        try:
+            func(i)
+            latencies.append(time.perf_counter() - t0)
+        except Exception as e:
+            errors += 1
+            first_error = first_error or f"{type(e).__name__}: {e}"[:300]
+    result = summarize(latencies, time.perf_counter() - started, errors)
+    if first_error:
+        result["first_error"] = first_error
+    return result
+
+
+def build_cases(data: dict, opts) -> list:
+    from app import agent
+    from app.cache import tool_cache
+    from app.ingest import add_transactions_batch
+    from app.rebuild import run_rebuild
+    from app.rollups import rebuild_rollups, movement_series
+    from app.search_index import product_index
+    from app.dispatcher import claim_task
+
+    skus, warehouses = data["skus"], data["warehouses"]
+    pick = lambda seq, i: seq[(i * 7919) % len(seq)]   # chọn lặp lại được, trải đều
+    now = datetime.utcnow()
+
+    def cold(func):
+        # Đo đường Mongo thật: bỏ qua cache kết quả tool
+        def run(i):
+            tool_cache.clear()
+            return func(i)
+        return run
+
+    def batch_lines(i):
+        return [{"sku": pick(skus, i * 100 + j), "qty": 5, "wh": pick(warehouses, j), "by": "bench"}
+                for j in range(opts.batch_lines)]
+
+    return [
+        # (nhóm, tên, hàm, số lần)
+        ("rebuild", "run_rebuild(balances=True)", lambda i: run_rebuild(balances=True), opts.rebuild_repeat),
+        ("rebuild", "rebuild_rollups", lambda i: rebuild_rollups(), opts.rebuild_repeat),
+        ("rebuild", "product_index.build", lambda i: product_index.build(), opts.rebuild_repeat),
+        ("read", "get_stock_by_sku", cold(lambda i: agent.get_stock_by_sku(pick(skus, i))), opts.repeat),
+        ("read", "get_stock_by_sku (kho)",
+         cold(lambda i: agent.get_stock_by_sku(pick(skus, i), pick(warehouses, i))), opts.repeat),
+        ("read", "get_stock_by_sku (cache)", lambda i: agent.get_stock_by_sku(skus[0]), opts.repeat),
+        ("read", "get_transaction_history", cold(lambda i: agent.get_transaction_history(pick(skus, i))), opts.repeat),
+        ("read", "search_transactions (user)",
+         cold(lambda i: agent.search_transactions(user=pick(WORKERS, i))), opts.repeat),
+        ("read", "search_transactions (kho+SKU)",
+         cold(lambda i: agent.search_transactions(wh=pick(warehouses, i), sku=pick(skus, i))), opts.repeat),
+        ("read", "search_inventories (tên)",
+         cold(lambda i: agent.search_inventories(query=pick(PRODUCTS, i))), opts.repeat),
+        ("read", "search_inventories (kho)", cold(lambda i: agent.search_inventories(wh=pick(warehouses, i))), opts.repeat),
+        ("read", "get_open_tasks", cold(lambda i: agent.get_open_tasks()), opts.repeat),
+        ("read", "search_tasks (kho+ưu tiên)",
+         cold(lambda i: agent.search_tasks(wh=pick(warehouses, i), priority="high")), opts.repeat),
+        ("read", "movement_series (30 ngày, kho)",
+         lambda i: movement_series(now - timedelta(days=30), now, wh=pick(warehouses, i)), opts.repeat),
+        ("write", "add_inbound_transaction",
+         lambda i: agent.add_inbound_transaction(pick(skus, i), 5, pick(warehouses, i), "bench"), opts.write_repeat),
+        ("write", "add_outbound_transaction",
+         lambda i: agent.add_outbound_transaction(pick(skus, i), 1, pick(warehouses, i), "bench"), opts.write_repeat),
+        ("write", f"add_transactions_batch ({opts.batch_lines} dòng)",
+         lambda i: add_transactions_batch(batch_lines(i)), max(1, opts.write_repeat // 10)),
+        ("write", "claim_task", lambda i: claim_task(pick(WORKERS, i), pick(warehouses, i)), opts.write_repeat),
+    ]
+
+
+def ask_cases(data: dict, opts) -> list:
+    import main
+    from app import agent
+
+    agent._llm = FakeChatGroq(script=AGENT_SCRIPT, latency=opts.llm_latency_ms / 1000)
+    agent._agent = None
+    skus, warehouses = data["skus"], data["warehouses"]
+    loop = asyncio.new_event_loop()
+
+    def ask(question):
+        def run(i):
+            text = question.format(sku=skus[(i * 7919) % len(skus)], wh=warehouses[i % len(warehouses)])
+            result = loop.run_until_complete(main.ask_agent(main.QueryRequest(query=text)))
+            if "error" in result:
+                raise RuntimeError(result["error"])
+            return result
+        return run
+
+    return [
+        ("ask", "/ask intent (tồn kho)", ask("Tồn kho SKU {sku}"), opts.repeat),
+        ("ask", "/ask intent (task kho)", ask("Task ưu tiên cao ở kho {wh}"), opts.repeat),
+        ("ask", "/ask agent (tồn kho)", ask("Cho tôi biết tình hình SKU {sku}"), opts.ask_repeat),
+        ("ask", "/ask agent (lịch sử)", ask("Xem giúp lịch sử nhập xuất của {sku}"), opts.ask_repeat),
+        ("ask", "/ask agent (task)", ask("Có việc gì gấp ở kho {wh} không"), opts.ask_repeat),
+    ]
+
+
+# ============================================================
+# Kết quả
+# ============================================================
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except Exception:
+        return "unknown"
+
+
+def compare(current: dict, baseline: dict, threshold: float) -> list:
+    """So p95 và throughput với file kết quả cũ; chậm hơn quá `threshold`% → đánh dấu REGRESSION."""
+    rows = []
+    for name, now in current["cases"].items():
+        old = baseline.get("cases", {}).get(name)
+        if not old or not old.get("p95_ms") or not now.get("ops"):
+            continue
+        change = 100 * (now["p95_ms"] - old["p95_ms"]) / old["p95_ms"]
+        rows.append({"case": name, "p95_before_ms": old["p95_ms"], "p95_after_ms": now["p95_ms"],
+                     "p95_change_pct": round(change, 1), "regression": change > threshold})
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    backend = parser.add_mutually_exclusive_group()
+    backend.add_argument("--mongo-uri", default=os.getenv("BENCH_MONGO_URI", "mongodb://localhost:27017"))
+    backend.add_argument("--mongomock", action="store_true", help="Dùng mongomock thay cho MongoDB")
+    parser.add_argument("--quick", action="store_true", help="Dữ liệu nhỏ để chạy thử nhanh")
+    parser.add_argument("--warehouses", type=int, default=5)
+    parser.add_argument("--skus", type=int, default=20000)
+    parser.add_argument("--transactions", type=int, default=1000000)
+    parser.add_argument("--tasks", type=int, default=100000)
+    parser.add_argument("--days", type=int, default=90, help="Khoảng thời gian rải transactions")
+    parser.add_argument("--repeat", type=int, default=200, help="Số lần mỗi case đọc / /ask qua intent")
+    parser.add_argument("--write-repeat", type=int, default=200)
+    parser.add_argument("--ask-repeat", type=int, default=50)
+    parser.add_argument("--rebuild-repeat", type=int, default=3)
+    parser.add_argument("--batch-lines", type=int, default=100)
+    parser.add_argument("--llm-latency-ms", type=float, default=0.0)
+    parser.add_argument("--only", default="", help="Chỉ chạy các nhóm: rebuild,read,write,ask")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--keep", action="store_true", help="Giữ lại database benchmark")
+    parser.add_argument("--out", default=None)
+    parser.add_argument("--compare", default=None, help="File JSON kết quả cũ để so sánh")
+    parser.add_argument("--threshold", type=float, default=10.0, help="%% p95 tăng coi là regression")
+    opts = parser.parse_args()
+    if opts.quick:
+        opts.skus, opts.transactions, opts.tasks = 1000, 50000, 5000
+        opts.repeat, opts.write_repeat, opts.ask_repeat, opts.rebuild_repeat = 50, 50, 10, 1
+
+    rng = random.Random(opts.seed)
+    if opts.mongomock:
+        client, backend_name = mongomock_client(), "mongomock"
+    else:
+        from pymongo import MongoClient
+        from app.metrics import MongoCommandMetrics
+
+        client, backend_name = MongoClient(opts.mongo_uri, event_listeners=[MongoCommandMetrics()]), "mongodb"
+    name = f"swm_bench_{uuid.uuid4().hex[:8]}"
+    db = use_database(client, name)
+
+    try:
+        if not opts.mongomock:
+            from app.indexes import ensure_indexes
+            ensure_indexes()
+        data = seed(db, opts, rng, mock=opts.mongomock)
+        print(f"seed: {len(data['skus'])} SKU, {opts.transactions} transactions, {opts.tasks} tasks "
+              f"trong {data['seconds']}s", file=sys.stderr)
+
+        groups = set(filter(None, opts.only.split(","))) or {"rebuild", "read", "write", "ask"}
+        cases = build_cases(data, opts)
+        if "ask" in groups:
+            cases += ask_cases(data, opts)
+        results = {}
+        for group, case, func, repeat in cases:
+            if group not in groups:
+                continue
+            results[case] = dict(bench(func, repeat, warmup=0 if group == "rebuild" else 3), group=group)
+            r = results[case]
+            print(f"{case:<40} {r['throughput_ops_s']:>9} ops/s  p50 {r['p50_ms']:>9} ms  "
+                  f"p95 {r['p95_ms']:>9} ms  p99 {r['p99_ms']:>9} ms  lỗi {r['errors']}", file=sys.stderr)
+    finally:
+        if not opts.keep:
+            client.drop_database(name)
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "date": datetime.utcnow().isoformat(timespec="seconds"),
+            "backend": backend_name,
+            "python": platform.python_version(),
+            "params": {k: v for k, v in vars(opts).items() if k not in ("out", "compare", "mongo_uri")},
+            "seed_seconds": data["seconds"],
+        },
+        "cases": results,
+    }
+    if opts.compare:
+        with open(opts.compare, encoding="utf-8") as f:
+            report["comparison"] = compare(report, json.load(f), opts.threshold)
+        for row in report["comparison"]:
+            flag = "  ⚠ REGRESSION" if row["regression"] else ""
+            print(f"{row['case']:<40} p95 {row['p95_before_ms']} → {row['p95_after_ms']} ms "
+                  f"({row['p95_change_pct']:+}%){flag}", file=sys.stderr)
+
+    out = opts.out or os.path.join(ROOT, "benchmarks", "results", f"{report['meta']['commit']}-{backend_name}.json")
+    os.makedirs(os.path.dirname(out), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(out)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,88 @@
-from fastapi import FastAPI
+import logging
+import time
+from datetime import datetime
+from contextlib import asynccontextmanager
+from typing import List, Optional
+from fastapi import FastAPI, HTTPException, Request, Header, Query
+from fastapi.responses import StreamingResponse, PlainTextResponse
 from pydantic import BaseModel
+from bson.errors import InvalidId
 from app.agent import (
-    agent,
-    stock_tool,
-    transaction_history_tool,
-    inbound_tool_wrapper,
-    outbound_tool_wrapper,
-    search_transactions_tool,
-    rebuild_inventory_wrapper,
-    rebuild_and_sync_inventory_wrapper
+    get_agent, llm_cache_stats, get_stock_by_sku, get_transaction_history, search_transactions,
+    search_inventories, get_open_tasks, search_tasks,
 )
+from app.config import WARMUP_AGENT
+from app.database import get_db
+from app import async_db
+from app.agent_runner import agent_runner, AgentBusyError
+from app.intents import intent_router
+from app.cache import tool_cache
+from app.indexes import ensure_indexes
+from app.search_index import product_index
+from app.ingest import parse_csv_lines
+from app.pagination import (
+    iter_transactions, iter_inventories, stream_rows, TRANSACTION_FIELDS, INVENTORY_FIELDS,
+)
+from app.formatters import parse_fields, project, format_forecast
+from app.models.transation import Transaction
+from app.models.inventory import Inventory
+from app.models.task import Task
+from app.rollups import movement_series, movement_totals, rebuild_rollups, parse_period
+from app.forecast import run_forecast
+from app.idempotency import IdempotencyError
+from app.dispatcher import (
+    claim_task, claim_pick_batch, requeue_expired, heartbeat, complete_task, release_task, LeaseError,
+)
+from app.reconcile import format_reconcile_stats, format_verify_result
+from app.metrics import (
+    configure_logging, start_trace, observe_request, set_ask_path, render_metrics, llm_callback,
+)
+
+configure_logging()
+logger = logging.getLogger(__name__)
+
+# ============================================================
+# Startup: kết nối Mongo, tạo index và warm-up agent
+# ============================================================
+def warm_up():
+    get_db().command("ping")
+    ensure_indexes()
+    product_index.build()
+    if WARMUP_AGENT:
+        try:
+            get_agent()
+        except Exception as e:
+            # Thiếu GROQ_API_KEY chỉ ảnh hưởng /ask, các endpoint kho vẫn hoạt động
+            logger.warning("Không khởi tạo được agent: %s", e)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await async_db.run_db(warm_up)
+    yield
+
+app = FastAPI(lifespan=lifespan)
 
-app = FastAPI()
+# ============================================================
+# Trace + metrics cho mọi endpoint
+# ============================================================
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    trace = start_trace(request.headers.get("X-Request-ID"))
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        response.headers["X-Request-ID"] = trace.request_id
+        return response
+    finally:
+        # Nhãn theo route khai báo (/stock/{sku}) chứ không theo URL thật để số series không bùng nổ
+        route = getattr(request.scope.get("route"), "path", "unmatched")
+        observe_request(trace, request.method, route, status, time.perf_counter() - started)
+
+@app.get("/metrics")
+async def metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
 
 # ============================================================
 # Model cho request query chatbot
@@ -19,25 +90,43 @@ app = FastAPI()
 class QueryRequest(BaseModel):
     query: str
 
+def run_agent(query: str) -> dict:
+    return get_agent().invoke({"input": query}, config={"callbacks": [llm_callback()]})
+
 @app.post("/ask")
 async def ask_agent(req: QueryRequest):
     try:
-        response = agent.invoke({"input": req.query})
+        # Câu hỏi khớp mẫu quen thuộc → gọi thẳng tool, không qua LLM
+        routed = await async_db.run_db(intent_router.route, req.query)
+        if routed is not None:
+            set_ask_path("intent")
+            return {"response": routed}
+
+        response = await agent_runner.run(run_agent, req.query)
+        set_ask_path("agent")
         # agent.invoke trả về dict: {"output": "..."} hoặc lỗi
         return {"response": response.get("output", "🤖 Bot không trả lời được.")}
+    except AgentBusyError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e), headers={"Retry-After": "5"})
     except Exception as e:
         return {"error": str(e)}
 
+@app.get("/ask/stats")
+async def ask_stats():
+    return {"router": intent_router.stats(), "agent": agent_runner.stats(), "cache": tool_cache.stats(),
+            "llm_cache": llm_cache_stats()}
+
 # ============================================================
 # Stock checker endpoint (wrapper)
 # ============================================================
 class SKURequest(BaseModel):
     sku: str = ""
+    wh: str = ""  # nếu có → tồn kho của SKU tại kho này
 
 @app.post("/stock")
 async def stock_endpoint(req: SKURequest):
     # stock_tool sẽ hỏi lại nếu sku trống
-    result = stock_tool(req.sku)
+    result = await async_db.get_stock(f"{req.sku},{req.wh}" if req.sku and req.wh else req.sku)
     return {"message": result}
 
 # ============================================================
@@ -45,7 +134,7 @@ async def stock_endpoint(req: SKURequest):
 # ============================================================
 @app.post("/history")
 async def history_endpoint(req: SKURequest):
-    result = transaction_history_tool(req.sku)
+    result = await async_db.get_transaction_history(req.sku)
     return {"message": result}
 
 # ============================================================
@@ -53,40 +142,294 @@ async def history_endpoint(req: SKURequest):
 # ============================================================
 class TransactionRequest(BaseModel):
     args: str = ""  # format: sku,qty,wh,by,note
+    idempotency_key: Optional[str] = None  # hoặc header Idempotency-Key (máy quét gửi lại khi timeout)
 
 @app.post("/inbound")
-async def inbound_endpoint(req: TransactionRequest):
-    result = inbound_tool_wrapper(req.args)
+async def inbound_endpoint(req: TransactionRequest, idempotency_key: Optional[str] = Header(None)):
+    try:
+        result = await async_db.add_inbound(req.args, idempotency_key or req.idempotency_key)
+    except IdempotencyError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
     return {"message": result}
 
 @app.post("/outbound")
-async def outbound_endpoint(req: TransactionRequest):
-    result = outbound_tool_wrapper(req.args)
+async def outbound_endpoint(req: TransactionRequest, idempotency_key: Optional[str] = Header(None)):
+    try:
+        result = await async_db.add_outbound(req.args, idempotency_key or req.idempotency_key)
+    except IdempotencyError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
     return {"message": result}
 
+# ============================================================
+# Batch inbound / outbound endpoint
+# ============================================================
+# Body: JSON array [{"sku","qty","wh","by","note","type"?}, ...]
+#       hoặc text/csv với các dòng sku,qty,wh,by,note
+@app.post("/transactions/batch")
+async def transactions_batch_endpoint(request: Request, type: str = "inbound",
+                                      idempotency_key: Optional[str] = Header(None)):
+    if "csv" in request.headers.get("content-type", ""):
+        lines = parse_csv_lines((await request.body()).decode("utf-8"))
+    else:
+        try:
+            payload = await request.json()
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Body không phải JSON hợp lệ")
+        lines = payload if isinstance(payload, list) else payload.get("items", []) if isinstance(payload, dict) else None
+        if not isinstance(lines, list):
+            raise HTTPException(status_code=400, detail="Body phải là mảng JSON hoặc object có 'items' là mảng")
+        if isinstance(payload, dict):
+            idempotency_key = idempotency_key or payload.get("idempotency_key")
+    try:
+        return await async_db.add_transactions_batch(lines, type, idempotency_key)
+    except IdempotencyError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+
 # ============================================================
 # Search transactions endpoint (wrapper)
 # ============================================================
 class SearchRequest(BaseModel):
-    query: str = ""  # JSON string: {"by":"...","wh":"...","sku":"...","limit":5}
+    query: str = ""  # JSON string: {"by":"...","wh":"...","sku":"...","limit":5,"cursor":"..."}
 
 @app.post("/search_transactions")
 async def search_transactions_endpoint(req: SearchRequest):
-    result = search_transactions_tool(req.query)
+    result = await async_db.search_transactions(req.query)
     return {"message": result}
 
+# ============================================================
+# JSON có cấu trúc: ?fields=sku,qty chỉ trả về các cột cần dùng
+# ============================================================
+def _fields(fields: Optional[str], model) -> Optional[set]:
+    try:
+        return parse_fields(fields, model)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def _transaction_projection(wanted: Optional[set]) -> dict:
+    if not wanted:
+        return {f: 1 for f in TRANSACTION_FIELDS}
+    # at + _id luôn cần để tạo cursor keyset
+    return dict.fromkeys({"_id", "at"} | (wanted - {"id"}), 1)
+
+@app.get("/stock/{sku}")
+async def get_stock_json(sku: str, wh: str = None, fields: str = None):
+    wanted = _fields(fields, Inventory)
+    record = await async_db.run_db(get_stock_by_sku, sku, wh)
+    if record is None:
+        raise HTTPException(status_code=404, detail=f"Không tìm thấy tồn kho cho SKU {sku}")
+    return project(record, wanted)
+
+@app.get("/history/{sku}")
+async def get_history_json(sku: str, limit: int = Query(5, ge=1, le=1000), fields: str = None):
+    wanted = _fields(fields, Transaction)
+    records = await async_db.run_db(get_transaction_history, sku, limit)
+    return {"items": [project(r, wanted) for r in records]}
+
+def _many(value: str = None):
+    """'high,normal' → ('high', 'normal'); 1 giá trị giữ nguyên."""
+    if not value:
+        return None
+    values = tuple(v.strip() for v in value.split(",") if v.strip())
+    return values[0] if len(values) == 1 else values
+
+@app.get("/tasks")
+async def list_tasks(status: str = None, type: str = None, priority: str = None, assignee: str = None,
+                     sku: str = None, wh: str = None, due_after: datetime = None, due_before: datetime = None,
+                     limit: int = Query(20, ge=1, le=1000), cursor: str = None, fields: str = None):
+    # Mỗi filter nhận nhiều giá trị cách nhau dấu phẩy; thứ tự: ưu tiên cao → hạn sớm
+    wanted = _fields(fields, Task)
+    try:
+        records, next_cursor = await async_db.run_db(
+            search_tasks, sku=_many(sku), wh=_many(wh), assignee=_many(assignee), status=_many(status),
+            type=_many(type), priority=_many(priority), due_after=due_after, due_before=due_before,
+            limit=limit, cursor=cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"items": [project(r, wanted) for r in records], "next_cursor": next_cursor}
+
+@app.get("/tasks/open")
+async def list_open_tasks(recent: bool = False, limit: int = Query(20, ge=1, le=1000), cursor: str = None,
+                          fields: str = None):
+    wanted = _fields(fields, Task)
+    try:
+        records, next_cursor = await async_db.run_db(get_open_tasks, recent, limit, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"items": [project(r, wanted) for r in records], "next_cursor": next_cursor}
+
+@app.get("/tasks/search")
+async def search_tasks_json(sku: str = None, wh: str = None, assignee: str = None,
+                            limit: int = Query(20, ge=1, le=1000), cursor: str = None, fields: str = None):
+    return await list_tasks(sku=sku, wh=wh, assignee=assignee, limit=limit, cursor=cursor, fields=fields)
+
+# ============================================================
+# Danh sách phân trang keyset (JSON) + export stream (NDJSON/CSV)
+# ============================================================
+@app.get("/transactions")
+async def list_transactions(user: str = None, wh: str = None, sku: str = None,
+                            limit: int = Query(50, ge=1, le=1000), cursor: str = None, fields: str = None):
+    wanted = _fields(fields, Transaction)
+    try:
+        records, next_cursor = await async_db.run_db(
+            search_transactions, user, wh, sku, limit, cursor, _transaction_projection(wanted))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"items": [project(r, wanted) for r in records], "next_cursor": next_cursor}
+
+@app.get("/inventories")
+async def list_inventories(query: str = "", wh: str = None, sku: str = None,
+                           limit: int = Query(50, ge=1, le=1000), cursor: str = None, fields: str = None):
+    wanted = _fields(fields, Inventory)
+    try:
+        records, next_cursor = await async_db.run_db(
+            search_inventories, query, wh, sku, limit, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"items": [project(r, wanted) for r in records], "next_cursor": next_cursor}
+
+EXPORT_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+@app.get("/export/transactions")
+def export_transactions(user: str = None, wh: str = None, sku: str = None, format: str = "ndjson"):
+    # Hàm sync: Starlette chạy generator trên thread pool, đọc cursor Mongo theo từng batch
+    docs = iter_transactions(user, wh, sku, {f: 1 for f in TRANSACTION_FIELDS})
+    return StreamingResponse(stream_rows(docs, TRANSACTION_FIELDS, format),
+                             media_type=EXPORT_MEDIA_TYPES.get(format, "application/x-ndjson"))
+
+@app.get("/export/inventories")
+def export_inventories(wh: str = None, format: str = "ndjson"):
+    return StreamingResponse(stream_rows(iter_inventories(wh), INVENTORY_FIELDS, format),
+                             media_type=EXPORT_MEDIA_TYPES.get(format, "application/x-ndjson"))
+
 # ============================================================
 # Rebuild / Sync inventory endpoints (wrapper)
 # ============================================================
 class ConfirmRequest(BaseModel):
     confirm: str = ""  # user phải nhập "yes" để thực hiện
+    batch_size: Optional[int] = None  # số SKU mỗi lô bulk_write (mặc định REBUILD_BATCH_SIZE)
+    workers: Optional[int] = None  # số tiến trình rebuild song song (mặc định REBUILD_WORKERS)
 
 @app.post("/rebuild_inventory")
 async def rebuild_inventory_endpoint(req: ConfirmRequest):
-    result = rebuild_inventory_wrapper(req.confirm)
+    result = await async_db.rebuild_inventory(req.confirm, req.batch_size, req.workers)
     return {"message": result}
 
 @app.post("/rebuild_and_sync_inventory")
 async def rebuild_and_sync_inventory_endpoint(req: ConfirmRequest):
-    result = rebuild_and_sync_inventory_wrapper(req.confirm)
+    result = await async_db.rebuild_and_sync_inventory(req.confirm, req.batch_size, req.workers)
     return {"message": result}
+
+# ============================================================
+# Nhập/xuất theo thời gian (rollup giờ/ngày)
+# ============================================================
+@app.get("/movements")
+async def movements_endpoint(sku: str = None, wh: str = None, start: datetime = None, end: datetime = None,
+                             period: str = "", granularity: str = "day"):
+    # start/end (ISO) ưu tiên hơn period ('tuần này', '30 ngày', 'quý này'...)
+    default_start, default_end = parse_period(period)
+    try:
+        series = await async_db.run_db(movement_series, start or default_start, end or default_end,
+                                       sku, wh, granularity)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    totals = movement_totals(series)
+    return {"items": [project(m) for m in series], "totals": project(totals, {"inbound", "outbound", "net", "count"})}
+
+@app.post("/rebuild_rollups")
+async def rebuild_rollups_endpoint(req: ConfirmRequest):
+    if req.confirm.strip().lower() not in ["yes", "y", "ok", "đồng ý", "xác nhận"]:
+        return {"message": "⚠️ Bạn có chắc muốn dựng lại rollup nhập/xuất từ transaction log không? Trả lời 'yes' để tiếp tục."}
+    stats = await async_db.run_db(rebuild_rollups, None, None, req.batch_size)
+    return {"message": f"✅ Đã dựng lại {stats['hour_buckets']} bucket giờ trong {stats['seconds']}s.", "stats": stats}
+
+# ============================================================
+# Dự báo nhu cầu + điểm đặt hàng lại
+# ============================================================
+class ForecastRequest(BaseModel):
+    window_days: Optional[int] = None     # số ngày lịch sử (mặc định FORECAST_WINDOW_DAYS)
+    method: str = "ses"                   # "ses" (làm mượt hàm mũ) hoặc "ma" (trung bình trượt)
+    horizon_days: float = 7               # SKU hết hàng trong khoảng này → đề xuất
+    lead_time: Optional[float] = None
+    create_tasks: bool = False            # ghi task đề xuất vào tasks
+    source: str = "rollups"               # "rollups" hoặc "transactions"
+
+@app.post("/forecast")
+async def forecast_endpoint(req: ForecastRequest):
+    report = await async_db.run_db(run_forecast, req.window_days, req.method, req.horizon_days,
+                                   req.lead_time, req.create_tasks, req.source)
+    return {"message": format_forecast(report), "report": report}
+
+# ============================================================
+# Dispatcher: nhận task / lô pick, heartbeat, hoàn thành, trả lại
+# ============================================================
+class ClaimRequest(BaseModel):
+    worker: str
+    wh: str
+    types: Optional[List[str]] = None     # vd ["pick"]; None → mọi loại
+    lease_seconds: Optional[int] = None
+
+class PickBatchRequest(BaseModel):
+    worker: str
+    wh: str
+    max_tasks: Optional[int] = None       # mặc định PICK_BATCH_MAX
+    lease_seconds: Optional[int] = None
+
+class WorkerRequest(BaseModel):
+    worker: str
+    lease_seconds: Optional[int] = None
+
+@app.post("/dispatch/claim")
+async def claim_task_endpoint(req: ClaimRequest):
+    doc = await async_db.run_db(claim_task, req.worker, req.wh, req.types, req.lease_seconds)
+    return {"task": project(Task.from_doc(doc)) if doc else None}
+
+@app.post("/dispatch/pick_batch")
+async def claim_pick_batch_endpoint(req: PickBatchRequest):
+    docs = await async_db.run_db(claim_pick_batch, req.worker, req.wh, req.max_tasks, req.lease_seconds)
+    return {"items": [project(Task.from_doc(d)) for d in docs]}
+
+@app.post("/dispatch/requeue")
+async def requeue_endpoint(wh: str = None):
+    return {"requeued": await async_db.run_db(requeue_expired, wh)}
+
+async def _task_action(func, task_id: str, *args):
+    try:
+        doc = await async_db.run_db(func, task_id, *args)
+    except InvalidId:
+        raise HTTPException(status_code=400, detail=f"id task không hợp lệ: {task_id}")
+    except LeaseError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {"task": project(Task.from_doc(doc))}
+
+@app.post("/tasks/{task_id}/heartbeat")
+async def heartbeat_endpoint(task_id: str, req: WorkerRequest):
+    return await _task_action(heartbeat, task_id, req.worker, req.lease_seconds)
+
+@app.post("/tasks/{task_id}/complete")
+async def complete_task_endpoint(task_id: str, req: WorkerRequest):
+    return await _task_action(complete_task, task_id, req.worker)
+
+@app.post("/tasks/{task_id}/release")
+async def release_task_endpoint(task_id: str, req: WorkerRequest):
+    return await _task_action(release_task, task_id, req.worker)
+
+# ============================================================
+# Incremental reconciliation endpoints
+# ============================================================
+class ReconcileRequest(BaseModel):
+    batch_size: Optional[int] = None
+    fix: bool = False   # sửa các SKU lệch bằng $inc phần chênh
+
+@app.post("/reconcile_inventory")
+async def reconcile_inventory_endpoint(req: ReconcileRequest):
+    stats = await async_db.reconcile_inventory(req.batch_size, req.fix)
+    return {"message": format_reconcile_stats(stats), "stats": stats}
+
+class VerifyRequest(BaseModel):
+    size: int = 50      # số SKU ngẫu nhiên cần kiểm tra
+    fix: bool = False   # sửa các SKU bị lệch
+
+@app.post("/verify_inventory_sample")
+async def verify_inventory_sample_endpoint(req: VerifyRequest):
+    result = await async_db.verify_sample(req.size, req.fix)
+    return {"message": format_verify_result(result), "result": result}
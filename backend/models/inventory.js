@@ -4,6 +4,7 @@ const mongoose = require("mongoose");
 const InventorySchema = new mongoose.Schema({
   sku: { type: String, required: true, index: true },
   name: { type: String, required: true },
+  name_lc: { type: String },               // khóa tìm kiếm của `name` (lowercase) cho ai_agent
   qty: { type: Number, required: true, default: 0 },
   uom: { type: String, required: true },   // đơn vị: EA, BOX...
   wh: { type: String, required: true },    // mã warehouse
@@ -13,4 +14,17 @@ const InventorySchema = new mongoose.Schema({
   unitPrice: {type: Number , required:true}
 }, { timestamps: true });
 
+const searchKey = (value) => value.normalize("NFC").trim().replace(/\s+/g, " ").toLowerCase();
+
+InventorySchema.pre("save", function (next) {
+  if (this.name != null) this.name_lc = searchKey(this.name);
+  next();
+});
+
+InventorySchema.pre("findOneAndUpdate", function (next) {
+  const update = this.getUpdate();
+  if (update && update.name != null) update.name_lc = searchKey(update.name);
+  next();
+});
+
 module.exports = mongoose.model("inventory", InventorySchema);
@@ -21,7 +21,7 @@ const taskSchema = new mongoose.Schema({
   status: {
     type: String,
     required: true,
-    enum: ['open', 'done']
+    enum: ['open', 'in_progress', 'done']   // in_progress: đã nhận qua dispatcher của ai_agent
   },
   priority: {
     type: String,
@@ -39,7 +39,13 @@ const taskSchema = new mongoose.Schema({
   assignee: {
     type: String,
     default: null
-  }
+  },
+  // Khóa sắp xếp dẫn xuất cho ai_agent (ưu tiên cao → hạn sớm), xem ai_agent/app/task_query.py
+  priority_rank: { type: Number },
+  due_sort: { type: Date },
+  // Dispatcher (ai_agent/app/dispatcher.py): hạn giữ task và lô pick
+  lease_until: { type: Date },
+  batch_id: { type: mongoose.Schema.Types.ObjectId }
 }, {
   // Tự động thêm `createdAt` và `updatedAt`
   // Tuy nhiên, dữ liệu của bạn có `created_at`, nên chúng ta sẽ dùng timestamps: true
@@ -47,6 +53,23 @@ const taskSchema = new mongoose.Schema({
   timestamps: { createdAt: 'created_at', updatedAt: 'updated_at' }
 });
 
+const PRIORITY_RANK = { high: 0, normal: 1, low: 2 };
+const MAX_DUE = new Date(Date.UTC(9999, 11, 31));
+
+taskSchema.pre('save', function (next) {
+  this.priority_rank = PRIORITY_RANK[this.priority] ?? PRIORITY_RANK.normal;
+  this.due_sort = this.due_at || MAX_DUE;
+  next();
+});
+
+taskSchema.pre('findOneAndUpdate', function (next) {
+  const update = this.getUpdate();
+  const fields = update && (update.$set || update);
+  if (fields && fields.priority != null) fields.priority_rank = PRIORITY_RANK[fields.priority] ?? PRIORITY_RANK.normal;
+  if (fields && 'due_at' in fields) fields.due_sort = fields.due_at || MAX_DUE;
+  next();
+});
+
 const Task = mongoose.model('Task', taskSchema);
 
 module.exports = Task;
\ No newline at end of file
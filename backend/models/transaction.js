@@ -8,7 +8,33 @@ const TransactionSchema = new mongoose.Schema({
   wh: { type: String, required: true },
   at: { type: Date, default: Date.now },    // thời điểm nhập xuất
   by: { type: String },                     // user thao tác
+  by_lc: { type: String },                  // khóa tìm kiếm của `by` (lowercase) cho ai_agent
   note: { type: String }
 }, { timestamps: true });
 
+TransactionSchema.pre("save", function (next) {
+  if (this.by != null) this.by_lc = this.by.normalize("NFC").trim().replace(/\s+/g, " ").toLowerCase();
+  next();
+});
+
+// Cộng transaction vào bucket giờ + ngày của movement_rollups (ai_agent đọc cho /movements và dự báo).
+// Cùng khóa {g, t, sku, wh} và đầu bucket theo UTC như ai_agent/app/rollups.py.
+TransactionSchema.post("save", async function (doc) {
+  const at = new Date(doc.at);
+  const hour = new Date(Date.UTC(at.getUTCFullYear(), at.getUTCMonth(), at.getUTCDate(), at.getUTCHours()));
+  const day = new Date(Date.UTC(at.getUTCFullYear(), at.getUTCMonth(), at.getUTCDate()));
+  const inbound = doc.type === "inbound" ? doc.qty : 0;
+  const outbound = doc.type === "outbound" ? doc.qty : 0;
+  await mongoose.connection.collection("movement_rollups").bulkWrite(
+    [["hour", hour], ["day", day]].map(([g, t]) => ({
+      updateOne: {
+        filter: { g, t, sku: doc.sku, wh: doc.wh },
+        update: { $inc: { inbound, outbound, net: inbound - outbound, count: 1 } },
+        upsert: true,
+      },
+    })),
+    { ordered: false }
+  );
+});
+
 module.exports = mongoose.model("Transaction", TransactionSchema);